@@ -0,0 +1,414 @@
+"""
+Deterministic stand-ins for the external services the app talks to, so
+benchmark runs measure this codebase and not Groq, Gmail or the network.
+"""
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import socketserver
+import http.server
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+ANSWER_WORDS = (
+    "MIET Arts and Science College offers undergraduate postgraduate and research programmes "
+    "with experienced faculty modern laboratories placement support and scholarships for "
+    "eligible students Would you like to apply for admission now"
+).split()
+
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _reply_tokens(prompt, answer_tokens):
+    """The fake answer to a prompt, one token per item: catalog JSON for the extractor, filler otherwise."""
+    if "data extractor" in prompt:
+        from utils.admission_catalog import DEFAULT_CATALOG
+        return [json.dumps(DEFAULT_CATALOG)]
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(answer_tokens)]
+
+
+class FakeChatGroq:
+    """
+    Mimics the parts of ChatGroq the app uses (invoke, ainvoke, astream).
+    Every reply takes `latency` seconds before the first token and then
+    streams `answer_tokens` tokens at `tokens_per_second`.
+    """
+
+    def __init__(self, latency=0.3, tokens_per_second=400.0, answer_tokens=120):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _reply(self, messages):
+        self.calls += 1
+        prompt = "\n".join(str(m.content) for m in messages)
+        self.prompt_tokens += _estimate_tokens(prompt)
+        return _reply_tokens(prompt, self.answer_tokens)
+
+    def _usage(self, messages, tokens):
+        prompt = sum(_estimate_tokens(str(m.content)) for m in messages)
+        return {"input_tokens": prompt, "output_tokens": len(tokens), "total_tokens": prompt + len(tokens)}
+
+    def _generation_seconds(self, tokens):
+        return self.latency + len(tokens) / self.tokens_per_second
+
+    def invoke(self, messages, **kwargs):
+        tokens = self._reply(messages)
+        time.sleep(self._generation_seconds(tokens))
+        self.completion_tokens += len(tokens)
+        return AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+
+    async def ainvoke(self, messages, **kwargs):
+        tokens = self._reply(messages)
+        await asyncio.sleep(self._generation_seconds(tokens))
+        self.completion_tokens += len(tokens)
+        return AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+
+    async def astream(self, messages, **kwargs):
+        tokens = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for token in tokens:
+            await asyncio.sleep(1 / self.tokens_per_second)
+            self.completion_tokens += 1
+            yield AIMessageChunk(content=token)
+
+
+class RecordedChatLLM(FakeChatGroq):
+    """
+    Stand-in for Groq when replaying recorded traffic: a query that was
+    answered by the LLM gets its recorded answer back after its recorded
+    LLM time (times `time_scale`), streamed with the recorded time to first
+    token. Repeated queries cycle through their recordings. Queries the
+    recording never sent to the LLM (e.g. a cache change stopped them being
+    served from cache) get the filler answer after the median LLM time.
+    """
+
+    def __init__(self, records, time_scale=1.0, answer_tokens=120):
+        super().__init__(answer_tokens=answer_tokens)
+        self.time_scale = time_scale
+        self.recorded = {}
+        llm_ms = []
+        for record in records:
+            if record.get("served_by") != "llm" or not record.get("answer"):
+                continue
+            stages = record.get("stages_ms") or {}
+            total_ms = stages.get("llm", 0.0)
+            ttft_ms = stages.get("llm_ttft", total_ms * 0.3)
+            self.recorded.setdefault(record["query"].strip(), []).append((record["answer"], total_ms, ttft_ms))
+            llm_ms.append(total_ms)
+        llm_ms.sort()
+        self.default_ms = llm_ms[len(llm_ms) // 2] if llm_ms else self.latency * 1000
+        self._next = {}
+        self.matched = 0
+        self.unmatched = 0
+
+    def _lookup(self, messages):
+        """(tokens, total seconds, seconds to first token) for the turn's query."""
+        self.calls += 1
+        prompt = "\n".join(str(m.content) for m in messages)
+        self.prompt_tokens += _estimate_tokens(prompt)
+        recordings = self.recorded.get(str(messages[-1].content).strip())
+        if recordings:
+            self.matched += 1
+            position = self._next.get(id(recordings), 0)
+            self._next[id(recordings)] = position + 1
+            answer, total_ms, ttft_ms = recordings[position % len(recordings)]
+            tokens = re.findall(r"\S+\s*", answer) or [answer]
+        else:
+            self.unmatched += 1
+            tokens = _reply_tokens(prompt, self.answer_tokens)
+            total_ms, ttft_ms = self.default_ms, self.default_ms * 0.3
+        return tokens, total_ms / 1000 * self.time_scale, min(ttft_ms, total_ms) / 1000 * self.time_scale
+
+    def invoke(self, messages, **kwargs):
+        tokens, seconds, _ = self._lookup(messages)
+        time.sleep(seconds)
+        self.completion_tokens += len(tokens)
+        return AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+
+    async def ainvoke(self, messages, **kwargs):
+        tokens, seconds, _ = self._lookup(messages)
+        await asyncio.sleep(seconds)
+        self.completion_tokens += len(tokens)
+        return AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+
+    async def astream(self, messages, **kwargs):
+        tokens, seconds, ttft = self._lookup(messages)
+        await asyncio.sleep(ttft)
+        gap = max(0.0, seconds - ttft) / len(tokens)
+        for token in tokens:
+            if gap:
+                await asyncio.sleep(gap)
+            self.completion_tokens += 1
+            yield AIMessageChunk(content=token)
+        yield AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens))
+
+
+class HashingEmbeddings:
+    """
+    Offline replacement for the sentence-transformer: a normalized hashed
+    bag-of-words vector. Used with --fake-embeddings when the real model
+    isn't available; retrieval quality is meaningless, timings are not.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self._reply("220 fake-smtp ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 fake-smtp")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                if server.latency:
+                    time.sleep(server.latency)
+                with server.lock:
+                    server.messages += 1
+                self._reply("250 OK queued")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal plaintext SMTP sink on localhost that counts delivered messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(("127.0.0.1", port), _SMTPHandler)
+        self.latency = latency
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        site = self.server
+        with site.lock:
+            site.requests += 1
+        if self.path in site.redirects:
+            self.send_response(302)
+            self.send_header("Location", site.redirects[self.path])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/robots.txt":
+            body, content_type = "User-agent: *\nDisallow: /private/\n", "text/plain"
+        else:
+            match = re.fullmatch(r"/page/(\d+)", self.path)
+            page = int(match.group(1)) if match else -1
+            if not 0 <= page < site.pages:
+                self.send_error(404)
+                return
+            links = " ".join(f'<a href="/page/{child}">Page {child}</a>'
+                             for child in range(page * site.fanout + 1, page * site.fanout + site.fanout + 1)
+                             if child < site.pages)
+            paragraph = " ".join(ANSWER_WORDS[(page + i) % len(ANSWER_WORDS)] for i in range(site.words_per_page))
+            body = (f"<html><head><title>Page {page}</title></head><body><h1>Page {page}</h1>"
+                    f"<p>{paragraph}</p>{links}<a href='/private/staff'>Staff</a></body></html>")
+            content_type = "text/html; charset=utf-8"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSite(http.server.ThreadingHTTPServer):
+    """
+    Generated website on localhost for crawl benchmarks: /page/0 links to
+    `fanout` children and so on, for `pages` pages in all. robots.txt
+    disallows /private/, which every page links to. `redirects` maps extra
+    paths to a Location they answer with a 302.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, pages=100, fanout=4, words_per_page=400, port=0, redirects=None):
+        super().__init__(("127.0.0.1", port), _SiteHandler)
+        self.pages = pages
+        self.fanout = fanout
+        self.words_per_page = words_per_page
+        self.redirects = dict(redirects or {})
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/page/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _LLMHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload, headers=()):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        with server.lock:
+            server.requests += 1
+            rate_limited = server.rate_limit_every and server.requests % server.rate_limit_every == 0
+            if rate_limited:
+                server.rate_limited += 1
+        if rate_limited:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens",
+                                            "code": "rate_limit_exceeded"}},
+                            headers=[("Retry-After", str(server.retry_after))])
+            return
+
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        tokens = _reply_tokens(prompt, server.answer_tokens)
+        usage = {"prompt_tokens": _estimate_tokens(prompt), "completion_tokens": len(tokens),
+                 "total_tokens": _estimate_tokens(prompt) + len(tokens)}
+        with server.lock:
+            server.calls += 1
+            server.prompt_tokens += usage["prompt_tokens"]
+            server.completion_tokens += len(tokens)
+        reply = {"id": f"chatcmpl-{server.calls}", "created": int(time.time()), "model": body.get("model", "fake")}
+        time.sleep(server.latency)
+
+        if not body.get("stream"):
+            time.sleep(len(tokens) / server.tokens_per_second)
+            self._send_json(200, {**reply, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            time.sleep(1 / server.tokens_per_second)
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            chunk = {**reply, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        final = {**reply, "object": "chat.completion.chunk", "x_groq": {"usage": usage},
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self._send_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self._send_chunk(b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeLLMServer(http.server.ThreadingHTTPServer):
+    """
+    OpenAI-compatible chat completions endpoint on localhost (streaming and
+    not), answering like FakeChatGroq. Point the app at it with
+    LLM_BASE_URL=server.url to exercise the real client, connection pool
+    and retry path. Every `rate_limit_every`-th request gets a 429 with
+    Retry-After, like Groq at peak.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.3, tokens_per_second=400.0, answer_tokens=120,
+                 rate_limit_every=0, retry_after=0.2, port=0):
+        super().__init__(("127.0.0.1", port), _LLMHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        # The Groq client adds /openai/v1/chat/completions
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,169 @@
+"""
+Recall / latency / size benchmark for the vector index specs.
+
+Builds each FAISS spec over the same vectors and compares it with exact
+search: recall@k, single-query p50/p95 latency, batch queries/second,
+build time and index bytes per vector. Compressed specs are measured the
+way the app searches them, re-ranking k * --refine candidates against the
+raw vectors.
+
+    cd backend
+    python -m benchmarks.index_bench --count 100000
+    python -m benchmarks.index_bench --index-dir database/faiss_index
+    python -m benchmarks.index_bench --specs "Flat;HNSW32,SQ8;IVF{nlist},PQ48" --nprobe 32
+
+Without --index-dir the vectors are synthetic: unit vectors drawn around
+random cluster centres, which is roughly how sentence embeddings of one
+college's documents are distributed. "auto" is the spec the app would
+pick for that many vectors; "{nlist}" expands to the app's list count.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils.vector_index import (  # noqa: E402
+    VECTORS_FILE, INDEX_REFINE, build_index, choose_spec, ivf_nlist, apply_search_params, is_compressed, search
+)
+
+DEFAULT_SPECS = "auto;Flat;SQ8;HNSW32;HNSW32,SQ8;IVF{nlist},SQ8;IVF{nlist},PQ48"
+
+
+def synthetic_vectors(count, dim, seed, spread=0.35):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(16, count // 500), dim)).astype("float32")
+    vectors = centres[rng.integers(0, len(centres), count)] + spread * rng.standard_normal((count, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def load_vectors(args):
+    """(base vectors, query vectors); queries are never part of the base set."""
+    if args.index_dir:
+        vectors = np.load(os.path.join(args.index_dir, VECTORS_FILE), mmap_mode="r")
+        rng = np.random.default_rng(args.seed)
+        picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+        # Perturbed copies of stored chunks stand in for real questions
+        queries = np.asarray(vectors[np.sort(picks)], dtype="float32")
+        queries += 0.05 * rng.standard_normal(queries.shape).astype("float32")
+        return np.ascontiguousarray(vectors, dtype="float32"), queries
+    data = synthetic_vectors(args.count + args.queries, args.dim, args.seed)
+    return data[:args.count], data[args.count:]
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if len(values) else 0.0
+
+
+def bench_spec(spec, base, queries, truth, k, args):
+    started = time.perf_counter()
+    index = build_index(base, spec)
+    build_s = time.perf_counter() - started
+    apply_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+    import faiss
+    index_bytes = faiss.serialize_index(index).nbytes
+
+    # The app searches one query at a time, re-ranking compressed results against the raw vectors
+    refine = args.refine if is_compressed(spec) else 1
+    latencies, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, positions = search(index, base, query, k, refine)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(positions)
+
+    started = time.perf_counter()
+    index.search(queries, k)
+    batch_s = time.perf_counter() - started
+
+    recall = np.mean([len(set(row[row >= 0]) & set(expected)) / k for row, expected in zip(found, truth)])
+    return {
+        "spec": spec,
+        "refine": refine,
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "batch_qps": round(len(queries) / batch_s, 1) if batch_s else 0.0,
+        "build_s": round(build_s, 2),
+        "bytes_per_vector": round(index_bytes / len(base), 1),
+        "index_mb": round(index_bytes / 1024 / 1024, 2)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recall/latency/size benchmark for vector index specs")
+    parser.add_argument("--count", type=int, default=50000, help="synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=500, help="queries to run")
+    parser.add_argument("-k", type=int, default=10, help="neighbours per query (recall@k)")
+    parser.add_argument("--specs", default=DEFAULT_SPECS, help="';'-separated FAISS index_factory specs")
+    parser.add_argument("--nprobe", type=int, default=int(os.getenv("INDEX_NPROBE", 16)))
+    parser.add_argument("--ef-search", type=int, default=int(os.getenv("INDEX_EF_SEARCH", 64)))
+    parser.add_argument("--refine", type=int, default=INDEX_REFINE,
+                        help="candidates per result re-ranked exactly for compressed specs (1 = off)")
+    parser.add_argument("--index-dir", help="use the vectors of a published index instead of synthetic ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here (default: benchmarks/results/index-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import faiss
+    args = parse_args(argv)
+    base, queries = load_vectors(args)
+    count, dim = base.shape
+    k = min(args.k, count)
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    specs = []
+    for spec in args.specs.split(";"):
+        spec = choose_spec(count, dim) if spec == "auto" else spec.replace("{nlist}", str(ivf_nlist(count)))
+        if spec not in specs:
+            specs.append(spec)
+
+    print(f"{count} vectors x {dim} dims, {len(queries)} queries, recall@{k} against exact search "
+          f"(auto = {choose_spec(count, dim)})\n")
+    print(f"{'spec':<22}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'qps':>10}{'build s':>9}{'B/vec':>9}{'MB':>9}")
+    results = []
+    for spec in specs:
+        try:
+            result = bench_spec(spec, base, queries, truth, k, args)
+        except Exception as e:
+            print(f"{spec:<22} failed: {e}")
+            continue
+        results.append(result)
+        print(f"{spec:<22}{result['recall_at_k']:>8.3f}{result['p50_ms']:>9.3f}{result['p95_ms']:>9.3f}"
+              f"{result['batch_qps']:>10.1f}{result['build_s']:>9.2f}{result['bytes_per_vector']:>9.1f}{result['index_mb']:>9.2f}")
+
+    output = os.path.abspath(args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", time.strftime("index-%Y%m%d-%H%M%S") + ".json"))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "vectors": count,
+            "dim": dim,
+            "queries": len(queries),
+            "k": k,
+            "nprobe": args.nprobe,
+            "ef_search": args.ef_search,
+            "refine": args.refine,
+            "source": args.index_dir or "synthetic",
+            "results": results
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Replay recorded /chat traffic against a local copy of the app.
+
+Record production traffic with TRAFFIC_RECORD=1 (see utils/traffic_recorder.py),
+then re-drive it offline:
+
+    cd backend
+    python -m benchmarks.replay traffic/chat.ndjson traffic/chat.ndjson.1.gz
+    python -m benchmarks.replay traffic/chat.ndjson --speed 10 --output benchmarks/results/replay-base.json
+    python -m benchmarks.replay traffic/chat.ndjson --speed 10 --baseline benchmarks/results/replay-base.json
+
+The app runs in-process in a throwaway working directory with a copy of the
+current index (or --pdf ingested from scratch). Groq is replaced by a stub
+that returns each recorded answer after its recorded LLM time, so
+retrieval, caching and prompt changes can be measured against real
+questions with no network. Requests keep their original spacing divided
+by --speed (0 = send as fast as --concurrency allows); turns of one
+session always run in order, so follow-ups see their history.
+
+The report compares recorded and replayed latency, throughput and stage
+times, how each turn was served (intent, cache or LLM) and how much the
+retrieved chunks changed.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+from benchmarks.run import BACKEND_DIR, percentile, peak_rss_mb, bench_upload, compare
+
+DEFAULT_INDEX = os.path.join(BACKEND_DIR, "database", "faiss_index")
+CHAT_ENDPOINTS = ("/chat", "/chat/stream")
+
+
+def summarize(durations_ms, seconds, records):
+    """Latency percentiles, throughput and per-stage / served-by breakdown for one side of the comparison."""
+    values = sorted(durations_ms)
+    stages = Counter()
+    for record in records:
+        stages.update(record.get("stages_ms") or {})
+    ttfts = sorted(r["ttft_ms"] for r in records if r.get("ttft_ms") is not None)
+    return {
+        "requests": len(values),
+        "errors": sum(1 for r in records if r.get("error")),
+        "wall_s": round(seconds, 3),
+        "rps": round(len(values) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+        "ttft_p50_ms": round(percentile(ttfts, 50), 2) if ttfts else None,
+        "ttft_p95_ms": round(percentile(ttfts, 95), 2) if ttfts else None,
+        "stage_avg_ms": {stage: round(ms / len(records), 2) for stage, ms in sorted(stages.items())} if records else {},
+        "served_by": dict(Counter(r.get("served_by", "unknown") for r in records)),
+        "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in records),
+        "completion_tokens": sum(r.get("completion_tokens") or 0 for r in records),
+    }
+
+
+def compare_turns(pairs, slowest=10):
+    """Turn-by-turn differences between each recorded record and its replay."""
+    transitions = Counter()
+    overlaps = []
+    answers_changed = 0
+    slowdowns = []
+    for recorded, replayed in pairs:
+        if replayed is None:
+            transitions[f"{recorded.get('served_by')}->missing"] += 1
+            continue
+        transitions[f"{recorded.get('served_by')}->{replayed.get('served_by')}"] += 1
+        before, after = set(recorded.get("chunk_ids") or []), set(replayed.get("chunk_ids") or [])
+        if before and after:
+            overlaps.append(len(before & after) / len(before | after))
+        answers_changed += (recorded.get("answer") or "") != (replayed.get("answer") or "")
+        slowdowns.append({
+            "query": recorded["query"][:120],
+            "recorded_ms": recorded.get("duration_ms", 0.0),
+            "replay_ms": replayed.get("duration_ms", 0.0),
+            "served_by": f"{recorded.get('served_by')}->{replayed.get('served_by')}",
+        })
+    slowdowns.sort(key=lambda t: t["replay_ms"] - t["recorded_ms"], reverse=True)
+    return {
+        "served_by_changes": dict(transitions.most_common()),
+        "chunk_overlap_avg": round(sum(overlaps) / len(overlaps), 3) if overlaps else None,
+        "turns_compared_for_chunks": len(overlaps),
+        "answers_changed": answers_changed,
+        "largest_slowdowns": slowdowns[:slowest],
+    }
+
+
+async def send(client, record, request_id):
+    """Replay one turn; returns (client latency ms, time to first token ms or None, ok)."""
+    body = {"query": record["query"], "session_id": record.get("session_id") or request_id}
+    headers = {"X-Request-ID": request_id}
+    started = time.perf_counter()
+    ttft_ms = None
+    try:
+        if record.get("endpoint") == "/chat/stream":
+            async with client.stream("POST", "/chat/stream", json=body, headers=headers) as response:
+                async for _ in response.aiter_bytes():
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                ok = response.status_code < 400
+        else:
+            response = await client.post("/chat", json=body, headers=headers)
+            ok = response.status_code < 400
+    except Exception as e:
+        print(f"Replay error for {request_id}: {e}")
+        ok = False
+    return (time.perf_counter() - started) * 1000, ttft_ms, ok
+
+
+async def drive(client, records, speed, concurrency):
+    """
+    Send every record at its recorded offset divided by speed, keeping each
+    session's turns in order. Returns per-record client results and wall time.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    sessions = {}
+    results = [None] * len(records)
+    first_ts = records[0].get("ts", 0)
+    started = time.perf_counter()
+
+    async def turn(index, record, previous):
+        if speed > 0:
+            delay = (record.get("ts", first_ts) - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if previous is not None:
+            await previous
+        async with limit:
+            results[index] = await send(client, record, f"replay-{index}")
+
+    tasks = []
+    for index, record in enumerate(records):
+        session = record.get("session_id")
+        task = asyncio.create_task(turn(index, record, sessions.get(session)))
+        if session:
+            sessions[session] = task
+        tasks.append(task)
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - started
+
+
+async def run_replay(args, records, record_path):
+    import httpx
+    import main as app_main
+    from benchmarks.fakes import RecordedChatLLM, HashingEmbeddings
+    from utils.embedding_service import embedding_service
+    from utils.llm_gateway import LLMGateway
+    from utils.traffic_recorder import read_records
+
+    stub = RecordedChatLLM(records, time_scale=args.llm_time_scale)
+    app_main.llm = LLMGateway(client_factory=lambda model: stub)
+    if args.fake_embeddings:
+        embedding_service._model = HashingEmbeddings()
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.app.router.lifespan_context(app_main.app):
+        if not await app_main.startup_state.wait_ready():
+            raise RuntimeError(f"App failed to start: {app_main.startup_state.to_dict()['errors']}")
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=300) as client:
+            if args.pdf:
+                await bench_upload(client, app_main, "upload", args.pdf)
+            if app_main.vector_store_holder.current.store is None:
+                raise RuntimeError("No index to replay against: pass --index or --pdf")
+            results, wall = await drive(client, records, args.speed, args.concurrency)
+        await asyncio.to_thread(app_main.admission_catalog.wait_idle, 60)
+    # Leaving the lifespan flushed the recorder
+    replayed = {r["request_id"]: r for r in read_records([record_path])
+                if str(r.get("request_id", "")).startswith("replay-")}
+    llm = {"llm_calls": stub.calls, "matched": stub.matched, "unmatched": stub.unmatched,
+           "prompt_tokens": stub.prompt_tokens, "completion_tokens": stub.completion_tokens,
+           "gateway": app_main.llm.stats()}
+    return results, wall, replayed, llm
+
+
+def print_summary(name, summary):
+    ttft = f" ttft_p50={summary['ttft_p50_ms']:.1f}ms" if summary.get("ttft_p50_ms") is not None else ""
+    print(f"{name:<10} n={summary['requests']:<6} p50={summary['p50_ms']:>9.1f}ms p95={summary['p95_ms']:>9.1f}ms "
+          f"p99={summary['p99_ms']:>9.1f}ms rps={summary['rps']:>8.2f} errors={summary['errors']}{ttft}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded /chat traffic against a local app")
+    parser.add_argument("recordings", nargs="+", help="recorded traffic files (.ndjson or rotated .ndjson.N.gz)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="divide recorded gaps between requests by this; 0 = no waiting")
+    parser.add_argument("--concurrency", type=int, default=64, help="most replayed requests in flight")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N recorded turns")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="index directory to copy (default: database/faiss_index)")
+    parser.add_argument("--pdf", help="ingest this document instead of copying an index")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a hashing embedder instead of the model")
+    parser.add_argument("--llm-time-scale", type=float, default=1.0,
+                        help="multiply recorded LLM times by this (0 = instant answers)")
+    parser.add_argument("--output", help="write the report JSON here (default: benchmarks/results/replay-<timestamp>.json)")
+    parser.add_argument("--baseline", help="replay report to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="exit non-zero if replay p95 grows by more than this %% over the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", "replay-" + time.strftime("%Y%m%d-%H%M%S") + ".json"))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    recordings = [os.path.abspath(p) for p in args.recordings]
+    if args.pdf:
+        args.pdf = os.path.abspath(args.pdf)
+
+    # The app reads its settings at import, so the environment is set up before any utils import
+    workdir = tempfile.mkdtemp(prefix="helpdesk-replay-")
+    record_path = os.path.join(workdir, "replay.ndjson")
+    os.environ.update({
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY") or "replay-key",
+        "EMAIL_USER": "",
+        "SESSION_BACKEND": "memory",
+        "INDEX_WATCH_INTERVAL": "3600",
+        "TRACE_LOG": "0",
+        # The replayed app records itself; its records are the "replay" side of the report
+        "TRAFFIC_RECORD": "1",
+        "TRAFFIC_RECORD_PATH": record_path,
+        "TRAFFIC_RECORD_MAX_MB": "100000",
+    })
+    cwd = os.getcwd()
+    try:
+        from utils.traffic_recorder import read_records
+        records = [r for r in read_records(recordings) if r.get("endpoint") in CHAT_ENDPOINTS and r.get("query")]
+        if args.limit:
+            records = records[:args.limit]
+        if not records:
+            print("No recorded chat turns to replay")
+            return 1
+        print(f"Replaying {len(records)} turns from {len(recordings)} file(s) at speed {args.speed or 'max'}")
+        if not args.pdf and os.path.isdir(args.index):
+            shutil.copytree(args.index, os.path.join(workdir, "database", "faiss_index"))
+        os.chdir(workdir)
+        results, wall, replayed, llm = asyncio.run(run_replay(args, records, record_path))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    pairs = [(record, replayed.get(f"replay-{i}")) for i, record in enumerate(records)]
+    span = records[-1].get("ts", 0) - records[0].get("ts", 0)
+    recorded_summary = summarize([r.get("duration_ms", 0.0) for r in records], span, records)
+    replay_records = [r for _, r in pairs if r is not None]
+    # Server-side durations from the replay's own recording, like the recorded side
+    replay_summary = summarize([r.get("duration_ms", 0.0) for r in replay_records], wall, replay_records)
+    replay_summary["errors"] += sum(1 for result in results if result is not None and not result[2])
+    client_ms = sorted(result[0] for result in results if result is not None)
+    replay_summary["client_p95_ms"] = round(percentile(client_ms, 95), 2)
+    replay_summary["peak_rss_mb"] = peak_rss_mb()
+
+    print()
+    print_summary("recorded", recorded_summary)
+    print_summary("replay", replay_summary)
+    turns = compare_turns(pairs)
+    print(f"served by: {recorded_summary['served_by']} -> {replay_summary['served_by']}")
+    if turns["chunk_overlap_avg"] is not None:
+        print(f"retrieved chunk overlap (Jaccard): {turns['chunk_overlap_avg']} over {turns['turns_compared_for_chunks']} turns")
+    print(f"LLM stub: {llm['matched']} recorded answers, {llm['unmatched']} unmatched prompts")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "recordings": recordings,
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("recordings", "output", "baseline")},
+        "turns": len(records),
+        "recorded_span_s": round(span, 3),
+        "scenarios": {"recorded": recorded_summary, "replay": replay_summary},
+        "comparison": turns,
+        "llm_stub": llm,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {output}")
+
+    if baseline is not None:
+        regressions = [name for name in compare(report["scenarios"], baseline, args.max_regression) if name == "replay"]
+        if regressions:
+            print(f"Replay p95 regressed by more than {args.max_regression}% over the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,434 @@
+"""
+In-process benchmark for the helpdesk API.
+
+Drives backend/main.py through httpx's ASGI transport with a fake ChatGroq
+and a local fake SMTP server, in a throwaway working directory, and
+reports p50/p95/p99 latency, requests/second, peak RSS and the
+retrieval/embedding time spent in each scenario.
+
+    cd backend
+    python -m benchmarks.run --fake-embeddings --output benchmarks/results/base.json
+    python -m benchmarks.run --fake-embeddings --baseline benchmarks/results/base.json
+
+--fake-embeddings swaps the sentence-transformer for a hashing embedder
+so runs work offline; leave it off to include real embedding cost.
+--llm-server replaces the in-process fake LLM with a local OpenAI-compatible
+HTTP server, so the real Groq client, connection pool and the gateway's
+retries (--llm-429-every) are part of the measurement.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import platform
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PDF = os.path.join(BACKEND_DIR, "knowledge_base", "MIET.pdf")
+
+CHAT_QUERIES = [
+    "What undergraduate courses does MIET offer?",
+    "What is the fee structure for B.Com?",
+    "Is there hostel facility for students?",
+    "What are the eligibility criteria for M.Sc Computer Science?",
+    "How do I apply for admission?",
+    "Does the college provide placement support?",
+    "What scholarships are available?",
+    "Where is the college located?",
+    "What research programs are offered?",
+    "Which departments are there in the college?",
+]
+
+ADMISSION = {
+    "fullName": "Bench Student",
+    "phone": "9876543210",
+    "category": "Undergraduate (UG)",
+    "course": "B.Sc Computer Science",
+    "address": "Trichy",
+    "marks": "88",
+    "prevCollege": "Bench Higher Secondary School",
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Scenario:
+    """Latency samples and counters for one named scenario."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies_ms = []
+        self.errors = 0
+        self.wall_seconds = 0.0
+        self.extra = {}
+
+    async def timed(self, coro):
+        started = time.perf_counter()
+        try:
+            response = await coro
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors += 1
+        return response
+
+    def summary(self):
+        values = sorted(self.latencies_ms)
+        result = {
+            "requests": len(values),
+            "errors": self.errors,
+            "wall_s": round(self.wall_seconds, 3),
+            "rps": round(len(values) / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        result.update(self.extra)
+        return result
+
+
+class StageClock:
+    """Retrieval and embedding time spent between start() and stop(), from the app's own counters."""
+
+    def __init__(self, retrieval_stats, embedding_service):
+        self.retrieval_stats = retrieval_stats
+        self.embedding_service = embedding_service
+
+    def _read(self):
+        return (dict(self.retrieval_stats.totals_ms), self.retrieval_stats.queries,
+                self.embedding_service.total_batch_ms, self.embedding_service.batches,
+                self.embedding_service.cache_hits, self.embedding_service.cache_misses)
+
+    def start(self):
+        self._before = self._read()
+
+    def stop(self):
+        totals, queries, embed_ms, batches, hits, misses = self._read()
+        before_totals, before_queries, before_embed_ms, before_batches, before_hits, before_misses = self._before
+        retrieval_queries = queries - before_queries
+        retrieval = {
+            stage: round((ms - before_totals.get(stage, 0.0)) / retrieval_queries, 3)
+            for stage, ms in totals.items()
+        } if retrieval_queries else {}
+        embed_batches = batches - before_batches
+        return {
+            "retrieval_avg_ms": retrieval,
+            "embedding": {
+                "batches": embed_batches,
+                "total_ms": round(embed_ms - before_embed_ms, 2),
+                "avg_batch_ms": round((embed_ms - before_embed_ms) / embed_batches, 3) if embed_batches else 0.0,
+                "cache_hits": hits - before_hits,
+                "cache_misses": misses - before_misses,
+            },
+        }
+
+
+async def wait_for_job(client, job_id, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = (await client.get(f"/ingestion/jobs/{job_id}")).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Ingestion job {job_id} did not finish")
+
+
+async def bench_upload(client, app_main, name, pdf_path):
+    scenario = Scenario(name)
+    started = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        response = await scenario.timed(client.post(
+            "/uploadknowledgebase", files={"file": (os.path.basename(pdf_path), f, "application/pdf")}))
+    job = await wait_for_job(client, response.json()["job_id"])
+    # Wait for the rebuilt index to be active, which is what users actually wait for
+    while app_main.vector_store_holder.loading or app_main.vector_store_holder.store is None:
+        await asyncio.sleep(0.05)
+    scenario.wall_seconds = time.perf_counter() - started
+    scenario.latencies_ms = [scenario.wall_seconds * 1000]
+    scenario.errors += job["status"] != "completed"
+    scenario.extra = {"job": job.get("result"), "index": app_main.vector_store_holder.stats()}
+    return scenario
+
+
+async def bench_crawl(client, app_main, site_url, max_pages):
+    scenario = Scenario("crawl")
+    started = time.perf_counter()
+    response = await scenario.timed(client.post(
+        "/trainurl", json={"url": site_url, "max_pages": max_pages, "max_depth": 5}))
+    job = await wait_for_job(client, response.json()["job_id"])
+    scenario.wall_seconds = time.perf_counter() - started
+    scenario.latencies_ms = [scenario.wall_seconds * 1000]
+    scenario.errors += job["status"] != "completed"
+    result = job.get("result") or {}
+    scenario.extra = {"job": result, "pages_per_sec": round(
+        result.get("crawl", {}).get("pages_fetched", 0) / scenario.wall_seconds, 1)}
+    return scenario
+
+
+async def bench_chat(client, name, queries, sessions, new_session_per_query=False):
+    """
+    Every session sends every query in order; sessions run concurrently.
+    Answers are only cached for a session's first turn, so the cold/warm
+    single-user runs start a new session for each query.
+    """
+    scenario = Scenario(name)
+
+    async def session(index):
+        for turn, query in enumerate(queries):
+            session_id = f"bench-{name}-{index}" + (f"-{turn}" if new_session_per_query else "")
+            await scenario.timed(client.post("/chat", json={"query": query, "session_id": session_id}))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    scenario.wall_seconds = time.perf_counter() - started
+    return scenario
+
+
+async def bench_admission_options(client, requests, concurrency):
+    scenario = Scenario("admission_options")
+    etag = None
+
+    async def worker(count):
+        nonlocal etag
+        for _ in range(count):
+            headers = {"If-None-Match": etag} if etag else {}
+            response = await scenario.timed(client.get("/admission-options", headers=headers))
+            etag = response.headers.get("etag") if response is not None else etag
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    scenario.wall_seconds = time.perf_counter() - started
+    return scenario
+
+
+async def bench_submit_admission(client, app_main, smtp, requests, concurrency):
+    scenario = Scenario("submit_admission")
+    delivered_before = smtp.messages
+
+    async def worker(worker_id, count):
+        for i in range(count):
+            data = dict(ADMISSION, email=f"bench{worker_id}-{i}@example.com")
+            await scenario.timed(client.post("/submit-admission", json=data))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w, requests // concurrency) for w in range(concurrency)))
+    scenario.wall_seconds = time.perf_counter() - started
+
+    # Confirmation emails go out from the outbox in the background; time the drain separately
+    expected = len(scenario.latencies_ms) - scenario.errors
+    drain_started = time.perf_counter()
+    while smtp.messages - delivered_before < expected and time.perf_counter() - drain_started < 60:
+        await asyncio.sleep(0.05)
+    scenario.extra = {
+        "emails_delivered": smtp.messages - delivered_before,
+        "email_drain_s": round(time.perf_counter() - drain_started, 3),
+        "outbox": app_main.email_outbox.stats(),
+    }
+    return scenario
+
+
+async def run_benchmarks(args, smtp, site, llm_server=None):
+    import httpx
+    import main as app_main
+    from benchmarks.fakes import FakeChatGroq, HashingEmbeddings
+    from utils.answer_cache import answer_cache
+    from utils.embedding_service import embedding_service
+    from utils.hybrid_retriever import retrieval_stats
+    from utils.llm_gateway import LLMGateway
+
+    if llm_server is not None:
+        # get_llm() builds the real gateway and clients against LLM_BASE_URL
+        fake_llm = llm_server
+    else:
+        fake_llm = FakeChatGroq(latency=args.llm_latency, tokens_per_second=args.token_rate,
+                                answer_tokens=args.answer_tokens)
+        app_main.llm = LLMGateway(client_factory=lambda model: fake_llm)
+    if args.fake_embeddings:
+        embedding_service._model = HashingEmbeddings()
+
+    def clear_caches():
+        answer_cache.invalidate()
+        with embedding_service._cache_lock:
+            embedding_service._cache.clear()
+
+    clock = StageClock(retrieval_stats, embedding_service)
+    results = {}
+
+    async def record(coro):
+        clock.start()
+        scenario = await coro
+        summary = scenario.summary()
+        summary.update(clock.stop())
+        results[scenario.name] = summary
+        print(f"{scenario.name:<24} n={summary['requests']:<5} p50={summary['p50_ms']:>9.1f}ms "
+              f"p95={summary['p95_ms']:>9.1f}ms p99={summary['p99_ms']:>9.1f}ms rps={summary['rps']:>8.1f} "
+              f"errors={summary['errors']} rss={summary['peak_rss_mb'] or '-'}MB")
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.app.router.lifespan_context(app_main.app):
+        ready = await app_main.startup_state.wait_ready()
+        startup = app_main.startup_state.to_dict()
+        if not ready:
+            raise RuntimeError(f"App failed to start: {startup['errors']}")
+        print(f"{'startup':<24} import={startup['import_s'] * 1000:.0f}ms ready={startup['time_to_ready_s'] * 1000:.0f}ms")
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            await record(bench_upload(client, app_main, "upload_cold", args.pdf))
+            # Same file again: every chunk is reused from the index
+            await record(bench_upload(client, app_main, "upload_warm", args.pdf))
+            # Distinct questions against empty caches, then the same questions answered from the caches
+            clear_caches()
+            await record(bench_chat(client, "chat_cold_single", CHAT_QUERIES, 1, new_session_per_query=True))
+            await record(bench_chat(client, "chat_warm_single", CHAT_QUERIES, 1, new_session_per_query=True))
+            clear_caches()
+            await record(bench_chat(client, "chat_concurrent", CHAT_QUERIES[:args.chat_turns], args.sessions))
+            await record(bench_crawl(client, app_main, site.url, args.crawl_pages))
+            await record(bench_admission_options(client, args.requests, args.concurrency))
+            await record(bench_submit_admission(client, app_main, smtp, args.requests, args.concurrency))
+        # The crawl queued a catalog refresh; let it write into the work directory before it goes away
+        await asyncio.to_thread(app_main.admission_catalog.wait_idle, 60)
+
+    llm = {"llm_calls": fake_llm.calls, "llm_prompt_tokens": fake_llm.prompt_tokens,
+           "llm_completion_tokens": fake_llm.completion_tokens, "gateway": app_main.llm.stats()}
+    if llm_server is not None:
+        llm["rate_limited"] = llm_server.rate_limited
+    return results, startup, llm
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline run; returns the scenarios whose p95 regressed past threshold %."""
+    regressions = []
+    print(f"\n{'scenario':<24}{'metric':<8}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "rps"):
+            before, after = previous.get(metric, 0), current.get(metric, 0)
+            change = ((after - before) / before * 100) if before else 0.0
+            print(f"{name:<24}{metric:<8}{before:>12.1f}{after:>12.1f}{change:>9.1f}%")
+            if metric == "p95_ms" and change > threshold:
+                regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="In-process benchmark for the helpdesk API")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="document to ingest (default: knowledge_base/MIET.pdf)")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a hashing embedder instead of the model")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="fake LLM tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="fake LLM answer length")
+    parser.add_argument("--llm-server", action="store_true",
+                        help="serve the fake LLM over HTTP (OpenAI-compatible) and use the real client")
+    parser.add_argument("--llm-429-every", type=int, default=0,
+                        help="with --llm-server, answer every Nth request with 429 + Retry-After")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="fake SMTP delay per message (s)")
+    parser.add_argument("--crawl-pages", type=int, default=100, help="pages in the generated site to crawl")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent chat sessions")
+    parser.add_argument("--chat-turns", type=int, default=3, help="queries per concurrent session")
+    parser.add_argument("--requests", type=int, default=200, help="requests for the admission scenarios")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrency for the admission scenarios")
+    parser.add_argument("--output", help="write results JSON here (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="exit non-zero if any p95 grows by more than this %% over the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.pdf = os.path.abspath(args.pdf)
+    output = os.path.abspath(args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json"))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    from benchmarks.fakes import FakeSMTPServer, FakeSite, FakeLLMServer
+    smtp = FakeSMTPServer(latency=args.smtp_latency).start()
+    site = FakeSite(pages=args.crawl_pages).start()
+    llm_server = None
+    if args.llm_server:
+        llm_server = FakeLLMServer(latency=args.llm_latency, tokens_per_second=args.token_rate,
+                                   answer_tokens=args.answer_tokens, rate_limit_every=args.llm_429_every).start()
+        os.environ["LLM_BASE_URL"] = llm_server.url
+
+    # The app keeps its index, uploads and databases under the working directory
+    workdir = tempfile.mkdtemp(prefix="helpdesk-bench-")
+    os.environ.update({
+        "GROQ_API_KEY": "bench-key",
+        "EMAIL_USER": "admissions@bench.local",
+        "EMAIL_PASS": "",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp.port),
+        "SMTP_STARTTLS": "0",
+        "OUTBOX_POLL_INTERVAL": "0.2",
+        "SESSION_BACKEND": "memory",
+        "INDEX_WATCH_INTERVAL": "3600",
+    })
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+        results, startup, llm = asyncio.run(run_benchmarks(args, smtp, site, llm_server))
+        total_seconds = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+        smtp.stop()
+        site.stop()
+        if llm_server is not None:
+            llm_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "total_s": round(total_seconds, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "startup": startup,
+        "fake_llm": llm,
+        "scenarios": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"p95 regressed by more than {args.max_regression}% in: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,49 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from utils.knowledge_processor import process_file, process_url, FAISS_INDEX_PATH
-from utils.email_sender import send_confirmation_email
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
-from langchain_core.messages import SystemMessage, HumanMessage
+import threading
 from dotenv import load_dotenv
-import json
-import time
-import sqlite3
-from datetime import datetime
 
-# Load environment variables explicitly from .env file
+# Load environment variables explicitly from .env file (before utils read their settings)
 env_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path=env_path)
 
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
+from pydantic import BaseModel
+from utils.knowledge_processor import process_file, process_url, load_index_readonly, index_stamp, FAISS_INDEX_PATH, index_lock
+from utils.document_stream import shutdown_parse_pool
+from utils.web_crawler import CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH, CRAWL_PAGE_LIMIT, CRAWL_DEPTH_LIMIT
+from utils.ingestion_jobs import ingestion_jobs
+from utils.email_sender import build_confirmation_email, email_configured
+from utils.email_outbox import email_outbox
+from utils.scheduler import llm_scheduler, run_cpu, run_io, cpu_executor, SchedulerOverloaded
+from utils.answer_cache import answer_cache, normalize_query
+from utils.single_flight import SingleFlight
+from utils.intent_router import intent_router
+from utils.llm_gateway import LLMGateway, LLMUnavailable
+from utils.embedding_service import embedding_service
+from utils.vector_store_holder import VectorStoreHolder
+from utils.session_store import create_session_store
+from utils.prompt_builder import build_system_prompt
+from utils.hybrid_retriever import HybridRetriever, retrieval_stats
+from utils.admission_catalog import admission_catalog
+from utils.admissions_db import admissions_db, ADMISSIONS_PAGE_SIZE
+from utils.admission_import import admission_importer, import_format, IMPORT_FORMATS
+from utils.metrics import registry, monitor_event_loop
+from utils.tracing import TraceMiddleware, timed, observe_stage, annotate, record_llm_usage
+from utils.profiler import profiler
+from utils.traffic_recorder import traffic_recorder
+from utils.startup import StartupState
+import json
+import asyncio
+from datetime import datetime
+
 # Verify API Key
 API_KEY = os.getenv("GROQ_API_KEY")
 if not API_KEY:
@@ -26,7 +51,65 @@ if not API_KEY:
 else:
     print(f"SUCCESS: GROQ_API_KEY loaded")
 
-app = FastAPI(title="MIET Student Helpdesk Chatbot API")
+startup_state = StartupState(IMPORT_STARTED)
+# Optional query run once everything is loaded, so the first student doesn't pay for cold caches
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "What courses are offered?")
+
+def init_databases():
+    admissions_db.init_db()
+    email_outbox.init_db()
+
+async def warm_up():
+    """Embed and retrieve one query so model weights, FAISS pages and the keyword index are hot."""
+    query_embedding = await embedding_service.aembed_query(WARMUP_QUERY)
+    snapshot = vector_store_holder.current
+    if snapshot.retriever is not None:
+        await snapshot.retriever.retrieve(WARMUP_QUERY, query_embedding)
+
+async def start_up():
+    """
+    Load the embedding model, the index and the LLM client in parallel,
+    then run the warm-up query and flip /ready. Runs in the background so
+    /live answers immediately; failed required stages are retried until
+    the worker is ready.
+    """
+    stages = [
+        startup_state.run("embedding_model", lambda: run_cpu(lambda: embedding_service.model)),
+        startup_state.run("llm_client", lambda: run_io(get_llm), required=False),
+    ]
+    if os.path.exists(FAISS_INDEX_PATH):
+        stages.append(startup_state.run("index", lambda: run_cpu(reload_index)))
+    await asyncio.gather(*stages)
+    await startup_state.run("intent_centroids",
+                            lambda: run_cpu(intent_router.prepare, embedding_service.embed_documents), required=False)
+    if WARMUP_QUERY:
+        await startup_state.run("warmup", warm_up, required=False)
+    if not startup_state.mark_ready():
+        await startup_state.retry_failed()
+
+@asynccontextmanager
+async def lifespan(app):
+    # The databases are quick to open and every write path needs them, so they are ready before serving
+    await startup_state.run("database", lambda: run_io(init_databases))
+    loader = asyncio.create_task(start_up())
+    watcher = asyncio.create_task(watch_index())
+    email_sender_task = asyncio.create_task(email_outbox.run())
+    loop_monitor = asyncio.create_task(monitor_event_loop())
+    session_cleaner = asyncio.create_task(clean_sessions_periodically())
+    if os.getenv("PROFILER_ON_START", "0") == "1":
+        profiler.start()
+    traffic_recorder.start()
+    yield
+    loader.cancel()
+    watcher.cancel()
+    email_sender_task.cancel()
+    loop_monitor.cancel()
+    session_cleaner.cancel()
+    profiler.stop()
+    traffic_recorder.stop()
+    shutdown_parse_pool()
+
+app = FastAPI(title="MIET Student Helpdesk Chatbot API", lifespan=lifespan)
 
 # Enable CORS for frontend integration
 app.add_middleware(
@@ -35,7 +118,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# Request ids, per-route latency and one structured trace line per request
+app.add_middleware(TraceMiddleware)
+
+@app.exception_handler(SchedulerOverloaded)
+async def scheduler_overloaded_handler(request, exc):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # Ensure required directories exist
 UPLOAD_DIR = "knowledge_base"
@@ -44,75 +138,129 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(DB_DIR, exist_ok=True)
 
 # Global variables for models and vector store
-embeddings = None
-vector_store = None
 llm = None
+llm_lock = threading.Lock()
 
 def get_llm():
+    """
+    The LLM gateway (utils/llm_gateway.py): pacing, retries, circuit
+    breaker and fallback model around the Groq clients. Used for chat and
+    the admission catalog extraction.
+    """
     global llm
     if llm is None and API_KEY:
+        with llm_lock:
+            if llm is None:
+                try:
+                    llm = LLMGateway(api_key=API_KEY)
+                except Exception as e:
+                    print(f"Error initializing LLM: {e}")
+    return llm
+
+def load_vector_store():
+    """Open the published index read-only (mmapped); returns None if there isn't one."""
+    try:
+        return load_index_readonly()
+    except Exception as e:
+        print(f"Error loading vector store: {e}")
+        raise
+
+vector_store_holder = VectorStoreHolder(load_vector_store, stamp=index_stamp, build_retriever=HybridRetriever)
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", 5))
+
+async def watch_index():
+    """Pick up indexes published by other worker processes."""
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL)
         try:
-            llm = ChatGroq(
-                model_name="openai/gpt-oss-120b", 
-                temperature=0.3, 
-                api_key=API_KEY, 
-                request_timeout=30
-            )
+            if await run_cpu(vector_store_holder.reload_if_changed):
+                startup_state.recover("index")
+                answer_cache.invalidate()
+                refresh_derived_data()
         except Exception as e:
-            print(f"Error initializing LLM: {e}")
-    return llm
+            print(f"Index watch error: {e}")
+
+def refresh_derived_data():
+    """Rebuild data derived from the active index version (in the background)."""
+    snapshot = vector_store_holder.current
+    admission_catalog.refresh_in_background(snapshot.store, snapshot.stamp, get_llm())
+
+def reload_index():
+    with timed("index_load"):
+        vector_store_holder.reload()
+    startup_state.recover("index")
+    refresh_derived_data()
 
 def get_vector_store():
-    global vector_store, embeddings
-    if vector_store is None:
-        if os.path.exists(FAISS_INDEX_PATH):
+    """The active vector store (None until the first index has been loaded)."""
+    return vector_store_holder.store
+
+def activate_ingested_index(stats):
+    """
+    Runs on the ingestion worker after an index sync. The rebuilt index is
+    loaded there and swapped in with one assignment, so chat keeps using the
+    previous index until the new one is ready.
+    """
+    if stats["added"] or stats["removed"]:
+        reload_index()
+        answer_cache.invalidate()
+
+def clear_upload_dir(keep=None):
+    """Delete uploaded files, optionally keeping one path."""
+    if os.path.exists(UPLOAD_DIR):
+        for filename in os.listdir(UPLOAD_DIR):
+            path = os.path.join(UPLOAD_DIR, filename)
+            if keep and os.path.abspath(path) == os.path.abspath(keep):
+                continue
             try:
-                if embeddings is None:
-                    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-                vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+                if os.path.isfile(path) or os.path.islink(path):
+                    os.unlink(path)
+                elif os.path.isdir(path):
+                    shutil.rmtree(path)
             except Exception as e:
-                print(f"Error loading vector store: {e}")
-    return vector_store
+                print(f'Failed to delete {path}. Reason: {e}')
+
+# Upload handlers swap the files in knowledge_base/ one at a time, and the
+# replacement syncs they queue run one at a time on the ingestion workers
+upload_lock = asyncio.Lock()
+replace_lock = threading.Lock()
 
 class ChatRequest(BaseModel):
     query: str
     session_id: str = "default_session"
 
-@app.post("/uploadknowledgebase")
+@app.post("/uploadknowledgebase", status_code=202)
 async def upload_knowledge_base(file: UploadFile = File(...)):
-    global vector_store
     allowed_extensions = {".pdf", ".txt", ".docx"}
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail=f"Unsupported file type. Allowed: {allowed_extensions}")
     
     try:
-        # 1. Clear the old files in the knowledge base directory
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                path = os.path.join(UPLOAD_DIR, filename)
-                try:
-                    if os.path.isfile(path) or os.path.islink(path):
-                        os.unlink(path)
-                    elif os.path.isdir(path):
-                        shutil.rmtree(path)
-                except Exception as e:
-                    print(f'Failed to delete {path}. Reason: {e}')
-
-        # 2. Reset the in-memory vector store
-        vector_store = None
-        
-        # 3. Save the new file
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 4. Process the file and update vector store (clear_existing=True to overwrite FAISS index)
-        num_chunks = process_file(file_path, clear_existing=True)
+        file_path = os.path.join(UPLOAD_DIR, os.path.basename(file.filename))
+        async with upload_lock:
+            # 1. This upload replaces the knowledge base, so earlier uploads still queued or
+            #    running are superseded: cancel them, then swap the files before saving
+            ingestion_jobs.cancel_active(kind="file")
+            await run_io(clear_upload_dir)
+            with open(file_path, "wb") as buffer:
+                await run_io(shutil.copyfileobj, file.file, buffer)
+
+            # 2. Replace the knowledge base in the background (clear_existing=True drops every
+            #    other source; chunks already in the index are reused instead of re-embedded).
+            #    Replacements run one at a time so the last upload is what ends up indexed.
+            def work(job):
+                with replace_lock:
+                    # A newer upload may have superseded this one while it waited
+                    job.raise_if_cancelled()
+                    return process_file(file_path, clear_existing=True, progress=job.report)
+
+            job = ingestion_jobs.submit("file", file.filename, work, on_complete=activate_ingested_index)
         
         return {
-            "message": f"Successfully replaced Knowledge Base with {file.filename}. Found {num_chunks} data points.",
-            "status": "synchronized"
+            "message": f"Processing {file.filename}. The Knowledge Base will switch over once it is indexed.",
+            "status": "queued",
+            "job_id": job.id
         }
     except Exception as e:
         print(f"Upload error: {e}")
@@ -120,45 +268,67 @@ async def upload_knowledge_base(file: UploadFile = File(...)):
 
 class UrlRequest(BaseModel):
     url: str
+    # Crawl limits; default to CRAWL_MAX_PAGES / CRAWL_MAX_DEPTH
+    max_pages: Optional[int] = None
+    max_depth: Optional[int] = None
 
-@app.post("/trainurl")
+@app.post("/trainurl", status_code=202)
 async def train_url(request: UrlRequest):
     url = request.url.strip()
     if not url.startswith("http"):
         raise HTTPException(status_code=400, detail="Invalid URL format.")
     
-    try:
-        num_chunks = process_url(url)
-        return {
-            "message": f"Successfully crawled and embedded {num_chunks} data points from {url} into the AI Knowledge Base.",
-            "status": "synchronized"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    max_pages = min(max(request.max_pages or CRAWL_MAX_PAGES, 1), CRAWL_PAGE_LIMIT)
+    max_depth = min(max(request.max_depth if request.max_depth is not None else CRAWL_MAX_DEPTH, 0), CRAWL_DEPTH_LIMIT)
+
+    def work(job):
+        return process_url(url, progress=job.report, max_pages=max_pages, max_depth=max_depth)
+
+    job = ingestion_jobs.submit("url", url, work, on_complete=activate_ingested_index)
+    return {
+        "message": f"Crawling up to {max_pages} pages from {url}. The Knowledge Base will be updated once it is indexed.",
+        "status": "queued",
+        "job_id": job.id
+    }
+
+@app.get("/ingestion/jobs")
+async def list_ingestion_jobs():
+    return ingestion_jobs.list()
+
+@app.get("/ingestion/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/ingestion/jobs/{job_id}/cancel")
+async def cancel_ingestion_job(job_id: str):
+    job = ingestion_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+def wipe_knowledge_base():
+    # 1. Clear files in knowledge_base directory
+    clear_upload_dir()
+
+    # 2. Delete FAISS index from disk (waits for any index write in progress)
+    with index_lock:
+        if os.path.exists(FAISS_INDEX_PATH):
+            shutil.rmtree(FAISS_INDEX_PATH)
 
 @app.post("/resetknowledgebase")
 async def reset_knowledge_base():
-    global vector_store
     try:
-        # 1. Clear files in knowledge_base directory
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                path = os.path.join(UPLOAD_DIR, filename)
-                try:
-                    if os.path.isfile(path) or os.path.islink(path):
-                        os.unlink(path)
-                    elif os.path.isdir(path):
-                        shutil.rmtree(path)
-                except Exception as e:
-                    print(f'Failed to delete {path}. Reason: {e}')
-        
-        # 2. Delete FAISS index from disk
-        from utils.knowledge_processor import FAISS_INDEX_PATH
-        if os.path.exists(FAISS_INDEX_PATH):
-            shutil.rmtree(FAISS_INDEX_PATH)
+        # Waits for cancelled jobs to stop, so none can write an index after the wipe
+        await run_io(ingestion_jobs.cancel_all)
+        await run_io(wipe_knowledge_base)
             
         # 3. Reset in-memory store
-        vector_store = None
+        vector_store_holder.clear()
+        answer_cache.invalidate()
+        refresh_derived_data()
         
         return {"message": "Knowledge base has been manually reset. All documents and embeddings cleared.", "status": "reset"}
     except Exception as e:
@@ -166,320 +336,640 @@ async def reset_knowledge_base():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Simple in-memory memory store
-# In production, use session IDs and a persistent database like Redis
-# Structure: { session_id: {"history": [], "last_activity": timestamp} }
-session_histories = {}
-SESSION_TIMEOUT = 120 # 2 minutes in seconds
+# Conversation memory. SESSION_BACKEND=sqlite (or redis) shares sessions
+# between uvicorn workers; the default keeps them in this process.
+session_store = create_session_store()
+
+# Seconds between sweeps for expired sessions (one DELETE per interval, not per chat turn)
+SESSION_CLEANUP_INTERVAL = float(os.getenv("SESSION_CLEANUP_INTERVAL", 60))
 
 def cleanup_expired_sessions():
-    """Remove sessions that have been inactive for more than 2 minutes."""
-    current_time = time.time()
-    expired_sessions = [
-        sid for sid, data in session_histories.items() 
-        if current_time - data["last_activity"] > SESSION_TIMEOUT
-    ]
-    for sid in expired_sessions:
-        del session_histories[sid]
-    
-    if expired_sessions:
-        print(f"Cleanup: Removed {len(expired_sessions)} inactive sessions.")
+    """Remove sessions that have been inactive for longer than SESSION_TIMEOUT."""
+    removed = session_store.cleanup_expired()
+    if removed:
+        print(f"Cleanup: Removed {removed} inactive sessions.")
+
+async def clean_sessions_periodically():
+    """Expire idle sessions in the background; started from the app lifespan."""
+    while True:
+        await asyncio.sleep(SESSION_CLEANUP_INTERVAL)
+        try:
+            await run_io(cleanup_expired_sessions)
+        except Exception as e:
+            print(f"Session cleanup error: {e}")
+
+def open_session(session_id):
+    """Create or refresh the session and return its history (blocking, run via run_io)."""
+    session_store.touch(session_id)
+    return session_store.get_history(session_id)
+
+@app.get("/live")
+async def live():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: model, index and warm-up are done; 503 until then."""
+    body = {"status": "ready" if startup_state.ready else "starting", **startup_state.to_dict()}
+    return JSONResponse(body, status_code=200 if startup_state.ready else 503)
 
 @app.get("/status")
 async def health_check():
-    cleanup_expired_sessions()
-    v_store = get_vector_store()
+    # Session and outbox counts may hit SQLite or Redis; keep them off the event loop
+    active_sessions = await run_io(session_store.count)
+    sessions = await run_io(session_store.stats)
+    outbox = await run_io(email_outbox.stats)
     return {
         "status": "online",
         "api_key_set": bool(API_KEY),
-        "vector_store_loaded": v_store is not None,
-        "active_sessions": len(session_histories),
+        "vector_store_loaded": get_vector_store() is not None,
+        "index": vector_store_holder.stats(),
+        "startup": startup_state.to_dict(),
+        "active_sessions": active_sessions,
+        "sessions": sessions,
+        "stream_ttft_ms": stream_stats,
+        "prompt_tokens": prompt_stats,
+        "retrieval": retrieval_stats.to_dict(),
+        "admission_catalog": admission_catalog.stats(),
+        "email_outbox": outbox,
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_gateway": llm.stats() if llm is not None else None,
+        "answer_cache": answer_cache.stats(),
+        "chat_coalescing": chat_flights.stats(),
+        "intent_router": intent_router.stats(),
+        "traffic_recorder": traffic_recorder.stats(),
+        "embeddings": embedding_service.stats(),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
+def index_size_bytes():
+    if not os.path.isdir(FAISS_INDEX_PATH):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(FAISS_INDEX_PATH) if entry.is_file())
+
+# Values other components already track, read at scrape time
+registry.gauge("helpdesk_ready", "1 once startup warm-up has finished", lambda: int(startup_state.ready))
+registry.gauge("helpdesk_import_seconds", "Time to import the app module", lambda: startup_state.import_seconds or 0)
+registry.gauge("helpdesk_time_to_ready_seconds", "Time from import to ready", lambda: startup_state.time_to_ready or 0)
+registry.gauge("helpdesk_active_sessions", "Chat sessions currently held", session_store.count)
+registry.gauge("helpdesk_index_chunks", "Chunks in the active vector index", lambda: vector_store_holder.current.chunk_count)
+registry.gauge("helpdesk_index_version", "Version of the active vector index", lambda: vector_store_holder.current.version)
+registry.gauge("helpdesk_index_bytes", "Size of the index files on disk", index_size_bytes)
+registry.gauge("helpdesk_answer_cache_lookups_total", "Answer cache lookups by outcome",
+               lambda: {"exact": answer_cache.exact_hits, "semantic": answer_cache.semantic_hits, "miss": answer_cache.misses},
+               ["result"], kind="counter")
+registry.gauge("helpdesk_answer_cache_hit_ratio", "Share of answer cache lookups served from the cache",
+               lambda: answer_cache.stats()["hit_rate"])
+registry.gauge("helpdesk_embedding_cache_lookups_total", "Query embedding cache lookups by outcome",
+               lambda: {"hit": embedding_service.cache_hits, "miss": embedding_service.cache_misses},
+               ["result"], kind="counter")
+registry.gauge("helpdesk_embedding_cache_hit_ratio", "Share of query embeddings served from the cache",
+               lambda: embedding_service.stats()["cache_hit_rate"])
+registry.gauge("helpdesk_chat_flights_in_flight", "First-turn chat answers being computed for a coalesced group",
+               lambda: chat_flights.stats()["in_flight"])
+registry.gauge("helpdesk_llm_slots", "LLM calls in flight and waiting for a slot",
+               lambda: {"active": llm_scheduler.active, "waiting": llm_scheduler.waiting}, ["state"])
+registry.gauge("helpdesk_llm_rejected_total", "LLM requests turned away by the scheduler",
+               lambda: {"queue_full": llm_scheduler.rejected, "timeout": llm_scheduler.timed_out},
+               ["reason"], kind="counter")
+registry.gauge("helpdesk_llm_circuit_open", "1 while a model's circuit breaker is not closed",
+               lambda: {model: int(info["circuit"] != "closed")
+                        for model, info in (llm.stats()["models"].items() if llm is not None else ())},
+               ["model"])
+registry.gauge("helpdesk_email_outbox_depth", "Confirmation emails waiting to be sent",
+               lambda: email_outbox.stats()["queue_depth"])
+registry.gauge("helpdesk_email_delivered_total", "Confirmation emails delivered by this process",
+               lambda: email_outbox.delivered, kind="counter")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the hot-path histograms and counters."""
+    body = await run_io(registry.render)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+class ProfilerRequest(BaseModel):
+    enabled: bool
+    interval_ms: Optional[float] = None
+
+@app.get("/debug/profiler")
+async def profiler_status(limit: int = 20):
+    """Sampling profiler state and the hottest frames so far."""
+    return {**profiler.stats(), "top": profiler.top(limit)}
+
+@app.post("/debug/profiler")
+async def toggle_profiler(request: ProfilerRequest):
+    """Start or stop the sampling profiler at runtime."""
+    if request.enabled:
+        profiler.start(request.interval_ms)
+    else:
+        profiler.stop()
+    return profiler.stats()
+
+@app.get("/debug/profiler/folded")
+async def profiler_folded():
+    """Collapsed stacks for flamegraph.pl or speedscope."""
+    return Response(profiler.folded(), media_type="text/plain; charset=utf-8")
+
+CHAT_VERSION = "10.0-Smart"
+
+# Rolling time-to-first-token stats for /chat/stream
+stream_stats = {"streams": 0, "last_ttft_ms": None, "avg_ttft_ms": None}
+
+def record_stream_timing(ttft_ms):
+    """Fold a finished stream's time-to-first-token into the rolling stats."""
+    if ttft_ms is None:
+        return
+    stream_stats["streams"] += 1
+    stream_stats["last_ttft_ms"] = round(ttft_ms, 1)
+    prev = stream_stats["avg_ttft_ms"] or 0.0
+    stream_stats["avg_ttft_ms"] = round(prev + (ttft_ms - prev) / stream_stats["streams"], 1)
+
+# Prompt for the Agent; {context} is filled by build_system_prompt()
+SYSTEM_TEMPLATE = """You are the MIET AI Student Support Agent, a helpful, intelligent, and friendly assistant for M.I.E.T.Arts & Science College.
+
+YOUR GOAL: Provide accurate, helpful, and "human-like" answers to student queries based on the provided college documents.
+
+FORMATTING RULES (STRICT):
+1. **SENTENCE CASE**: Always use proper sentence case. Use bold for emphasis and italic for secondary details.
+2. **CLEAN LAYOUT**: Use bullet points and numbered lists for all technical data, course lists, or fee structures. Avoid large blocks of text.
+3. **THREE-COLOR THEME STRATEGY (MODERN UI)**:
+   - Use **MIET Navy** (#003366) for Primary Headers (Main topics).
+   - Use **Gold/Amber** for Key Highlights or Action Items.
+   - Use *Neutral Gray* for fine print or context.
+   (Note: Represent these using semantic markdown structures like `### Header`, `**Bold**`, and `*Italic*`).
+4. **MD WRAPPING**: Use Markdown tables for data comparisons if applicable.
+
+ADMISSION FLOW (CRITICAL):
+1. If the user asks about admissions, courses, or fees, answer clearly in structured points first.
+2. THEN, always ask: "Would you like to apply for admission now?"
+3. IF confirmed, provide the exact tag: **[ADMISSION_BUTTON]**.
+
+Context from College Documents:
+{context}"""
+
+# Rolling input-token stats for /chat prompts
+prompt_stats = {"prompts": 0, "avg_prompt_tokens": 0.0, "last": None}
+
+def record_prompt_stats(stats):
+    prompt_stats["prompts"] += 1
+    prompt_stats["last"] = stats
+    prev = prompt_stats["avg_prompt_tokens"]
+    prompt_stats["avg_prompt_tokens"] = round(prev + (stats["prompt_tokens"] - prev) / prompt_stats["prompts"], 1)
+
+# Concurrent identical first-turn questions share one retrieval + LLM call
+chat_flights = SingleFlight("chat")
+
+async def save_turn(session_id, query, answer):
+    """Store a finished question/answer pair in the session history."""
+    await run_io(session_store.append_turn, session_id, query, answer)
+
+async def answer_intent(session_id, query, intent):
+    """Reply to a routed intent (small talk, apply, off topic) from its template."""
+    annotate(intent=intent)
+    answer = intent_router.answer(intent)
+    await save_turn(session_id, query, answer)
+    return answer
+
+async def prepare_chat(query, session_id):
+    """
+    Run retrieval and build the LLM prompt for a chat turn.
+    Returns (answer, None, None) when the turn was answered without the LLM,
+    otherwise (None, messages, cache_slot) where cache_slot is passed to
+    remember_answer() once the LLM has replied (None if not cacheable).
+    """
+    # Pin the current index version for the whole request; a swap mid-request doesn't affect it
+    snapshot = vector_store_holder.current
+    v_store = snapshot.store
+    chat_llm = get_llm()
+
+    if not v_store and vector_store_holder.loading:
+        return "I'm just getting my college documents ready. Please ask me again in a few seconds!", None, None
+
+    if not v_store:
+        return "Hello! I don't have any college documents to study yet. Please upload a PDF in the Admin section so I can help you better.", None, None
+
+    if not chat_llm:
+        return "I'm having trouble connecting to my AI core. Please check your API key.", None, None
+
+    annotate(session_id=session_id, index_version=snapshot.version)
+
+    # Initialize the session if needed and update its last activity time
+    history = await run_io(open_session, session_id)
+
+    # Small talk and "apply now" are answered from templates before the query is even embedded
+    with timed("intent"):
+        intent = intent_router.classify_text(query, history)
+    if intent is not None:
+        return await answer_intent(session_id, query, intent), None, None
+
+    # Answers only depend on the query for the first turn of a conversation;
+    # follow-up questions need the history and always go to the LLM.
+    cacheable = not history
+    kb_version = answer_cache.kb_version
+    if cacheable:
+        cached = answer_cache.get_exact(query)
+        if cached is not None:
+            annotate(answer_cache="exact")
+            await save_turn(session_id, query, cached)
+            return cached, None, None
+
+    # Identical first-turn questions already being answered wait for that answer
+    flight = chat_flights.join((normalize_query(query), kb_version, snapshot.version)) if cacheable else None
+    if flight is not None and not flight.leader:
+        answer = await flight.wait()
+        if answer is not None:
+            annotate(answer_cache="coalesced")
+            await save_turn(session_id, query, answer)
+            return answer, None, None
+        # The leader failed or stalled: answer this one independently
+        flight = None
+
+    try:
+        return await retrieve_and_build_prompt(query, session_id, snapshot, history, kb_version, flight)
+    except BaseException:
+        if flight is not None:
+            flight.finish()
+        raise
+
+async def retrieve_and_build_prompt(query, session_id, snapshot, history, kb_version, flight):
+    """
+    Second half of prepare_chat(): semantic cache, retrieval and prompt.
+    `flight` is set when this request leads a coalesced group; answers
+    found here are handed to its followers straight away.
+    """
+    cacheable = not history
+
+    # Embed once and reuse the vector for both the semantic cache and FAISS
+    with timed("embed"):
+        query_embedding = await embedding_service.aembed_query(query)
+
+    # Off-topic questions and small-talk variants the rules missed, by nearest intent centroid
+    with timed("intent"):
+        intent = intent_router.classify_embedding(query, query_embedding)
+    if intent is not None:
+        answer = await answer_intent(session_id, query, intent)
+        if flight is not None:
+            flight.finish(answer)
+        return answer, None, None
+
+    if cacheable:
+        cached = answer_cache.get_semantic(query_embedding)
+        if cached is not None:
+            annotate(answer_cache="semantic")
+            await save_turn(session_id, query, cached)
+            if flight is not None:
+                flight.finish(cached)
+            return cached, None, None
+    annotate(answer_cache="miss" if cacheable else "skipped")
+
+    # 5. Execute RAG Chain (vector + keyword hits fused, best first)
+    relevant_docs, timings = await snapshot.retriever.retrieve(query, query_embedding)
+    for stage, ms in timings.items():
+        observe_stage("retrieval_" + stage.removesuffix("_ms"), ms / 1000)
+    annotate(chunk_ids=[doc.id for doc in relevant_docs])
+
+    # Generate response using LLM with the retrieved context, trimmed to the prompt token budget
+    from langchain_core.messages import SystemMessage, HumanMessage
+    with timed("prompt_build"):
+        system_prompt, stats = build_system_prompt(SYSTEM_TEMPLATE, [doc.page_content for doc in relevant_docs], history, query)
+    record_prompt_stats(stats)
+    annotate(chunks_used=stats["chunks_used"], prompt_tokens_estimate=stats["prompt_tokens"])
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=query)
+    ]
+    cache_slot = (query_embedding, kb_version, flight) if cacheable else None
+    return None, messages, cache_slot
+
+def remember_answer(query, answer, cache_slot):
+    """
+    Store a fresh LLM answer in the answer cache when the turn was cacheable
+    and hand it to any requests coalesced onto this one.
+    """
+    if cache_slot is not None and answer:
+        query_embedding, kb_version, flight = cache_slot
+        answer_cache.put(query, query_embedding, answer, kb_version)
+        if flight is not None:
+            flight.finish(answer)
+
+def release_flight(cache_slot):
+    """Let coalesced followers go when the leader ends without an answer (no-op after remember_answer)."""
+    if cache_slot is not None and cache_slot[2] is not None:
+        cache_slot[2].finish()
+
 @app.post("/chat")
 async def chat(request: ChatRequest):
     query = request.query.strip()
     session_id = request.session_id
-    
+
     if not API_KEY:
-        return {"answer": "I'm sorry, I'm having trouble connecting to my AI services. Please check the API config.", "version": "10.0-Smart"}
+        return {"answer": "I'm sorry, I'm having trouble connecting to my AI services. Please check the API config.", "version": CHAT_VERSION}
 
+    cache_slot = None
+    answer = error = None
     try:
-        # Cleanup old sessions before processing new request
-        cleanup_expired_sessions()
+        answer, messages, cache_slot = await prepare_chat(query, session_id)
+        if answer is not None:
+            return {"answer": answer, "version": CHAT_VERSION}
 
-        # Get global instances
-        v_store = get_vector_store()
-        chat_llm = get_llm()
-        
-        if not v_store:
-             return {"answer": "Hello! I don't have any college documents to study yet. Please upload a PDF in the Admin section so I can help you better.", "version": "10.0-Smart"}
-        
-        if not chat_llm:
-             return {"answer": "I'm having trouble connecting to my AI core. Please check your API key.", "version": "10.0-Smart"}
+        # Await the completion so a slow Groq call doesn't stall the event loop
+        async with llm_scheduler.slot():
+            with timed("llm"):
+                response = await get_llm().ainvoke(messages)
+        record_llm_usage(response)
+        answer = response.content
 
-        # Initialize session history if it doesn't exist
-        if session_id not in session_histories:
-            session_histories[session_id] = {"history": [], "last_activity": time.time()}
-        
-        # Update last activity time
-        session_histories[session_id]["last_activity"] = time.time()
-        history = session_histories[session_id]["history"]
-
-        # 3. Setup Prompt for the Agent
-        system_template = """You are the MIET AI Student Support Agent, a helpful, intelligent, and friendly assistant for M.I.E.T.Arts & Science College.
-
-        YOUR GOAL: Provide accurate, helpful, and "human-like" answers to student queries based on the provided college documents.
-
-        FORMATTING RULES (STRICT):
-        1. **SENTENCE CASE**: Always use proper sentence case. Use bold for emphasis and italic for secondary details.
-        2. **CLEAN LAYOUT**: Use bullet points and numbered lists for all technical data, course lists, or fee structures. Avoid large blocks of text.
-        3. **THREE-COLOR THEME STRATEGY (MODERN UI)**:
-           - Use **MIET Navy** (#003366) for Primary Headers (Main topics).
-           - Use **Gold/Amber** for Key Highlights or Action Items.
-           - Use *Neutral Gray* for fine print or context.
-           (Note: Represent these using semantic markdown structures like `### Header`, `**Bold**`, and `*Italic*`).
-        4. **MD WRAPPING**: Use Markdown tables for data comparisons if applicable.
-
-        ADMISSION FLOW (CRITICAL):
-        1. If the user asks about admissions, courses, or fees, answer clearly in structured points first.
-        2. THEN, always ask: "Would you like to apply for admission now?"
-        3. IF confirmed, provide the exact tag: **[ADMISSION_BUTTON]**.
-
-        Context from College Documents:
-        {context}
-        """
-
-        # Include more history for better context (last 10 interactions)
-        recent_history = history[-10:] if len(history) >= 10 else history
-        history_str = ""
-        for i, msg in enumerate(recent_history):
-            role = "User" if i % 2 == 0 else "Bot"
-            history_str += f"{role}: {msg}\n"
-        
-        if history_str:
-            system_template += f"\n\nRecent Conversation History:\n{history_str}"
-
-        # 5. Execute RAG Chain
-        docs = v_store.similarity_search_with_score(query, k=10)
-        relevant_docs = [doc for doc, score in docs if score < 1.65]
-        context = "\n\n".join([doc.page_content for doc in relevant_docs]) if relevant_docs else ""
-
-        # Social & Fallback Handling
-        if not context and len(query) < 5:
-            greetings = ["hi", "hello", "hey", "vanakam", "namaste"]
-            if any(g in query.lower() for g in greetings):
-                ans = "Vanakam! 👋 I am your MIET AI Agent. I'm here to answer your questions about courses, admissions, fees, and campus life. Would you like to start your admission process today?"
-                history.append(query)
-                history.append(ans)
-                return {"answer": ans, "version": "10.0-Smart"}
-
-        # Generate response using LLM with the retrieved context
-        messages = [
-            SystemMessage(content=system_template.format(context=context)),
-            HumanMessage(content=query)
-        ]
-        
-        response = chat_llm.invoke(messages)
-        
         # Save to memory
-        history.append(query)
-        history.append(response.content)
-        
-        # Update last activity again after bot response
-        session_histories[session_id]["last_activity"] = time.time()
-        
-        # Limit history size per session
-        if len(history) > 40:
-            session_histories[session_id]["history"] = history[-40:]
-            
-        return {"answer": response.content, "version": "10.0-Smart"}
-        
+        await save_turn(session_id, query, answer)
+        remember_answer(query, answer, cache_slot)
+
+        return {"answer": answer, "version": CHAT_VERSION}
+
+    except SchedulerOverloaded:
+        error = "overloaded"
+        raise
+    except LLMUnavailable as e:
+        print(f"Chat error: {e.cause or e}")
+        answer, error = e.detail, str(e.cause or e)
+        return {"answer": answer, "version": CHAT_VERSION}
     except Exception as e:
         print(f"Chat error: {str(e)}")
-        return {"answer": f"Agent error: {str(e)}", "version": "10.0-Smart"}
+        answer, error = f"Agent error: {str(e)}", str(e)
+        return {"answer": answer, "version": CHAT_VERSION}
+    finally:
+        release_flight(cache_slot)
+        traffic_recorder.record("/chat", session_id, query, answer, error)
+
+def sse_event(data, event=None):
+    """Format a dict as a single Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+class GuardedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always cleans up after its body. The body
+    generator is closed, so its finally blocks run, even when the client
+    disconnects or a send fails; then `on_close` runs, whether or not the
+    generator ever started.
+    """
+
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            if self.on_close is not None:
+                self.on_close()
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat. Emits `data: {"token": ...}` frames as the LLM
+    produces them and a final `event: done` frame with the full answer and
+    timings (ttft_ms = time to first token).
+    """
+    query = request.query.strip()
+    session_id = request.session_id
+    started = time.perf_counter()
 
-@app.post("/admission-options")
-async def get_admission_options():
-    try:
-        if not API_KEY:
-            return {"error": "API Key missing"}
+    def single_answer_stream(answer):
+        yield sse_event({"token": answer})
+        yield sse_event({"answer": answer, "version": CHAT_VERSION}, event="done")
 
-        v_store = get_vector_store()
-        chat_llm = get_llm()
-        
-        if not v_store:
-            return {
-                "categories": ["Undergraduate (UG)", "Postgraduate (PG)"],
-                "courses": {
-                    "Undergraduate (UG)": ["Computer Science", "Physics", "Chemistry", "Mathematics"],
-                    "Postgraduate (PG)": ["M.Sc Computer Science", "M.Sc Mathematics"]
-                }
-            }
-
-        # Search for course related info
-        docs = v_store.similarity_search("list of courses and departments", k=15)
-        context = "\n\n".join([doc.page_content for doc in docs])
-        
-        system_prompt = """You are a data extractor for MIET College. Based on the context, extract categories and courses.
-        Return ONLY a JSON object: {"categories": ["..."], "courses": {"Cat1": ["Course A"]}}
-        
-        Context:
-        {context}
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt.format(context=context)),
-            HumanMessage(content="Extract the admission categories and courses as JSON.")
-        ]
-        
-        response = chat_llm.invoke(messages)
-        # Attempt to parse JSON from response
-        try:
-            content = response.content.strip()
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            data = json.loads(content)
-            return data
-        except:
-            return {
-                "categories": ["Undergraduate (UG)", "Postgraduate (PG)", "Research Programs"],
-                "courses": {
-                    "Undergraduate (UG)": [
-                        "B.A. English", "B.Com", "B.Com (Computer Applications)", "B.B.A", 
-                        "B.Sc Physics", "B.Sc Mathematics", "B.Sc Computer Science", 
-                        "B.Sc Data Science", "B.Sc Biochemistry", "B.Sc Microbiology", "B.C.A"
-                    ],
-                    "Postgraduate (PG)": [
-                        "M.A. English", "M.Com", "M.Sc Computer Science", 
-                        "M.Sc Biochemistry", "M.C.A"
-                    ],
-                    "Research Programs": [
-                        "Ph.D. in Commerce (Full-time)", "Ph.D. in Commerce (Part-time)"
-                    ]
-                }
-            }
-            
-    except Exception as e:
-        print(f"Error in admission-options: {e}")
-        return {"error": str(e)}
+    if not API_KEY:
+        answer = "I'm sorry, I'm having trouble connecting to my AI services. Please check the API config."
+        return StreamingResponse(single_answer_stream(answer), media_type="text/event-stream")
 
+    try:
+        answer, messages, cache_slot = await prepare_chat(query, session_id)
+    except Exception as e:
+        print(f"Chat stream error: {str(e)}")
+        return StreamingResponse(single_answer_stream(f"Agent error: {str(e)}"), media_type="text/event-stream")
 
-# Initialize admissions database
-ADMISSIONS_DB = os.path.join(DB_DIR, "admissions.db")
-
-def init_db():
-    conn = sqlite3.connect(ADMISSIONS_DB)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS admissions
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  full_name TEXT,
-                  email TEXT,
-                  phone TEXT,
-                  category TEXT,
-                  course TEXT,
-                  address TEXT,
-                  marks TEXT,
-                  prev_college TEXT,
-                  submitted_at TEXT)''')
-    
-    # Check if all columns exist (migration for older versions)
-    c.execute("PRAGMA table_info(admissions)")
-    columns = [row[1] for row in c.fetchall()]
-    
-    required_columns = {
-        "full_name": "TEXT",
-        "email": "TEXT",
-        "phone": "TEXT",
-        "category": "TEXT",
-        "course": "TEXT",
-        "address": "TEXT",
-        "marks": "TEXT",
-        "prev_college": "TEXT",
-        "submitted_at": "TEXT"
-    }
-    
-    for col, col_type in required_columns.items():
-        if col not in columns:
-            try:
-                c.execute(f"ALTER TABLE admissions ADD COLUMN {col} {col_type}")
-                print(f"Migration: Added missing column {col} to admissions table")
-            except Exception as e:
-                print(f"Migration Error: {e}")
-                
-    conn.commit()
-    conn.close()
+    if answer is not None:
+        traffic_recorder.record("/chat/stream", session_id, query, answer)
+        return StreamingResponse(single_answer_stream(answer), media_type="text/event-stream")
 
-# Run DB init
-init_db()
+    # Take the LLM slot before the response starts so overload surfaces as 429/503
+    try:
+        await llm_scheduler.acquire()
+    except BaseException:
+        release_flight(cache_slot)
+        raise
+
+    stream_started = False
+
+    def release_unstarted_stream():
+        # The generator's own finally releases the slot once it has started
+        if not stream_started:
+            llm_scheduler.release()
+            release_flight(cache_slot)
+
+    async def event_stream():
+        nonlocal stream_started
+        stream_started = True
+        ttft_ms = None
+        parts = []
+        usage_chunk = None
+        llm_started = time.perf_counter()
+        try:
+            async for chunk in get_llm().astream(messages):
+                if getattr(chunk, "usage_metadata", None):
+                    usage_chunk = chunk
+                if not chunk.content:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                    observe_stage("llm_ttft", time.perf_counter() - llm_started)
+                parts.append(chunk.content)
+                yield sse_event({"token": chunk.content})
+        except LLMUnavailable as e:
+            # Raised before the first token, so the apology can be the whole answer
+            print(f"Chat stream error: {e.cause or e}")
+            release_flight(cache_slot)
+            traffic_recorder.record("/chat/stream", session_id, query, e.detail, str(e.cause or e))
+            yield sse_event({"token": e.detail})
+            yield sse_event({"answer": e.detail, "version": CHAT_VERSION}, event="done")
+            return
+        except Exception as e:
+            print(f"Chat stream error: {str(e)}")
+            release_flight(cache_slot)
+            traffic_recorder.record("/chat/stream", session_id, query, "".join(parts), str(e))
+            yield sse_event({"error": f"Agent error: {str(e)}"}, event="error")
+            return
+        except BaseException:
+            # Client went away mid-stream
+            release_flight(cache_slot)
+            raise
+        finally:
+            llm_scheduler.release()
+            observe_stage("llm", time.perf_counter() - llm_started)
+
+        # Streamed chunks are roughly one token each when the provider doesn't report usage
+        record_llm_usage(usage_chunk, completion_tokens_estimate=len(parts))
+        answer = "".join(parts)
+        await save_turn(session_id, query, answer)
+        remember_answer(query, answer, cache_slot)
+        release_flight(cache_slot)
+
+        total_ms = (time.perf_counter() - started) * 1000
+        record_stream_timing(ttft_ms)
+        traffic_recorder.record("/chat/stream", session_id, query, answer,
+                                ttft_ms=round(ttft_ms, 1) if ttft_ms is not None else None)
+        print(f"Stream finished for {session_id}: ttft={ttft_ms or 0:.0f}ms total={total_ms:.0f}ms")
+        yield sse_event({
+            "answer": answer,
+            "version": CHAT_VERSION,
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "total_ms": round(total_ms, 1)
+        }, event="done")
+
+    return GuardedStreamingResponse(
+        event_stream(),
+        on_close=release_unstarted_stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# The form options are extracted from the knowledge base once per index version
+# (see utils/admission_catalog.py), so form loads never call the LLM.
+CATALOG_CACHE_CONTROL = "public, max-age=300"
+
+@app.api_route("/admission-options", methods=["GET", "POST"])
+async def get_admission_options(request: Request):
+    etag = admission_catalog.etag
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(admission_catalog.catalog, headers=headers)
+
+
+# Admissions database (pooled WAL connections, see utils/admissions_db.py);
+# the tables are created from the lifespan, not at import
+def store_admission(data, submitted_at):
+    """
+    Insert the admission and queue its confirmation email in one transaction
+    (blocking, run via run_io). Returns (application_id, email_status):
+    "queued", "no_address", or "not_configured" when SMTP credentials are
+    missing (the email is still queued and goes out once they are set).
+    """
+    with admissions_db.pool.transaction() as conn:
+        application_id = admissions_db.insert_admission(data, submitted_at, conn=conn)
+        email_status = "no_address"
+        if data.get('email'):
+            msg = build_confirmation_email(data.get('email'), data.get('fullName'), data.get('course'),
+                                           application_id, submitted_at)
+            email_outbox.enqueue(msg, conn=conn)
+            email_status = "queued" if email_configured() else "not_configured"
+    email_outbox.wake()
+    return application_id, email_status
 
 @app.post("/submit-admission")
 async def submit_admission(data: dict):
     try:
-        conn = sqlite3.connect(ADMISSIONS_DB)
-        c = conn.cursor()
-        
         # Ensure submitted_at is recorded
         submitted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        c.execute('''INSERT INTO admissions 
-                     (full_name, email, phone, category, course, address, marks, prev_college, submitted_at) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                  (data.get('fullName'), 
-                   data.get('email'), 
-                   data.get('phone'), 
-                   data.get('category'), 
-                   data.get('course'), 
-                   data.get('address'), 
-                   data.get('marks'), 
-                   data.get('prevCollege'),
-                   submitted_at))
-        
-        application_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        application_id, email_status = await run_io(store_admission, data, submitted_at)
         
         print(f"NEW ADMISSION STORED: {data.get('fullName')} for {data.get('course')} (ID: {application_id})")
         
-        # Send confirmation email
-        email_sent = False
-        student_email = data.get('email')
-        student_name = data.get('fullName')
-        course_name = data.get('course')
-        
-        if student_email:
-            email_sent = send_confirmation_email(student_email, student_name, course_name, application_id, submitted_at)
-
-        if email_sent:
-            return {"status": "success", "email_sent": True, "message": "Application submitted successfully! A confirmation email has been sent."}
+        # The confirmation email goes out from the background outbox sender
+        if email_status == "queued":
+            return {"status": "success", "email_queued": True, "email_status": email_status, "application_id": application_id, "message": "Application submitted successfully! A confirmation email is on its way."}
+        elif email_status == "not_configured":
+            return {"status": "success", "email_queued": False, "email_status": email_status, "application_id": application_id, "message": "Application submitted successfully! Confirmation emails are not set up yet, so yours will be sent later."}
         else:
-            return {"status": "success", "email_sent": False, "message": "Application stored, but email confirmation failed. Please check your contact details or contact support."}
+            return {"status": "success", "email_queued": False, "email_status": email_status, "application_id": application_id, "message": "Application stored, but no email address was given for the confirmation. Please contact support."}
     except Exception as e:
         print(f"Database error: {e}")
         raise HTTPException(status_code=500, detail="Failed to store admission data")
 
+def admission_filters(course, category, email, since, until, q):
+    return {"course": course, "category": category, "email": email, "since": since, "until": until, "q": q}
+
 @app.get("/admissions")
-async def get_admissions():
+async def get_admissions(limit: int = ADMISSIONS_PAGE_SIZE, cursor: Optional[str] = None,
+                         course: Optional[str] = None, category: Optional[str] = None,
+                         email: Optional[str] = None, since: Optional[str] = None,
+                         until: Optional[str] = None, q: Optional[str] = None):
+    """Newest applications first; pass the returned next_cursor to get the following page."""
+    filters = admission_filters(course, category, email, since, until, q)
     try:
-        conn = sqlite3.connect(ADMISSIONS_DB)
-        # Use Row factory to get dict-like objects
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute("SELECT * FROM admissions ORDER BY submitted_at DESC")
-        rows = c.fetchall()
-        
-        data = [dict(row) for row in rows]
-        conn.close()
-        return data
+        return await run_io(lambda: admissions_db.list_admissions(limit, cursor, **filters))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error fetching admissions: {e}")
         return {"error": str(e)}
 
+@app.get("/admissions/analytics")
+async def admissions_analytics(days: int = 30):
+    """Counts by course, category and day plus recent rates, from summary tables kept up to date on submit."""
+    return await run_io(admissions_db.analytics, days)
+
+@app.post("/admissions/analytics/rebuild")
+async def rebuild_admissions_analytics():
+    """Recompute the summary tables from the raw rows (also: python -m utils.admissions_db rebuild-analytics)."""
+    started = time.perf_counter()
+    rows = await run_io(admissions_db.rebuild_analytics)
+    return {"status": "success", "rows": rows, "seconds": round(time.perf_counter() - started, 3)}
+
+@app.post("/admissions/import")
+async def import_admissions(file: UploadFile = File(...), format: Optional[str] = None,
+                            send_emails: bool = True, report: str = "all"):
+    """
+    Bulk-load applications from a CSV or NDJSON upload (see utils/admission_import.py).
+    Returns a result per row; report=errors lists only the rows that weren't imported.
+    """
+    format = format or import_format(file.filename, file.content_type)
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+    if report not in ("all", "errors"):
+        raise HTTPException(status_code=400, detail="report must be 'all' or 'errors'")
+    result = await run_io(admission_importer.run, file.file, format, send_emails)
+    if result.emails_queued:
+        email_outbox.wake()
+    print(f"ADMISSIONS IMPORTED from {file.filename}: {result.imported} imported, {result.invalid} invalid, "
+          f"{result.failed} failed in {result.seconds:.2f}s")
+    return result.to_dict(errors_only=report == "errors")
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", admissions_db.export_csv),
+    "ndjson": ("application/x-ndjson", admissions_db.export_ndjson),
+}
+
+@app.get("/admissions/export")
+async def export_admissions(format: str = "csv", course: Optional[str] = None,
+                            category: Optional[str] = None, email: Optional[str] = None,
+                            since: Optional[str] = None, until: Optional[str] = None,
+                            q: Optional[str] = None):
+    """Stream every matching application; rows are read page by page, never all at once."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    media_type, export = EXPORT_FORMATS[format]
+    filters = admission_filters(course, category, email, since, until, q)
+    filename = f"admissions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(
+        export(**filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+startup_state.imported()
+print(f"App module imported in {startup_state.import_seconds * 1000:.0f}ms")
+
 if __name__ == "__main__":
     import uvicorn
-    # Enable reload for easier development updates
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    workers = int(os.getenv("UVICORN_WORKERS", 1))
+    if workers > 1:
+        # Needs SESSION_BACKEND=sqlite or redis so sessions are shared between workers
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        # Enable reload for easier development updates
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,157 @@
+import time
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from benchmarks.fakes import FakeChatGroq
+from utils import llm_gateway
+from utils.llm_gateway import LLMGateway, LLMUnavailable, CircuitBreaker
+
+MESSAGES = [HumanMessage(content="What courses are offered?")]
+
+
+class StatusError(Exception):
+    """Stands in for the provider SDK's HTTP errors, which carry status_code."""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = None
+
+
+class FlakyClient(FakeChatGroq):
+    """FakeChatGroq that raises the scripted errors first, one per call, then answers."""
+
+    def __init__(self, errors=()):
+        super().__init__(latency=0, tokens_per_second=1e6, answer_tokens=3)
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def _maybe_fail(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def invoke(self, messages, **kwargs):
+        self._maybe_fail()
+        return super().invoke(messages, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        self._maybe_fail()
+        return await super().ainvoke(messages, **kwargs)
+
+    async def astream(self, messages, **kwargs):
+        self._maybe_fail()
+        async for chunk in super().astream(messages, **kwargs):
+            yield chunk
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(llm_gateway, "LLM_FALLBACK_RESERVE", 0)
+
+
+def gateway(main, fallback=None, **kwargs):
+    clients = {"main": main, "fallback": fallback}
+    return LLMGateway(model="main", fallback_model="fallback" if fallback else "",
+                      client_factory=clients.__getitem__, **kwargs)
+
+
+def test_retries_server_errors_then_succeeds():
+    main = FlakyClient([StatusError(503), StatusError(429)])
+    llm = gateway(main)
+    response = asyncio.run(llm.ainvoke(MESSAGES))
+    assert response.content
+    assert main.attempts == 3
+    assert llm.stats()["models"]["main"]["retries"] == 2
+    assert llm.routes[0].breaker.state == "closed"
+
+
+def test_rejected_request_is_not_retried():
+    main = FlakyClient([StatusError(400)])
+    llm = gateway(main, fallback=FlakyClient())
+    with pytest.raises(StatusError):
+        asyncio.run(llm.ainvoke(MESSAGES))
+    assert main.attempts == 1
+    assert llm.fallbacks == 0
+
+
+def test_falls_back_when_retries_are_exhausted():
+    main = FlakyClient([StatusError(500)] * 10)
+    fallback = FlakyClient()
+    llm = gateway(main, fallback=fallback, max_retries=2)
+    assert asyncio.run(llm.ainvoke(MESSAGES)).content
+    assert main.attempts == 3
+    assert fallback.attempts == 1
+    assert llm.fallbacks == 1
+
+
+def test_blocking_invoke_falls_back_too():
+    main = FlakyClient([TimeoutError()] * 10)
+    fallback = FlakyClient()
+    llm = gateway(main, fallback=fallback, max_retries=1)
+    assert llm.invoke(MESSAGES).content
+    assert (main.attempts, fallback.attempts) == (2, 1)
+
+
+def test_unavailable_when_every_model_fails():
+    llm = gateway(FlakyClient([StatusError(502)] * 10), fallback=FlakyClient([StatusError(502)] * 10), max_retries=1)
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(llm.ainvoke(MESSAGES))
+    assert llm.unavailable == 1
+
+
+def test_stream_is_retried_before_the_first_token():
+    main = FlakyClient([StatusError(503)])
+    llm = gateway(main)
+
+    async def collect():
+        return [chunk.content async for chunk in llm.astream(MESSAGES)]
+
+    assert len(asyncio.run(collect())) == 3
+    assert main.attempts == 2
+
+
+def test_open_breaker_sends_calls_to_the_fallback():
+    main = FlakyClient([StatusError(500)] * 10)
+    fallback = FlakyClient()
+    llm = gateway(main, fallback=fallback, max_retries=0)
+    llm.routes[0].breaker = CircuitBreaker(threshold=2, cooldown=60)
+    for _ in range(2):
+        asyncio.run(llm.ainvoke(MESSAGES))
+    assert llm.routes[0].breaker.state == "open"
+    asyncio.run(llm.ainvoke(MESSAGES))
+    # The third call never reached the main model
+    assert main.attempts == 2
+    assert fallback.attempts == 3
+
+
+def test_breaker_half_open_probe():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and breaker.times_opened == 2
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_pacing_limits_are_split_across_workers(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RPM", 60)
+    monkeypatch.setattr(llm_gateway, "LLM_TPM", 12000)
+    llm = gateway(FlakyClient(), workers=4)
+    route = llm.routes[0]
+    assert route.requests.capacity == 15
+    assert route.tokens.capacity == 3000
+    assert llm.stats()["models"]["main"]["rpm_limit"] == 15
@@ -0,0 +1,66 @@
+import pytest
+
+from benchmarks.fakes import FakeSite
+from utils.web_crawler import SiteCrawler
+
+
+@pytest.fixture
+def site():
+    site = FakeSite(pages=21, fanout=4, words_per_page=20).start()
+    yield site
+    site.stop()
+
+
+def crawl(url, **kwargs):
+    crawler = SiteCrawler(url, concurrency=2, **kwargs)
+    docs = list(crawler.crawl())
+    return crawler, sorted(doc.metadata["source"] for doc in docs)
+
+
+def page_url(site, page, host="127.0.0.1"):
+    return f"http://{host}:{site.server_address[1]}/page/{page}"
+
+
+def test_crawls_every_page_of_the_site(site):
+    crawler, sources = crawl(site.url, max_pages=50, max_depth=5)
+    assert sources == sorted(page_url(site, page) for page in range(site.pages))
+    assert crawler.errors == 0
+
+
+def test_allowed_only_same_host_pages(site):
+    crawler = SiteCrawler(site.url)
+    crawler._load_robots()
+    assert crawler.allowed(page_url(site, 1))
+    assert not crawler.allowed(page_url(site, 1, host="localhost"))
+    assert not crawler.allowed("https://example.com/page/1")
+    assert not crawler.allowed(f"ftp://127.0.0.1:{site.server_address[1]}/page/1")
+    assert not crawler.allowed(page_url(site, 1) + ".pdf")
+
+
+def test_robots_disallowed_paths_are_not_crawled(site):
+    crawler, sources = crawl(site.url, max_pages=50, max_depth=5)
+    assert not any("/private/" in source for source in sources)
+    assert not crawler.allowed(f"http://127.0.0.1:{site.server_address[1]}/private/staff")
+
+
+def test_start_url_disallowed_by_robots(site):
+    with pytest.raises(ValueError):
+        crawl(f"http://127.0.0.1:{site.server_address[1]}/private/staff")
+
+
+def test_redirect_to_another_host_is_dropped(site):
+    # /page/3 redirects to the same server under another host name; it and its children are dropped
+    site.redirects["/page/3"] = page_url(site, 20, host="localhost")
+    crawler, sources = crawl(site.url, max_pages=50, max_depth=5)
+    assert page_url(site, 3) not in sources
+    assert not any("localhost" in source for source in sources)
+    assert not any(source.endswith(f"/page/{child}") for child in range(13, 17) for source in sources)
+    assert crawler.pages_skipped == 1
+
+
+def test_redirect_into_disallowed_path_is_dropped(site):
+    site.redirects["/page/2"] = "/private/staff"
+    crawler, sources = crawl(site.url, max_pages=50, max_depth=5)
+    assert page_url(site, 2) not in sources
+    assert crawler.pages_skipped == 1
+    assert crawler.errors == 0
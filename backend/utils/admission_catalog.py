@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.single_flight import coalesced_total
+
+CATALOG_PATH = os.path.join("database", "admission_catalog.json")
+
+# Served until a catalog has been extracted from the knowledge base
+DEFAULT_CATALOG = {
+    "categories": ["Undergraduate (UG)", "Postgraduate (PG)", "Research Programs"],
+    "courses": {
+        "Undergraduate (UG)": [
+            "B.A. English", "B.Com", "B.Com (Computer Applications)", "B.B.A",
+            "B.Sc Physics", "B.Sc Mathematics", "B.Sc Computer Science",
+            "B.Sc Data Science", "B.Sc Biochemistry", "B.Sc Microbiology", "B.C.A"
+        ],
+        "Postgraduate (PG)": [
+            "M.A. English", "M.Com", "M.Sc Computer Science",
+            "M.Sc Biochemistry", "M.C.A"
+        ],
+        "Research Programs": [
+            "Ph.D. in Commerce (Full-time)", "Ph.D. in Commerce (Part-time)"
+        ]
+    }
+}
+
+EXTRACTION_PROMPT = """You are a data extractor for MIET College. Based on the context, extract categories and courses.
+Return ONLY a JSON object: {"categories": ["..."], "courses": {"Cat1": ["Course A"]}}
+
+Context:
+{context}
+"""
+
+
+def validate_catalog(data):
+    """
+    Check the {"categories": [...], "courses": {category: [...]}} shape and
+    normalize it (trimmed strings, no duplicates, no empty categories).
+    Raises ValueError if nothing usable is left.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("courses"), dict):
+        raise ValueError("Catalog must be an object with a 'courses' mapping")
+
+    categories = data.get("categories") or list(data["courses"])
+    if not isinstance(categories, list):
+        raise ValueError("'categories' must be a list")
+
+    by_name = {name.strip(): names for name, names in data["courses"].items() if isinstance(name, str)}
+    courses = {}
+    for category in categories:
+        if not isinstance(category, str) or not category.strip():
+            continue
+        names = by_name.get(category.strip())
+        if not isinstance(names, list):
+            continue
+        cleaned = list(dict.fromkeys(n.strip() for n in names if isinstance(n, str) and n.strip()))
+        if cleaned:
+            courses[category.strip()] = cleaned
+
+    if not courses:
+        raise ValueError("Catalog has no categories with courses")
+    return {"categories": list(courses), "courses": courses}
+
+
+def parse_json_object(content):
+    """Pull the first JSON object out of an LLM reply, with or without code fences."""
+    decoder = json.JSONDecoder()
+    start = content.find("{")
+    while start != -1:
+        try:
+            data, _ = decoder.raw_decode(content[start:])
+            return data
+        except json.JSONDecodeError:
+            start = content.find("{", start + 1)
+    raise ValueError("No JSON object found in LLM reply")
+
+
+class AdmissionCatalog:
+    """
+    Categories/courses for the admission form, extracted once per
+    knowledge-base version in the background and served from memory.
+    The last extraction is persisted with the index stamp it was built
+    from, so restarts and other workers reuse it instead of calling the LLM.
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog")
+        self._lock = threading.Lock()
+        self._pending = None  # (stamp, future) of the queued or running refresh
+        self.extractions = 0
+        self.failures = 0
+        self.coalesced = 0
+        self._set(DEFAULT_CATALOG, stamp=None, source="default")
+        self._load_persisted()
+
+    def _set(self, catalog, stamp, source):
+        body = json.dumps(catalog, sort_keys=True, separators=(",", ":"))
+        with self._lock:
+            self.catalog = catalog
+            self.stamp = stamp
+            self.source = source
+            self.etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest()[:16] + '"'
+            self.generated_at = time.time()
+
+    def _load_persisted(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self._set(validate_catalog(saved["catalog"]), saved.get("stamp"), saved.get("source", "llm"))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring saved admission catalog: {e}")
+
+    def _persist(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"catalog": self.catalog, "stamp": self.stamp, "source": self.source,
+                       "generated_at": self.generated_at}, f)
+        os.replace(tmp_path, self.path)
+
+    def extract(self, store, llm):
+        """Run the LLM extraction against one vector store (blocking)."""
+        from langchain_core.messages import SystemMessage, HumanMessage
+        docs = store.similarity_search("list of courses and departments", k=15)
+        context = "\n\n".join(doc.page_content for doc in docs)
+        messages = [
+            SystemMessage(content=EXTRACTION_PROMPT.replace("{context}", context)),
+            HumanMessage(content="Extract the admission categories and courses as JSON.")
+        ]
+        response = llm.invoke(messages)
+        return validate_catalog(parse_json_object(response.content))
+
+    def refresh(self, store, stamp, llm):
+        """Bring the catalog in line with the index identified by `stamp` (blocking)."""
+        if store is None:
+            self._set(DEFAULT_CATALOG, stamp=stamp, source="default")
+            return
+        if stamp is not None and stamp == self.stamp and self.source == "llm":
+            return
+
+        self._load_persisted()
+        if stamp is not None and stamp == self.stamp:
+            return
+        if llm is None:
+            return
+
+        try:
+            catalog = self.extract(store, llm)
+            self.extractions += 1
+            self._set(catalog, stamp=stamp, source="llm")
+            self._persist()
+            print(f"Admission catalog extracted: {sum(len(c) for c in catalog['courses'].values())} courses")
+        except Exception as e:
+            # Keep serving the previous catalog
+            self.failures += 1
+            print(f"Admission catalog extraction failed: {e}")
+
+    def refresh_in_background(self, store, stamp, llm):
+        """
+        Queue a refresh for the index identified by `stamp`. Reloads of the
+        same index version (the watcher, ingestion and startup can all ask
+        at once) join the refresh already queued instead of adding another.
+        """
+        with self._lock:
+            if self._pending is not None and self._pending[0] == stamp and not self._pending[1].done():
+                self.coalesced += 1
+                coalesced_total.inc(kind="catalog")
+                return self._pending[1]
+            future = self._executor.submit(self.refresh, store, stamp, llm)
+            self._pending = (stamp, future)
+            return future
+
+    def wait_idle(self, timeout=None):
+        """Block until the refreshes queued so far have finished."""
+        self._executor.submit(lambda: None).result(timeout)
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "etag": self.etag,
+            "categories": len(self.catalog["categories"]),
+            "extractions": self.extractions,
+            "failures": self.failures,
+            "coalesced": self.coalesced
+        }
+
+
+admission_catalog = AdmissionCatalog()
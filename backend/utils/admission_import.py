@@ -0,0 +1,243 @@
+import os
+import io
+import re
+import csv
+import json
+import time
+from datetime import datetime
+
+from utils.admissions_db import admissions_db, FORM_FIELDS
+from utils.email_outbox import email_outbox
+from utils.email_sender import build_confirmation_email
+
+# Rows inserted (and their confirmation emails queued) per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 50000))
+IMPORT_FORMATS = ("csv", "ndjson")
+
+REQUIRED_FIELDS = ("fullName", "course")
+MAX_FIELD_CHARS = 500
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+
+def _key(name):
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+# Header / key spellings accepted for each form field: fullName, full_name, "Full Name", ...
+FIELD_ALIASES = {
+    **{_key(column): field for column, field in FORM_FIELDS.items()},
+    **{_key(field): field for field in FORM_FIELDS.values()},
+    "name": "fullName",
+    "mobile": "phone",
+    "previouscollege": "prevCollege",
+    "submittedat": "submitted_at",
+    "date": "submitted_at",
+}
+
+
+def import_format(filename, content_type=None):
+    """csv or ndjson from the upload's name or content type; None if neither."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv" or "csv" in (content_type or ""):
+        return "csv"
+    if extension in (".ndjson", ".jsonl") or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return None
+
+
+def iter_records(fileobj, fmt):
+    """
+    Yield (row number, dict) from a binary file object, one row at a time;
+    row numbers count data rows from 1. An NDJSON line that isn't a JSON
+    object is yielded as (row number, error message).
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    try:
+        if fmt == "csv":
+            yield from enumerate(csv.DictReader(text), start=1)
+            return
+        row_number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, f"invalid JSON: {e}"
+                continue
+            yield row_number, record if isinstance(record, dict) else "each line must be a JSON object"
+    finally:
+        # Leave the upload's own file open for whoever owns it
+        text.detach()
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def validate_record(record, now):
+    """
+    Map a raw row onto the form fields and check it.
+    Returns (data, submitted_at, errors); errors is empty for a valid row.
+    """
+    data, errors = {}, []
+    submitted_at = None
+    for name, value in record.items():
+        field = FIELD_ALIASES.get(_key(name)) if name is not None else None
+        if field is None or value is None:
+            continue
+        value = str(value).strip()
+        if not value:
+            continue
+        if len(value) > MAX_FIELD_CHARS:
+            errors.append(f"{field} is longer than {MAX_FIELD_CHARS} characters")
+            continue
+        if field == "submitted_at":
+            submitted_at = value
+        else:
+            data[field] = value
+
+    for field in REQUIRED_FIELDS:
+        if not data.get(field):
+            errors.append(f"{field} is required")
+    if data.get("email") and not EMAIL_RE.fullmatch(data["email"]):
+        errors.append("email is not a valid address")
+    if data.get("phone"):
+        digits = re.sub(r"[\s\-+().]", "", data["phone"])
+        if not digits.isdigit() or not 7 <= len(digits) <= 15:
+            errors.append("phone must have 7 to 15 digits")
+    if data.get("marks"):
+        try:
+            marks = float(data["marks"].rstrip("%"))
+            if not 0 <= marks <= 100:
+                raise ValueError
+            data["marks"] = data["marks"].rstrip("%")
+        except ValueError:
+            errors.append("marks must be a number from 0 to 100")
+
+    if submitted_at is None:
+        submitted_at = now
+    else:
+        parsed = _parse_date(submitted_at)
+        if parsed is None:
+            errors.append("submitted_at is not a recognised date")
+        elif parsed.strftime("%Y-%m-%d %H:%M:%S") > now:
+            errors.append("submitted_at is in the future")
+        else:
+            submitted_at = parsed.strftime("%Y-%m-%d %H:%M:%S")
+    return data, submitted_at, errors
+
+
+class ImportReport:
+    """Per-row outcome of one import: imported (with its id), invalid or failed."""
+
+    def __init__(self):
+        self.results = []
+        self.imported = 0
+        self.invalid = 0
+        self.failed = 0
+        self.emails_queued = 0
+        self.truncated = False
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, row, status, **details):
+        self.results.append({"row": row, "status": status, **details})
+        if status == "imported":
+            self.imported += 1
+        elif status == "invalid":
+            self.invalid += 1
+        else:
+            self.failed += 1
+
+    def to_dict(self, errors_only=False):
+        rows = [r for r in self.results if r["status"] != "imported"] if errors_only else self.results
+        return {
+            "status": "success" if not (self.invalid or self.failed) else "partial",
+            "rows": len(self.results),
+            "imported": self.imported,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "emails_queued": self.emails_queued,
+            "truncated": self.truncated,
+            "seconds": round(self.seconds, 3),
+            "results": rows
+        }
+
+
+class AdmissionImporter:
+    """
+    Bulk import of admission forms from CSV or NDJSON (blocking; run via
+    run_io). The upload is read and validated row by row; valid rows are
+    inserted IMPORT_BATCH_SIZE at a time with executemany, each batch in
+    one transaction together with its summary counts and its queued
+    confirmation emails. The outbox sender then delivers the emails over
+    its one reused SMTP connection, so a 10k-row import costs a few dozen
+    transactions and no SMTP round-trips of its own.
+    """
+
+    def __init__(self, db=admissions_db, outbox=email_outbox, batch_size=IMPORT_BATCH_SIZE, max_rows=IMPORT_MAX_ROWS):
+        self.db = db
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+
+    def _flush(self, batch, report, send_emails):
+        try:
+            with self.db.pool.transaction() as conn:
+                ids = self.db.insert_admissions([(data, submitted_at) for _, data, submitted_at in batch], conn)
+                messages = [
+                    build_confirmation_email(data["email"], data.get("fullName"), data.get("course"),
+                                             application_id, submitted_at)
+                    for (_, data, submitted_at), application_id in zip(batch, ids) if data.get("email")
+                ] if send_emails else []
+                if messages:
+                    self.outbox.enqueue_many(messages, conn)
+        except Exception as e:
+            print(f"Admission import: batch of {len(batch)} rows failed: {e}")
+            for row, _, _ in batch:
+                report.add(row, "failed", errors=[str(e)])
+            return
+        report.emails_queued += len(messages)
+        for (row, _, _), application_id in zip(batch, ids):
+            report.add(row, "imported", application_id=application_id)
+
+    def run(self, fileobj, fmt, send_emails=True):
+        report = ImportReport()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        batch = []
+        try:
+            for row, record in iter_records(fileobj, fmt):
+                if row > self.max_rows:
+                    report.truncated = True
+                    break
+                if isinstance(record, str):
+                    report.add(row, "invalid", errors=[record])
+                    continue
+                data, submitted_at, errors = validate_record(record, now)
+                if errors:
+                    report.add(row, "invalid", errors=errors)
+                    continue
+                batch.append((row, data, submitted_at))
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, report, send_emails)
+                    batch = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            # The rest of the file can't be read reliably; keep what was imported
+            report.add(len(report.results) + len(batch) + 1, "invalid", errors=[f"unreadable file: {e}"])
+        if batch:
+            self._flush(batch, report, send_emails)
+        report.results.sort(key=lambda r: r["row"])
+        report.seconds = time.perf_counter() - report.started
+        return report
+
+
+admission_importer = AdmissionImporter()
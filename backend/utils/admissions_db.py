@@ -0,0 +1,421 @@
+import os
+import io
+import csv
+import json
+import queue
+import base64
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ADMISSIONS_DB = os.getenv("ADMISSIONS_DB", os.path.join("database", "admissions.db"))
+ADMISSIONS_POOL_SIZE = int(os.getenv("ADMISSIONS_POOL_SIZE", 4))
+ADMISSIONS_PAGE_SIZE = int(os.getenv("ADMISSIONS_PAGE_SIZE", 50))
+ADMISSIONS_MAX_PAGE_SIZE = int(os.getenv("ADMISSIONS_MAX_PAGE_SIZE", 500))
+# Rows fetched per query while streaming an export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+# Longest day range /admissions/analytics will return
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", 366))
+
+# Table column -> field name used by the admission form
+FORM_FIELDS = {
+    "full_name": "fullName",
+    "email": "email",
+    "phone": "phone",
+    "category": "category",
+    "course": "course",
+    "address": "address",
+    "marks": "marks",
+    "prev_college": "prevCollege",
+}
+EXPORT_COLUMNS = ["id", *FORM_FIELDS, "submitted_at"]
+
+INDEXES = [
+    # Keyset pagination walks (submitted_at, id) newest first
+    "CREATE INDEX IF NOT EXISTS idx_admissions_submitted_at ON admissions(submitted_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_admissions_course ON admissions(course, submitted_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_admissions_email ON admissions(email COLLATE NOCASE)",
+]
+
+# Dashboard summaries, kept current by every insert (see _count_admissions): counts by
+# course and category (dimension 'all' holds the grand total) and by hour of submission
+SUMMARY_TABLES = {
+    "admission_counts": '''CREATE TABLE IF NOT EXISTS admission_counts
+                           (dimension TEXT NOT NULL, value TEXT NOT NULL, count INTEGER NOT NULL,
+                            PRIMARY KEY (dimension, value)) WITHOUT ROWID''',
+    "admission_hourly_counts": '''CREATE TABLE IF NOT EXISTS admission_hourly_counts
+                                  (hour TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID''',
+}
+COUNT_DIMENSIONS = ("course", "category")
+
+
+class ConnectionPool:
+    """
+    A small pool of SQLite connections in WAL mode, shared by the threads
+    that run blocking DB calls (run_io). Readers never wait on the writer
+    and nobody pays for a fresh connect() per request.
+    """
+
+    def __init__(self, path, size=ADMISSIONS_POOL_SIZE, timeout=10):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """A connection inside BEGIN IMMEDIATE ... COMMIT (rolled back on error)."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+    def stats(self):
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
+
+
+def encode_cursor(submitted_at, row_id):
+    raw = json.dumps([submitted_at, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        submitted_at, row_id = json.loads(raw)
+        if not isinstance(submitted_at, str) or not isinstance(row_id, int):
+            raise ValueError
+        return submitted_at, row_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _where(filters, after=None):
+    """WHERE clause + params for the supported filters and an optional keyset position."""
+    clauses, params = [], []
+    if filters.get("course"):
+        clauses.append("course = ?")
+        params.append(filters["course"])
+    if filters.get("category"):
+        clauses.append("category = ?")
+        params.append(filters["category"])
+    if filters.get("email"):
+        clauses.append("email = ? COLLATE NOCASE")
+        params.append(filters["email"].strip())
+    if filters.get("since"):
+        clauses.append("submitted_at >= ?")
+        params.append(filters["since"])
+    if filters.get("until"):
+        clauses.append("submitted_at <= ?")
+        params.append(filters["until"])
+    if filters.get("q"):
+        clauses.append("full_name LIKE ?")
+        params.append(f"%{filters['q']}%")
+    if after is not None:
+        clauses.append("(submitted_at, id) < (?, ?)")
+        params.extend(after)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class AdmissionsDB:
+    """Data access for the admissions table."""
+
+    def __init__(self, path=ADMISSIONS_DB, pool_size=ADMISSIONS_POOL_SIZE):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+
+    def init_db(self):
+        with self.pool.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS admissions
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                             full_name TEXT,
+                             email TEXT,
+                             phone TEXT,
+                             category TEXT,
+                             course TEXT,
+                             address TEXT,
+                             marks TEXT,
+                             prev_college TEXT,
+                             submitted_at TEXT)''')
+
+            # Add columns missing from tables created by older versions
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(admissions)")}
+            for col in [*FORM_FIELDS, "submitted_at"]:
+                if col not in columns:
+                    try:
+                        conn.execute(f"ALTER TABLE admissions ADD COLUMN {col} TEXT")
+                        print(f"Migration: Added missing column {col} to admissions table")
+                    except Exception as e:
+                        print(f"Migration Error: {e}")
+
+            # NULLs would fall outside the keyset ordering
+            conn.execute("UPDATE admissions SET submitted_at = '' WHERE submitted_at IS NULL")
+            for statement in INDEXES:
+                conn.execute(statement)
+
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for statement in SUMMARY_TABLES.values():
+                conn.execute(statement)
+        if not set(SUMMARY_TABLES) <= existing:
+            # First start with the summary tables: fill them from the rows already stored
+            rows = self.rebuild_analytics()
+            if rows:
+                print(f"Migration: built admission analytics from {rows} rows")
+
+    def insert_admission(self, data, submitted_at, conn=None):
+        """
+        Insert one admission row, count it in the summary tables and return
+        its id; pass `conn` to join the caller's transaction.
+        """
+        if conn is None:
+            with self.pool.transaction() as own_conn:
+                return self.insert_admission(data, submitted_at, conn=own_conn)
+        values = [data.get(field) for field in FORM_FIELDS.values()]
+        sql = (f"INSERT INTO admissions ({', '.join(FORM_FIELDS)}, submitted_at) "
+               f"VALUES ({', '.join('?' * (len(FORM_FIELDS) + 1))})")
+        row_id = conn.execute(sql, (*values, submitted_at)).lastrowid
+        _count_admissions(conn, [(data.get("course"), data.get("category"), submitted_at)])
+        return row_id
+
+    def insert_admissions(self, rows, conn):
+        """
+        Insert many (data, submitted_at) pairs with one executemany inside the
+        caller's transaction, count them in the summary tables and return
+        their ids in order.
+        """
+        if not rows:
+            return []
+        sql = (f"INSERT INTO admissions ({', '.join(FORM_FIELDS)}, submitted_at) "
+               f"VALUES ({', '.join('?' * (len(FORM_FIELDS) + 1))})")
+        conn.executemany(sql, [(*(data.get(field) for field in FORM_FIELDS.values()), submitted_at)
+                               for data, submitted_at in rows])
+        # The transaction holds the write lock, so AUTOINCREMENT handed out a contiguous block
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        _count_admissions(conn, [(data.get("course"), data.get("category"), submitted_at)
+                                 for data, submitted_at in rows])
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def list_admissions(self, limit=ADMISSIONS_PAGE_SIZE, cursor=None, **filters):
+        """
+        One page of admissions, newest first. Pages are keyed on the last
+        (submitted_at, id) seen rather than an OFFSET, so every page is an
+        index range scan no matter how deep it is.
+        Returns {"items": [...], "next_cursor": str | None}.
+        """
+        limit = max(1, min(int(limit), ADMISSIONS_MAX_PAGE_SIZE))
+        after = decode_cursor(cursor) if cursor else None
+        where, params = _where(filters, after)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM admissions{where} ORDER BY submitted_at DESC, id DESC LIMIT ?",
+                (*params, limit + 1)).fetchall()
+
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last["submitted_at"], last["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    def iter_admissions(self, batch_size=EXPORT_BATCH_SIZE, **filters):
+        """
+        Yield every matching row, newest first, one keyset page at a time.
+        A pooled connection is only held for each page query, so a slow
+        export download never pins a connection or the whole table in memory.
+        """
+        after = None
+        while True:
+            where, params = _where(filters, after)
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    f"SELECT * FROM admissions{where} ORDER BY submitted_at DESC, id DESC LIMIT ?",
+                    (*params, batch_size)).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]["submitted_at"], rows[-1]["id"])
+
+    def export_csv(self, **filters):
+        """CSV export as a stream of text blocks (header first)."""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        pending = 0
+        for row in self.iter_admissions(**filters):
+            writer.writerow(row)
+            pending += 1
+            if pending >= EXPORT_BATCH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue()
+
+    def export_ndjson(self, **filters):
+        """NDJSON export: one JSON object per line."""
+        lines = []
+        for row in self.iter_admissions(**filters):
+            lines.append(json.dumps(row, ensure_ascii=False))
+            if len(lines) >= EXPORT_BATCH_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    def count(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM admissions").fetchone()[0]
+
+    def analytics(self, days=30, now=None):
+        """
+        Dashboard numbers read from the summary tables, so the cost grows with
+        the number of courses, categories and hours shown rather than with
+        the rows: totals by course and category, submissions per day for the
+        last `days` days and recent rates.
+        """
+        days = max(1, min(int(days), ANALYTICS_MAX_DAYS))
+        now = now or datetime.now()
+        this_hour = now.strftime("%Y-%m-%d %H")
+        first_day = (now - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        since_24h = (now - timedelta(hours=23)).strftime("%Y-%m-%d %H")
+        since_7d = (now - timedelta(hours=7 * 24 - 1)).strftime("%Y-%m-%d %H")
+
+        with self.pool.connection() as conn:
+            # One read transaction so the numbers agree with each other
+            conn.execute("BEGIN")
+            counts = conn.execute(
+                "SELECT dimension, value, count FROM admission_counts WHERE count > 0 "
+                "ORDER BY count DESC, value").fetchall()
+            by_day = conn.execute(
+                "SELECT substr(hour, 1, 10) AS day, SUM(count) FROM admission_hourly_counts "
+                "WHERE hour >= ? GROUP BY day ORDER BY day", (first_day,)).fetchall()
+            recent = conn.execute(
+                "SELECT COALESCE(SUM(CASE WHEN hour = ? THEN count END), 0), "
+                "COALESCE(SUM(CASE WHEN hour >= ? THEN count END), 0), "
+                "COALESCE(SUM(count), 0) FROM admission_hourly_counts WHERE hour >= ?",
+                (this_hour, since_24h, since_7d)).fetchone()
+            conn.execute("COMMIT")
+
+        total = 0
+        grouped = {dimension: [] for dimension in COUNT_DIMENSIONS}
+        for dimension, value, count in counts:
+            if dimension == "all":
+                total = count
+            else:
+                grouped[dimension].append({dimension: value or None, "count": count})
+        return {
+            "total": total,
+            "by_course": grouped["course"],
+            "by_category": grouped["category"],
+            "by_day": [{"day": day, "count": count} for day, count in by_day],
+            "recent": {
+                "this_hour": recent[0],
+                "last_24h": recent[1],
+                "last_7d": recent[2],
+                "per_hour_24h": round(recent[1] / 24, 2),
+                "per_day_7d": round(recent[2] / 7, 2)
+            },
+            "generated_at": now.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def rebuild_analytics(self):
+        """Recompute the summary tables from the admissions rows; returns the number of rows counted."""
+        with self.pool.transaction() as conn:
+            for table in SUMMARY_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("INSERT INTO admission_counts (dimension, value, count) "
+                         "SELECT 'all', '', COUNT(*) FROM admissions")
+            for dimension in COUNT_DIMENSIONS:
+                conn.execute(f"INSERT INTO admission_counts (dimension, value, count) "
+                             f"SELECT '{dimension}', COALESCE({dimension}, ''), COUNT(*) FROM admissions "
+                             f"GROUP BY COALESCE({dimension}, '')")
+            conn.execute("INSERT INTO admission_hourly_counts (hour, count) "
+                         "SELECT substr(submitted_at, 1, 13), COUNT(*) FROM admissions "
+                         "GROUP BY substr(submitted_at, 1, 13)")
+            return conn.execute("SELECT count FROM admission_counts WHERE dimension = 'all'").fetchone()[0]
+
+
+def _count_admissions(conn, rows):
+    """Add (course, category, submitted_at) rows to the summary tables inside the caller's transaction."""
+    counts = Counter()
+    hours = Counter()
+    for course, category, submitted_at in rows:
+        counts["all", ""] += 1
+        counts["course", course or ""] += 1
+        counts["category", category or ""] += 1
+        hours[(submitted_at or "")[:13]] += 1
+    conn.executemany(
+        "INSERT INTO admission_counts (dimension, value, count) VALUES (?, ?, ?) "
+        "ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count",
+        [(dimension, value, count) for (dimension, value), count in counts.items()])
+    conn.executemany(
+        "INSERT INTO admission_hourly_counts (hour, count) VALUES (?, ?) "
+        "ON CONFLICT (hour) DO UPDATE SET count = count + excluded.count",
+        list(hours.items()))
+
+
+admissions_db = AdmissionsDB()
+
+
+if __name__ == "__main__":
+    # python -m utils.admissions_db rebuild-analytics   (from backend/)
+    import argparse
+    parser = argparse.ArgumentParser(description="Admissions database maintenance")
+    parser.add_argument("command", choices=["rebuild-analytics"],
+                        help="rebuild-analytics: recompute the dashboard summary tables from the admissions rows")
+    parser.add_argument("--db", default=ADMISSIONS_DB, help="database file (default: ADMISSIONS_DB)")
+    args = parser.parse_args()
+    db = AdmissionsDB(args.db)
+    db.init_db()
+    print(f"Rebuilt admission analytics from {db.rebuild_analytics()} rows")
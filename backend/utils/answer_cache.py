@@ -0,0 +1,149 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+# Minimum cosine similarity for a cached answer to be reused for a new query
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants match."""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class AnswerCache:
+    """
+    Two-tier cache of LLM answers for first-turn /chat questions.
+
+    - exact tier: keyed by the normalized query text
+    - semantic tier: reuses an answer whose query embedding is within
+      `threshold` cosine similarity of the new query
+
+    Entries are evicted LRU once `max_entries` is reached and expire after
+    `ttl` seconds. Every entry belongs to a knowledge-base version; calling
+    invalidate() bumps the version and drops everything, and answers computed
+    against an older version are never stored.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.kb_version = 0
+        self._entries = OrderedDict()  # normalized query -> (answer, slot, created_at)
+        # Unit embeddings by slot, so a semantic lookup is one matmul over the whole cache
+        self._matrix = None
+        self._created = np.zeros(max_entries)
+        self._occupied = np.zeros(max_entries, dtype=bool)
+        self._slot_keys = [None] * max_entries
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl
+
+    def _remove(self, key):
+        _, slot, _ = self._entries.pop(key)
+        self._occupied[slot] = False
+        self._slot_keys[slot] = None
+
+    def _free_slot(self, key):
+        """Slot for `key`: its current one, a free one, or the least recently used entry's."""
+        if key in self._entries:
+            return self._entries[key][1]
+        if len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return int(np.argmin(self._occupied))
+
+    def get_exact(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[2]):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[0]
+
+    def get_semantic(self, embedding):
+        """Return the closest cached answer above the threshold, counting a miss otherwise."""
+        vector = _unit(embedding)
+        with self._lock:
+            if not self._entries or self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            live = self._occupied & (self._created >= time.time() - self.ttl)
+            for slot in np.flatnonzero(self._occupied & ~live):
+                self._remove(self._slot_keys[slot])
+            scores = self._matrix @ vector
+            scores[~live] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            best_key = self._slot_keys[best]
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key][0]
+
+    def put(self, query, embedding, answer, kb_version):
+        vector = _unit(embedding)
+        with self._lock:
+            if kb_version != self.kb_version or self.max_entries <= 0:
+                # The knowledge base changed while this answer was being generated
+                return
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed: start over at the new width
+                self._entries.clear()
+                self._occupied[:] = False
+                self._slot_keys = [None] * self.max_entries
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            key = normalize_query(query)
+            slot = self._free_slot(key)
+            now = time.time()
+            self._matrix[slot] = vector
+            self._created[slot] = now
+            self._occupied[slot] = True
+            self._slot_keys[slot] = key
+            self._entries[key] = (answer, slot, now)
+            self._entries.move_to_end(key)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._occupied[:] = False
+            self._slot_keys = [None] * self.max_entries
+            self.kb_version += 1
+        print(f"Answer cache invalidated (kb version {self.kb_version})")
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "kb_version": self.kb_version,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0
+        }
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+answer_cache = AnswerCache()
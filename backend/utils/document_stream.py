@@ -0,0 +1,134 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pages are parsed and split in worker processes (text extraction is pure
+# Python and holds the GIL); 0 or 1 parses inline in the ingestion thread
+INGEST_PARSE_PROCESSES = int(os.getenv("INGEST_PARSE_PROCESSES", min(4, os.cpu_count() or 1)))
+# Each task reopens the PDF, so tasks cover several pages
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", 16))
+# Plain text is split in blocks of about this many characters, cut at paragraph breaks
+TEXT_BLOCK_CHARS = int(os.getenv("TEXT_BLOCK_CHARS", 20000))
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 100
+
+_parse_pool = None
+_text_splitter = None
+
+
+def _report(progress, stage, **counters):
+    if progress is not None:
+        progress(stage, **counters)
+
+
+def split_documents(documents):
+    global _text_splitter
+    if _text_splitter is None:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        _text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return _text_splitter.split_documents(documents)
+
+
+def parse_pdf_pages(path, first, last):
+    """Extract and split pages [first, last) of a PDF; runs in a worker process."""
+    from pypdf import PdfReader
+    from langchain_core.documents import Document
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    labels = reader.page_labels
+    pages = [
+        Document(page_content=reader.pages[i].extract_text().strip(),
+                 metadata={"source": path, "page": i, "page_label": labels[i], "total_pages": total})
+        for i in range(first, min(last, total))
+    ]
+    return split_documents(pages)
+
+
+def get_parse_pool():
+    """
+    Process pool shared by all ingestion jobs, started on first use. Workers
+    are spawned rather than forked: the API process runs threads (and
+    possibly a loaded model) that a fork would copy in an unusable state.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=INGEST_PARSE_PROCESSES,
+                                          mp_context=multiprocessing.get_context("spawn"))
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+def iter_pdf_chunks(path, progress=None):
+    """
+    Yield the chunks of a PDF in page order while later pages are still being
+    parsed. At most two tasks per worker are in flight, so memory holds a
+    few dozen pages regardless of the document's length.
+    """
+    from pypdf import PdfReader
+    total = len(PdfReader(path).pages)
+    ranges = [(first, first + INGEST_PAGES_PER_TASK) for first in range(0, total, INGEST_PAGES_PER_TASK)]
+    _report(progress, "load", pages_parsed=0, pages_total=total)
+
+    if INGEST_PARSE_PROCESSES <= 1 or len(ranges) == 1:
+        for first, last in ranges:
+            chunks = parse_pdf_pages(path, first, last)
+            _report(progress, "load", pages_parsed=min(last, total))
+            yield from chunks
+        return
+
+    pool = get_parse_pool()
+    window = deque()
+    pending = iter(ranges)
+    try:
+        for first, last in pending:
+            window.append((last, pool.submit(parse_pdf_pages, path, first, last)))
+            if len(window) >= INGEST_PARSE_PROCESSES * 2:
+                break
+        while window:
+            last, future = window.popleft()
+            chunks = future.result()
+            next_range = next(pending, None)
+            if next_range is not None:
+                window.append((next_range[1], pool.submit(parse_pdf_pages, path, *next_range)))
+            _report(progress, "load", pages_parsed=min(last, total))
+            yield from chunks
+    except BrokenProcessPool:
+        # A worker died (out of memory, crashed parser); start a fresh pool for the next job
+        shutdown_parse_pool()
+        raise
+    finally:
+        for _, future in window:
+            future.cancel()
+
+
+def iter_text_chunks(path, progress=None):
+    """Yield the chunks of a plain-text file, reading it a block at a time."""
+    from langchain_core.documents import Document
+    block, size, blocks = [], 0, 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= TEXT_BLOCK_CHARS and not line.strip():
+                blocks += 1
+                _report(progress, "load", pages_parsed=blocks)
+                yield from split_documents([Document(page_content="".join(block), metadata={"source": path})])
+                block, size = [], 0
+    if block:
+        _report(progress, "load", pages_parsed=blocks + 1)
+        yield from split_documents([Document(page_content="".join(block), metadata={"source": path})])
+
+
+def iter_loader_chunks(loader, progress=None):
+    """Yield chunks from any LangChain loader, splitting each document as it is loaded."""
+    for pages, document in enumerate(loader.lazy_load(), start=1):
+        _report(progress, "load", pages_parsed=pages)
+        yield from split_documents([document])
@@ -0,0 +1,272 @@
+import os
+import time
+import random
+import asyncio
+import smtplib
+from collections import deque
+
+from utils.admissions_db import admissions_db
+from utils.email_sender import SMTPSession, email_configured
+from utils.scheduler import run_io
+from utils.tracing import observe_stage
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", 10))  # seconds, doubled per attempt
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", 3600))
+# Close the SMTP connection after this long without mail to send
+OUTBOX_IDLE_CLOSE = float(os.getenv("OUTBOX_IDLE_CLOSE", 60))
+# Rows left in 'sending' longer than this (a worker died mid-batch) are retried
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", 300))
+# Sent rows are deleted after this many days (0 = keep them), checked every OUTBOX_PURGE_INTERVAL seconds
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", 30))
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", 3600))
+PURGE_BATCH = 5000
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = min(OUTBOX_RETRY_BASE * (2 ** (attempts - 1)), OUTBOX_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_permanent(error):
+    """5xx replies and refused recipients won't succeed on retry."""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+        return True
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600 and not isinstance(error, smtplib.SMTPAuthenticationError)
+
+
+class EmailOutbox:
+    """
+    Outgoing mail queued as rows in the admissions database and delivered
+    by a background task. Submissions only pay for an INSERT; the sender
+    drains due rows in batches over one reused SMTP connection and
+    reschedules failures with exponential backoff, so a transient SMTP
+    outage delays confirmations instead of losing them.
+
+    Rows are claimed with a single UPDATE ... RETURNING, so several uvicorn
+    workers can run senders against the same database without sending a
+    message twice.
+    """
+
+    def __init__(self, db=admissions_db, session_factory=SMTPSession):
+        self.db = db
+        self.session_factory = session_factory
+        self._session = None
+        self._last_used = 0.0
+        self._wakeup = None
+        self._loop = None
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.purged = 0
+        self._last_purge = 0.0
+        self.latencies_ms = deque(maxlen=500)  # enqueue -> delivered
+        self.send_ms = deque(maxlen=500)       # SMTP time per message
+
+    def init_db(self):
+        with self.db.pool.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS email_outbox
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                             recipient TEXT NOT NULL,
+                             sender TEXT NOT NULL,
+                             subject TEXT,
+                             message TEXT NOT NULL,
+                             status TEXT NOT NULL DEFAULT 'pending',
+                             attempts INTEGER NOT NULL DEFAULT 0,
+                             created_at REAL NOT NULL,
+                             next_attempt_at REAL NOT NULL,
+                             claimed_at REAL,
+                             sent_at REAL,
+                             last_error TEXT)''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox(status, next_attempt_at)")
+
+    def enqueue(self, msg, conn=None):
+        """
+        Queue a MIME message. Pass `conn` to enqueue inside the caller's
+        transaction (e.g. together with the admission row it confirms).
+        """
+        now = time.time()
+        row = (msg['To'], msg['From'], msg['Subject'], msg.as_string(), now, now)
+        sql = '''INSERT INTO email_outbox (recipient, sender, subject, message, created_at, next_attempt_at)
+                 VALUES (?, ?, ?, ?, ?, ?)'''
+        if conn is not None:
+            return conn.execute(sql, row).lastrowid
+        with self.db.pool.connection() as own_conn:
+            return own_conn.execute(sql, row).lastrowid
+
+    def enqueue_many(self, msgs, conn):
+        """Queue several MIME messages with one executemany inside the caller's transaction."""
+        now = time.time()
+        conn.executemany(
+            '''INSERT INTO email_outbox (recipient, sender, subject, message, created_at, next_attempt_at)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            [(msg['To'], msg['From'], msg['Subject'], msg.as_string(), now, now) for msg in msgs])
+        return len(msgs)
+
+    def wake(self):
+        """Nudge the sender to look at the queue now; safe to call from any thread."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self, limit):
+        now = time.time()
+        with self.db.pool.transaction() as conn:
+            conn.execute(
+                "UPDATE email_outbox SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+                (now - OUTBOX_CLAIM_TIMEOUT,))
+            return conn.execute(
+                '''UPDATE email_outbox SET status = 'sending', claimed_at = ?
+                   WHERE id IN (SELECT id FROM email_outbox
+                                WHERE status = 'pending' AND next_attempt_at <= ?
+                                ORDER BY next_attempt_at LIMIT ?)
+                   RETURNING id, recipient, sender, message, attempts, created_at''',
+                (now, now, limit)).fetchall()
+
+    def _deliver(self, rows):
+        """Send a claimed batch over the shared connection (blocking, runs via run_io)."""
+        if self._session is None:
+            self._session = self.session_factory()
+        results, deferred = [], []
+        for position, row in enumerate(rows):
+            started = time.perf_counter()
+            try:
+                self._session.send(row["sender"], [row["recipient"]], row["message"])
+                elapsed = time.perf_counter() - started
+                self.send_ms.append(elapsed * 1000)
+                observe_stage("smtp_send", elapsed)
+                results.append((row, None))
+            except Exception as e:
+                results.append((row, e))
+                if not is_permanent(e):
+                    # Server trouble: don't hammer it with the rest of the batch
+                    self._session.close()
+                    deferred = rows[position + 1:]
+                    break
+        self._last_used = time.time()
+
+        now = time.time()
+        with self.db.pool.transaction() as conn:
+            # Not attempted, so no attempt is counted, but they wait out the backoff too
+            for row in deferred:
+                conn.execute("UPDATE email_outbox SET status = 'pending', next_attempt_at = ? WHERE id = ?",
+                             (now + retry_delay(1), row["id"]))
+            for row, error in results:
+                if error is None:
+                    conn.execute("UPDATE email_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                                 (now, row["id"]))
+                    self.delivered += 1
+                    self.latencies_ms.append((now - row["created_at"]) * 1000)
+                    continue
+                attempts = row["attempts"] + 1
+                if is_permanent(error) or attempts >= OUTBOX_MAX_ATTEMPTS:
+                    conn.execute("UPDATE email_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                                 (attempts, str(error), row["id"]))
+                    self.failed += 1
+                    print(f"Email to {row['recipient']} failed permanently after {attempts} attempt(s): {error}")
+                else:
+                    conn.execute(
+                        '''UPDATE email_outbox SET status = 'pending', attempts = ?, last_error = ?,
+                                                   next_attempt_at = ? WHERE id = ?''',
+                        (attempts, str(error), now + retry_delay(attempts), row["id"]))
+                    self.retried += 1
+                    print(f"Email to {row['recipient']} failed (attempt {attempts}), will retry: {error}")
+        return len(rows)
+
+    def _close_idle(self):
+        if self._session is not None and self._session.connected and time.time() - self._last_used > OUTBOX_IDLE_CLOSE:
+            self._session.close()
+
+    def purge_sent(self, retention_days=OUTBOX_RETENTION_DAYS):
+        """Delete sent rows older than the retention period, a batch per transaction; returns how many."""
+        if retention_days <= 0:
+            return 0
+        cutoff = time.time() - retention_days * 86400
+        removed = 0
+        while True:
+            with self.db.pool.transaction() as conn:
+                deleted = conn.execute(
+                    '''DELETE FROM email_outbox WHERE id IN (SELECT id FROM email_outbox
+                                                         WHERE status = 'sent' AND sent_at < ? LIMIT ?)''',
+                    (cutoff, PURGE_BATCH)).rowcount
+            removed += deleted
+            if deleted < PURGE_BATCH:
+                break
+        self.purged += removed
+        return removed
+
+    def _purge_if_due(self):
+        if time.time() - self._last_purge < OUTBOX_PURGE_INTERVAL:
+            return
+        self._last_purge = time.time()
+        removed = self.purge_sent()
+        if removed:
+            print(f"Email outbox: purged {removed} sent emails older than {OUTBOX_RETENTION_DAYS:g} days")
+
+    def drain_once(self, limit=OUTBOX_BATCH_SIZE):
+        """Claim and deliver one batch (blocking); returns the number of rows handled."""
+        rows = self._claim(limit)
+        if not rows:
+            return 0
+        self.batches += 1
+        return self._deliver(rows)
+
+    async def run(self):
+        """Background sender; started from the app lifespan."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if not email_configured():
+            print("Email outbox: EMAIL_USER/EMAIL_PASS not set, confirmations stay queued")
+            return
+        try:
+            while True:
+                try:
+                    handled = await run_io(self.drain_once)
+                except Exception as e:
+                    print(f"Email outbox error: {e}")
+                    handled = 0
+                if handled:
+                    # More may be due right away
+                    continue
+                await run_io(self._close_idle)
+                try:
+                    await run_io(self._purge_if_due)
+                except Exception as e:
+                    print(f"Email outbox purge error: {e}")
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._session is not None:
+                self._session.close()
+
+    def stats(self):
+        with self.db.pool.connection() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM email_outbox GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(created_at) FROM email_outbox WHERE status = 'pending'").fetchone()[0]
+        latencies = sorted(self.latencies_ms)
+        return {
+            "queue_depth": counts.get("pending", 0) + counts.get("sending", 0),
+            "by_status": counts,
+            "oldest_pending_age_s": round(time.time() - oldest, 1) if oldest else 0,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "purged": self.purged,
+            "smtp_connects": self._session.connects if self._session is not None else 0,
+            "delivery_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies), 1) if latencies else 0,
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1) if latencies else 0,
+            },
+            "avg_send_ms": round(sum(self.send_ms) / len(self.send_ms), 1) if self.send_ms else 0,
+        }
+
+
+email_outbox = EmailOutbox()
@@ -1,49 +1,42 @@
 import smtplib
+import html
+import string
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from dotenv import load_dotenv
 
+from utils.tracing import timed
+
 # Load environment variables
 env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
 load_dotenv(dotenv_path=env_path)
 
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+# Set to 0 for a local SMTP stand-in (e.g. aiosmtpd) that doesn't speak TLS
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 20))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
-def send_confirmation_email(student_email, student_name, course_name, application_id="N/A", submission_date=None):
-    if not EMAIL_USER or not EMAIL_PASS:
-        print("Error: EMAIL_USER or EMAIL_PASS missing in .env")
-        return False
-
-    if not submission_date:
-        from datetime import datetime
-        submission_date = datetime.now().strftime("%d %b %Y, %I:%M %p")
-
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = f"MIET Admissions Support <{EMAIL_USER}>"
-        msg['To'] = student_email
-        msg['Subject'] = f"Application Received: {course_name} (ID: {application_id})"
-
-        html = f"""
+# Compiled once; only the escaped per-student values are substituted per email
+CONFIRMATION_TEMPLATE = string.Template("""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; background-color: #f4f7f6; padding: 20px;">
             <div style="max-width: 500px; margin: 0 auto; background: #ffffff; border: 1px solid #e1e8f0; border-radius: 12px; padding: 30px; box-shadow: 0 2px 4px rgba(0,0,0,0.05);">
                 <h2 style="color: #003366; margin-top: 0; border-bottom: 2px solid #003366; padding-bottom: 10px;">Application Received</h2>
-                
-                <p>Dear <strong>{student_name}</strong>,</p>
-                <p>Thank you for choosing <strong>M.I.E.T.Arts & Science College</strong>. Your admission form for <strong>{course_name}</strong> has been successfully submitted.</p>
-                
+
+                <p>Dear <strong>$student_name</strong>,</p>
+                <p>Thank you for choosing <strong>M.I.E.T.Arts & Science College</strong>. Your admission form for <strong>$course_name</strong> has been successfully submitted.</p>
+
                 <div style="background: #f8fafc; padding: 20px; border-radius: 8px; margin: 25px 0; border: 1px solid #edf2f7;">
-                    <p style="margin: 5px 0; color: #4a5568;"><strong>Application ID:</strong> #MIET-{application_id}</p>
-                    <p style="margin: 5px 0; color: #4a5568;"><strong>Submitted Date:</strong> {submission_date}</p>
+                    <p style="margin: 5px 0; color: #4a5568;"><strong>Application ID:</strong> #MIET-$application_id</p>
+                    <p style="margin: 5px 0; color: #4a5568;"><strong>Submitted Date:</strong> $submission_date</p>
                 </div>
-                
+
                 <p>Our admissions team will review your details and contact you within 2-3 business days regarding the next steps.</p>
-                
+
                 <div style="margin-top: 35px; border-top: 1px solid #edf2f7; padding-top: 20px;">
                     <p style="margin: 0; font-size: 0.95em; color: #2d3748;">Best regards,</p>
                     <p style="margin: 5px 0; font-weight: bold; color: #003366;">MIET Admissions Support Team</p>
@@ -54,14 +47,107 @@ def send_confirmation_email(student_email, student_name, course_name, applicatio
             </div>
         </body>
         </html>
-        """
-        msg.attach(MIMEText(html, 'html'))
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.send_message(msg)
-        
+        """)
+
+
+def email_configured():
+    # A local relay without TLS (SMTP_STARTTLS=0) is used without logging in
+    return bool(EMAIL_USER and (EMAIL_PASS or not SMTP_STARTTLS))
+
+
+def build_confirmation_email(student_email, student_name, course_name, application_id="N/A", submission_date=None):
+    """The confirmation message as a MIME object, ready to send or queue."""
+    if not submission_date:
+        from datetime import datetime
+        submission_date = datetime.now().strftime("%d %b %Y, %I:%M %p")
+
+    msg = MIMEMultipart()
+    msg['From'] = f"MIET Admissions Support <{EMAIL_USER}>"
+    msg['To'] = student_email
+    msg['Subject'] = f"Application Received: {course_name} (ID: {application_id})"
+    body = CONFIRMATION_TEMPLATE.substitute(
+        student_name=html.escape(str(student_name or "")),
+        course_name=html.escape(str(course_name or "")),
+        application_id=html.escape(str(application_id)),
+        submission_date=html.escape(str(submission_date))
+    )
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+class SMTPSession:
+    """
+    One authenticated SMTP connection reused across messages. The connection
+    is opened on first send and re-opened once if the server dropped it.
+    """
+
+    def __init__(self, server=SMTP_SERVER, port=SMTP_PORT, user=EMAIL_USER, password=EMAIL_PASS,
+                 starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._smtp = None
+        self.connects = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connects += 1
+
+    @property
+    def connected(self):
+        return self._smtp is not None
+
+    def send(self, from_addr, to_addrs, raw_message):
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.sendmail(from_addr, to_addrs, raw_message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.close()
+            self._connect()
+            self._smtp.sendmail(from_addr, to_addrs, raw_message)
+
+    def send_message(self, msg):
+        self.send(msg['From'], [msg['To']], msg.as_string())
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def send_confirmation_email(student_email, student_name, course_name, application_id="N/A", submission_date=None):
+    """Send one confirmation right away over its own connection (the outbox is preferred)."""
+    if not email_configured():
+        print("Error: EMAIL_USER or EMAIL_PASS missing in .env")
+        return False
+
+    try:
+        msg = build_confirmation_email(student_email, student_name, course_name, application_id, submission_date)
+        with timed("smtp_send"), SMTPSession() as session:
+            session.send_message(msg)
+
         print(f"Professional confirmation email sent to {student_email} (ID: {application_id})")
         return True
     except Exception as e:
@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from utils.scheduler import run_cpu
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+# How long the first query in a batch waits for others to join it
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", 32))
+
+
+class EmbeddingService(Embeddings):
+    """
+    Process-wide embedding model shared by retrieval and ingestion.
+
+    The sentence-transformers model is loaded once, on first use. Query
+    embeddings are memoized in an LRU cache, and aembed_query() micro-batches
+    concurrent queries that arrive within EMBEDDING_BATCH_WINDOW_MS into a
+    single forward pass.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, cache_size=EMBEDDING_CACHE_SIZE,
+                 batch_window_ms=EMBEDDING_BATCH_WINDOW_MS, max_batch=EMBEDDING_MAX_BATCH):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending = []
+        self._flush_handle = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.max_batch_seen = 0
+        self.total_batch_ms = 0.0
+        self.documents_embedded = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    started = time.perf_counter()
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+                    print(f"Embedding model {self.model_name} loaded in {time.perf_counter() - started:.2f}s")
+        return self._model
+
+    def _cache_get(self, text):
+        with self._cache_lock:
+            vector = self._cache.get(text)
+            if vector is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(text)
+            self.cache_hits += 1
+            return vector
+
+    def _cache_put(self, text, vector):
+        with self._cache_lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts):
+        vectors = self.model.embed_documents(list(texts))
+        self.documents_embedded += len(vectors)
+        return vectors
+
+    def embed_query(self, text):
+        vector = self._cache_get(text)
+        if vector is None:
+            vector = self.model.embed_query(text)
+            self._cache_put(text, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        vector = self._cache_get(text)
+        if vector is not None:
+            return vector
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        started = time.perf_counter()
+        try:
+            vectors = await run_cpu(self.model.embed_documents, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.batched_queries += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.total_batch_ms += elapsed_ms
+
+        by_text = dict(zip(texts, vectors))
+        for text, vector in by_text.items():
+            self._cache_put(text, vector)
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "cache_entries": len(self._cache),
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0.0,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_queries / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_batch_ms": round(self.total_batch_ms / self.batches, 1) if self.batches else 0.0,
+            "documents_embedded": self.documents_embedded
+        }
+
+
+embedding_service = EmbeddingService()
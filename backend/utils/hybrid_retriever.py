@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.scheduler import run_cpu
+from utils.keyword_index import BM25Index
+
+VECTOR_K = int(os.getenv("VECTOR_K", 10))
+KEYWORD_K = int(os.getenv("KEYWORD_K", 10))
+# Chunks passed on to the prompt after fusion (and reranking)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 6))
+# L2 distance above which a vector-only hit is treated as irrelevant
+MAX_VECTOR_DISTANCE = float(os.getenv("MAX_VECTOR_DISTANCE", 1.65))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Optional CPU cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2 (empty = disabled)
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 150))
+# Seconds before a reranker model that failed to load is tried again
+RERANKER_RETRY_S = float(os.getenv("RERANKER_RETRY_S", 300))
+
+
+def doc_key(doc):
+    return doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked doc lists; a doc's score is the sum of 1 / (k + rank) over the lists it appears in."""
+    scores, docs = defaultdict(float), {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] += 1.0 / (k + rank + 1)
+    return [docs[key] for key, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
+
+
+class Reranker:
+    """
+    Lazily loaded cross-encoder; the model loads in the background on first
+    use. Scoring runs on its own thread, one batch at a time: a batch that
+    blows the budget can't be interrupted, so it finishes there without
+    holding a shared CPU worker, and requests that arrive meanwhile skip
+    reranking instead of queueing behind it.
+    """
+
+    def __init__(self, model_name=RERANKER_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._loading = False
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    @property
+    def enabled(self):
+        return bool(self.model_name)
+
+    def _load(self):
+        try:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name)
+            print(f"Reranker {self.model_name} loaded")
+        except Exception as e:
+            self._failed_at = time.monotonic()
+            print(f"Reranker {self.model_name} failed to load, retrying in {RERANKER_RETRY_S:.0f}s: {e}")
+        finally:
+            self._loading = False
+
+    def ready(self):
+        if self._model is not None:
+            return True
+        with self._lock:
+            retry_due = self._failed_at is None or time.monotonic() - self._failed_at >= RERANKER_RETRY_S
+            if not self._loading and retry_due:
+                self._loading = True
+                threading.Thread(target=self._load, daemon=True).start()
+        return False
+
+    def _score(self, query, docs):
+        try:
+            return self._model.predict([(query, doc.page_content) for doc in docs])
+        finally:
+            self._busy.release()
+
+    async def score(self, query, docs, budget_s):
+        """Scores for docs, or None if a previous batch is still running or this one is over budget."""
+        if not self._busy.acquire(blocking=False):
+            retrieval_stats.rerank_skipped += 1
+            return None
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._score, query, docs)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), budget_s)
+        except asyncio.TimeoutError:
+            retrieval_stats.rerank_timeouts += 1
+            return None
+
+
+class RetrievalStats:
+    def __init__(self):
+        self.queries = 0
+        self.totals_ms = defaultdict(float)
+        self.rerank_timeouts = 0
+        self.rerank_skipped = 0
+
+    def record(self, timings):
+        self.queries += 1
+        for stage, ms in timings.items():
+            self.totals_ms[stage] += ms
+
+    def to_dict(self):
+        return {
+            "queries": self.queries,
+            "avg_ms": {stage: round(total / self.queries, 2) for stage, total in self.totals_ms.items()} if self.queries else {},
+            "rerank_timeouts": self.rerank_timeouts,
+            "rerank_skipped": self.rerank_skipped
+        }
+
+
+reranker = Reranker()
+retrieval_stats = RetrievalStats()
+
+
+class HybridRetriever:
+    """FAISS + BM25 retrieval fused with reciprocal-rank fusion, optionally reranked."""
+
+    def __init__(self, store):
+        self.store = store
+        started = time.perf_counter()
+        self.keyword_index = BM25Index.from_store(store)
+        print(f"Keyword index opened over {self.keyword_index.doc_count} chunks in {time.perf_counter() - started:.2f}s")
+
+    def _vector_search(self, query_embedding):
+        hits = self.store.similarity_search_with_score_by_vector(query_embedding, VECTOR_K)
+        return [doc for doc, distance in hits if distance < MAX_VECTOR_DISTANCE]
+
+    def _keyword_search(self, query):
+        return [doc for doc, _ in self.keyword_index.search(query, KEYWORD_K)]
+
+    async def retrieve(self, query, query_embedding, top_k=RETRIEVAL_TOP_K):
+        """Returns (docs, per-stage timings in ms)."""
+        timings = {}
+
+        started = time.perf_counter()
+        vector_docs = await run_cpu(self._vector_search, query_embedding)
+        timings["vector_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        keyword_docs = await run_cpu(self._keyword_search, query)
+        timings["keyword_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        fused = reciprocal_rank_fusion([vector_docs, keyword_docs])
+        timings["fusion_ms"] = (time.perf_counter() - started) * 1000
+
+        if reranker.enabled and len(fused) > 1 and reranker.ready():
+            started = time.perf_counter()
+            candidates = fused[:top_k * 2]
+            scores = await reranker.score(query, candidates, RERANK_BUDGET_MS / 1000)
+            # Over budget or busy: keep the fused order rather than delay the answer
+            if scores is not None:
+                fused = [doc for _, doc in sorted(zip(scores, candidates), key=lambda pair: pair[0], reverse=True)]
+            timings["rerank_ms"] = (time.perf_counter() - started) * 1000
+
+        timings["total_ms"] = sum(timings.values())
+        retrieval_stats.record(timings)
+        return fused[:top_k], timings
@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+# Finished jobs kept around for the admin page to inspect
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", 50))
+# How long a reset waits for cancelled jobs to stop (a job already merging into the index finishes first)
+INGEST_CANCEL_TIMEOUT = float(os.getenv("INGEST_CANCEL_TIMEOUT", 60))
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class IngestionJob:
+    """State and per-stage progress of one knowledge-base ingestion."""
+
+    def __init__(self, kind, source):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.source = source
+        self.status = "queued"
+        self.stage = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._future = None
+
+    def report(self, stage, **counters):
+        """Progress callback passed to process_file/process_url."""
+        if self._cancel.is_set() and stage != "index":
+            raise JobCancelled(f"Job {self.id} cancelled during {stage}")
+        with self._lock:
+            self.stage = stage
+            self.progress.update(counters)
+
+    def raise_if_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def cancel(self):
+        self._cancel.set()
+
+    def to_dict(self):
+        with self._lock:
+            ended = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "source": self.source,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "elapsed_s": round(ended - self.started_at, 2) if self.started_at else 0.0
+            }
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs (load -> split -> embed -> index) on a small worker
+    pool so upload and crawl requests return a job id immediately.
+    """
+
+    def __init__(self, max_workers=INGEST_WORKERS, history=INGEST_JOB_HISTORY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.history = history
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, source, work, on_complete=None):
+        """
+        Queue `work(job)` and return the job. `on_complete(result)` runs on
+        the worker once `work` succeeds, before the job is marked completed.
+        """
+        job = IngestionJob(kind, source)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._trim()
+        job._future = self.executor.submit(self._run, job, work, on_complete)
+        return job
+
+    def _run(self, job, work, on_complete):
+        if job._cancel.is_set():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            result = work(job)
+            if on_complete is not None:
+                on_complete(result)
+            job.result = result
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+            print(f"Ingestion job {job.id} cancelled ({job.source})")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"Ingestion job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status in ACTIVE_STATES:
+            job.cancel()
+        return job
+
+    def cancel_active(self, kind=None):
+        """Cancel every queued or running job (of one kind, if given); returns them."""
+        cancelled = [job for job in list(self.jobs.values())
+                     if job.status in ACTIVE_STATES and (kind is None or job.kind == kind)]
+        for job in cancelled:
+            job.cancel()
+        return cancelled
+
+    def cancel_all(self, timeout=INGEST_CANCEL_TIMEOUT):
+        """
+        Cancel every active job and wait for them to stop (blocking). A job
+        that is already merging into the index ignores cancellation, so this
+        waits for it to finish rather than let it write after a reset.
+        """
+        futures = [job._future for job in self.cancel_active() if job._future is not None]
+        if futures:
+            _, pending = wait(futures, timeout=timeout)
+            if pending:
+                print(f"Ingestion: {len(pending)} cancelled job(s) still running after {timeout}s")
+
+
+ingestion_jobs = IngestionJobManager()
@@ -0,0 +1,231 @@
+import os
+import re
+import threading
+
+import numpy as np
+
+from utils.answer_cache import normalize_query
+from utils.metrics import registry
+
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"
+# Minimum cosine similarity to an intent centroid before the embedding stage routes a query
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", 0.5))
+# ...and how much closer it must be than the nearest college-question centroid
+INTENT_CENTROID_MARGIN = float(os.getenv("INTENT_CENTROID_MARGIN", 0.1))
+# Longer messages are never treated as small talk by the embedding stage
+SMALL_TALK_MAX_WORDS = 6
+
+QUESTION = "question"
+SMALL_TALK = ("greeting", "thanks", "goodbye", "acknowledgement")
+
+intents_total = registry.counter(
+    "helpdesk_intents_total", "Chat turns by detected intent and the stage that decided it", ["intent", "stage"])
+
+# Templated replies; everything else goes through retrieval and the LLM
+ANSWERS = {
+    "greeting": "Vanakam! 👋 I am your MIET AI Agent. I'm here to answer your questions about courses, admissions, fees, and campus life. Would you like to start your admission process today?",
+    "thanks": "You're welcome! 😊 Feel free to ask me anything else about courses, admissions, fees, or campus life.",
+    "goodbye": "Goodbye! 👋 All the best, and come back any time you have questions about MIET.",
+    "acknowledgement": "Great! Is there anything else you'd like to know about courses, admissions, fees, or campus life?",
+    "apply": "Wonderful! 🎓 Click the button below to open the admission form and start your application.\n\n[ADMISSION_BUTTON]",
+    "out_of_scope": "I'm the MIET Student Helpdesk, so I can only help with questions about M.I.E.T. Arts & Science College: courses, admissions, fees, facilities and campus life. What would you like to know?"
+}
+
+# Whole-message small talk: every word must belong to one of these phrases
+_SMALL_TALK_PHRASES = {
+    "goodbye": r"bye+(?: bye)?|good ?bye|good ?night|see (?:you|u|ya)(?: later| soon)?|take care|cya",
+    "thanks": r"thanks?(?: you)?|thank u|thanku|thx|ty|tysm",
+    "greeting": r"hi+|hello+|hey+|hai|vanakk?am|namaste|good (?:morning|afternoon|evening)|greetings",
+    "acknowledgement": r"ok(?:ay)?|k|kk|cool|great|nice|got it|alright|sure|fine|understood|perfect|awesome|noted",
+    "filler": r"so much|very much|a lot|again|there|all|everyone|bot|miet|sir|madam|mam|dear|and|for the (?:help|info)"
+}
+_SMALL_TALK_TOKEN = re.compile(r"\s*(?:" + "|".join(
+    f"(?P<{intent}>(?:{pattern}))" for intent, pattern in _SMALL_TALK_PHRASES.items()) + r")(?=\s|$)")
+
+# Explicit requests to start an application; questions about the process still go to retrieval
+_APPLY = re.compile(
+    r"(?:yes |ok |okay )?(?:i want to |i would like to |i d like to |id like to |let me |lets |please )?"
+    r"(?:apply|register|enrol+|start (?:my |the |an )?(?:admission|application)(?: process)?|"
+    r"(?:open |show me |give me )?(?:the )?admission form)"
+    r"(?: now| today| online| here)?(?: for (?:the )?(?:admission|course))?(?: now| please)?")
+# Replies that accept the "Would you like to apply ...?" offer the bot just made
+_AFFIRMATIVE = re.compile(
+    r"(?:yes|yeah|yep|yup|y|sure|ok|okay|of course|definitely|please|why not|lets go|go ahead)"
+    r"(?: please| sure| i would| i do| lets do it| go ahead)?")
+_APPLY_OFFER = re.compile(r"would you like to (?:apply|start your admission)", re.IGNORECASE)
+# A bot message ending in a question (trailing emoji and punctuation allowed)
+_ENDS_WITH_QUESTION = re.compile(r"\?[^\w]*$")
+
+# Queries mentioning any of these are about the college even if they look off topic
+_DOMAIN_TERMS = re.compile(
+    r"\b(?:miet|college|campus|course|courses|degree|admission|admissions|apply|fee|fees|hostel|"
+    r"scholarship|exam|exams|semester|department|faculty|placement|placements|library|bus|"
+    r"transport|canteen|syllabus|eligibility|seat|seats|ug|pg|bsc|bca|bcom|ba|msc|mba|mca)\b")
+
+# Example queries whose embeddings form the centroids; each group is one centroid
+CENTROID_EXAMPLES = [
+    ("greeting", ["hello there", "good morning", "hey, how are you?", "hi bot"]),
+    ("thanks", ["thank you so much", "thanks for your help", "that was helpful, thanks", "much appreciated"]),
+    ("goodbye", ["bye, see you later", "ok bye", "talk to you later", "have a nice day"]),
+    ("out_of_scope", ["tell me a joke", "write a poem about the sea", "sing me a song", "who are you dating?"]),
+    ("out_of_scope", ["what is the weather today?", "who won the cricket match yesterday?",
+                      "latest news headlines", "what is the stock price of apple?"]),
+    ("out_of_scope", ["write python code to sort a list", "solve this equation for x",
+                      "translate this sentence into french", "explain quantum physics"]),
+    ("out_of_scope", ["recommend a good movie", "give me a recipe for biryani",
+                      "how do i lose weight?", "book a flight to delhi"]),
+    (QUESTION, ["what courses are offered?", "what is the fee structure for bsc computer science?",
+                "how do i apply for admission?", "what is the eligibility for bca?"]),
+    (QUESTION, ["is there a hostel on campus?", "what facilities does the college have?",
+                "does the college provide bus transport?", "tell me about the library"]),
+    (QUESTION, ["who is the principal?", "what are the college timings?",
+                "how are placements at miet?", "what scholarships are available?"]),
+]
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class IntentRouter:
+    """
+    Pre-retrieval intent classification for /chat, so small talk, explicit
+    "apply now" requests and off-topic questions get a templated reply
+    without touching FAISS or the LLM.
+
+    Two stages, both cheap:
+    - classify_text(): keyword rules on the normalized text, run before the
+      query is even embedded
+    - classify_embedding(): nearest centroid over the query embedding the
+      request computes anyway, built from CENTROID_EXAMPLES by prepare()
+
+    Anything not confidently matched is a "question" and takes the normal path.
+    """
+
+    def __init__(self, enabled=INTENT_ROUTER, min_similarity=INTENT_MIN_SIMILARITY,
+                 margin=INTENT_CENTROID_MARGIN):
+        self.enabled = enabled
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self._labels = []
+        self._centroids = None
+        self._prepare_lock = threading.Lock()
+        self.counts = {}
+
+    def _record(self, intent, stage):
+        key = (intent, stage)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        intents_total.inc(intent=intent, stage=stage)
+
+    @property
+    def ready(self):
+        return self._centroids is not None
+
+    def prepare(self, embed_documents):
+        """Embed the centroid examples (blocking; run once the embedding model is loaded)."""
+        if not self.enabled or self.ready:
+            return
+        with self._prepare_lock:
+            if self.ready:
+                return
+            texts = [text for _, examples in CENTROID_EXAMPLES for text in examples]
+            vectors = _unit(embed_documents(texts))
+            centroids, start = [], 0
+            for intent, examples in CENTROID_EXAMPLES:
+                centroids.append(vectors[start:start + len(examples)].mean(axis=0))
+                start += len(examples)
+            self._labels = [intent for intent, _ in CENTROID_EXAMPLES]
+            self._centroids = _unit(centroids)
+
+    def classify_text(self, query, history=()):
+        """Intent decided by the keyword rules, or None to go on to the embedding stage."""
+        if not self.enabled:
+            return None
+        text = normalize_query(query)
+        if not text:
+            return None
+        intent = None
+        if _APPLY.fullmatch(text):
+            intent = "apply"
+        elif _AFFIRMATIVE.fullmatch(text) and _offered_admission(history):
+            intent = "apply"
+        else:
+            intent = _small_talk(text)
+            # "ok" / "sure" / "fine" answering the bot's question means something in context; let the LLM read it
+            if intent == "acknowledgement" and _ENDS_WITH_QUESTION.search(_last_bot_message(history)):
+                intent = None
+        if intent is not None:
+            self._record(intent, "rule")
+        return intent
+
+    def classify_embedding(self, query, embedding):
+        """Intent of the nearest centroid if it is a clear winner over college questions, else None."""
+        if not self.enabled:
+            return None
+        if not self.ready:
+            self._record(QUESTION, "none")
+            return None
+        scores = self._centroids @ _unit(embedding)
+        best = int(np.argmax(scores))
+        intent = self._labels[best]
+        question_score = max(score for label, score in zip(self._labels, scores) if label == QUESTION)
+        text = normalize_query(query)
+        routed = (
+            intent != QUESTION
+            and scores[best] >= self.min_similarity
+            and scores[best] - question_score >= self.margin
+            and not (intent == "out_of_scope" and _DOMAIN_TERMS.search(text))
+            and not (intent in SMALL_TALK and len(text.split()) > SMALL_TALK_MAX_WORDS)
+        )
+        if not routed:
+            self._record(QUESTION, "none")
+            return None
+        self._record(intent, "centroid")
+        return intent
+
+    def answer(self, intent):
+        return ANSWERS[intent]
+
+    def stats(self):
+        by_intent = {}
+        for (intent, stage), count in self.counts.items():
+            by_intent.setdefault(intent, {})[stage] = count
+        routed = sum(count for (intent, _), count in self.counts.items() if intent != QUESTION)
+        total = sum(self.counts.values())
+        return {
+            "enabled": self.enabled,
+            "centroids_ready": self.ready,
+            "intents": by_intent,
+            "routed": routed,
+            "routed_share": round(routed / total, 3) if total else 0.0
+        }
+
+
+def _small_talk(text):
+    """The small-talk intent if the whole message is made of small-talk phrases, else None."""
+    found, pos = set(), 0
+    while pos < len(text):
+        match = _SMALL_TALK_TOKEN.match(text, pos)
+        if match is None:
+            return None
+        found.add(match.lastgroup)
+        pos = match.end()
+    # "ok thanks bye" is a goodbye, "hi thanks" a thank-you
+    return next((intent for intent in ("goodbye", "thanks", "greeting", "acknowledgement") if intent in found), None)
+
+
+def _last_bot_message(history):
+    for role, text in reversed(history):
+        if role != "user":
+            return text
+    return ""
+
+
+def _offered_admission(history):
+    """True if the bot's last message asked whether the student wants to apply."""
+    return bool(_APPLY_OFFER.search(_last_bot_message(history)))
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,104 @@
+import re
+import math
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# BM25 keyword index, built once when an index version is published and
+# stored next to the chunks (see utils/vector_index.py), so workers only
+# read the postings of the query's terms instead of holding every chunk.
+POSTINGS_TABLE = "keyword_postings"
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "what", "when", "where", "which",
+    "who", "why", "will", "with", "you", "your", "please", "tell", "about"
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens; dotted abbreviations collapse so "B.Sc" and "BSc" match."""
+    text = re.sub(r"(?<=\w)\.(?=\w)", "", text.lower())
+    return [token for token in re.findall(r"[a-z0-9]+", text) if token not in STOPWORDS]
+
+
+class KeywordIndexWriter:
+    """Accumulates postings (position, term frequency, chunk length) while an index version is written."""
+
+    def __init__(self):
+        self.postings = defaultdict(lambda: array("i"))
+        self.count = 0
+        self.total_length = 0
+
+    def add(self, position, text):
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        for term, tf in terms.items():
+            self.postings[term].extend((position, tf, length))
+        self.count += 1
+        self.total_length += length
+
+    @property
+    def avg_length(self):
+        return self.total_length / self.count if self.count else 0.0
+
+    def lookup(self, terms):
+        return {term: np.frombuffer(self.postings[term], dtype=np.int32).reshape(-1, 3)
+                for term in terms if term in self.postings}
+
+    def write(self, conn):
+        """Store the postings in the chunks database; one row per term."""
+        conn.execute(f"CREATE TABLE {POSTINGS_TABLE} (term TEXT PRIMARY KEY, postings BLOB NOT NULL)")
+        conn.executemany(f"INSERT INTO {POSTINGS_TABLE} VALUES (?, ?)",
+                         ((term, postings.tobytes()) for term, postings in self.postings.items()))
+
+
+class BM25Index:
+    """
+    BM25 over one index version. `lookup(terms)` returns {term: int32 array
+    of (position, tf, length) rows} and `fetch(positions)` {position: Document};
+    scoring is vectorized over the postings of the query's terms only.
+    """
+
+    def __init__(self, lookup, fetch, doc_count, avg_length, k1=1.5, b=0.75):
+        self.lookup = lookup
+        self.fetch = fetch
+        self.doc_count = doc_count
+        self.avg_length = avg_length or 1.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def from_docs(cls, docs):
+        """In-memory index over a list of Documents."""
+        writer = KeywordIndexWriter()
+        for position, doc in enumerate(docs):
+            writer.add(position, doc.page_content)
+        return cls(writer.lookup, lambda positions: {p: docs[p] for p in positions}, writer.count, writer.avg_length)
+
+    @classmethod
+    def from_store(cls, store):
+        """The stored index of a ChunkStore; indexes published before it was stored are built in memory."""
+        if store.has_keyword_index():
+            return cls(store.keyword_postings, store.fetch, store.index.ntotal, store.meta.get("keyword_avg_length"))
+        print("Keyword index not stored with this index version; building it in memory (republish to store it)")
+        return cls.from_docs(list(store.documents()))
+
+    def search(self, query, k):
+        """Top-k (Document, score) pairs for the query."""
+        postings = self.lookup(set(tokenize(query)))
+        if not postings:
+            return []
+        positions, contributions = [], []
+        for rows in postings.values():
+            tf = rows[:, 1].astype(np.float64)
+            idf = math.log(1 + (self.doc_count - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * rows[:, 2] / self.avg_length)
+            positions.append(rows[:, 0])
+            contributions.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        unique, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        top = np.argsort(-scores, kind="stable")[:k]
+        docs = self.fetch([int(unique[i]) for i in top])
+        return [(docs[int(unique[i])], float(scores[i])) for i in top if int(unique[i]) in docs]
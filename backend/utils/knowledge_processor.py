@@ -1,51 +1,310 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader, WebBaseLoader
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import json
+import time
+import hashlib
+import threading
+from utils.embedding_service import embedding_service
+from utils.document_stream import iter_pdf_chunks, iter_text_chunks, iter_loader_chunks, split_documents
+from utils.web_crawler import SiteCrawler, CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH
+from utils.vector_index import ChunkStore, publish_index
+from utils.tracing import timed
 
 # Correct path relative to where main.py runs
 FAISS_INDEX_PATH = os.path.join("database", "faiss_index")
+# Which chunk ids belong to which source document, stored next to the index
+MANIFEST_PATH = os.path.join(FAISS_INDEX_PATH, "manifest.json")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+# Open the served index memory-mapped so all worker processes share one page-cached copy
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
 
-def process_file(file_path: str, clear_existing: bool = False):
+# Lock file for index writers in every worker process. It sits next to the
+# index directory, not inside it, because a reset deletes the directory.
+INDEX_LOCK_PATH = FAISS_INDEX_PATH + ".lock"
+
+
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK itself gives up after ~10s of retries; keep waiting like flock does
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class IndexLock:
+    """
+    Serializes every read-modify-write of the on-disk index across threads
+    and uvicorn worker processes: a thread lock for this process plus an
+    exclusive lock on INDEX_LOCK_PATH (flock, or msvcrt on Windows).
+    Not reentrant.
+    """
+
+    def __init__(self, path=INDEX_LOCK_PATH):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            f = open(self.path, "a+b")
+            try:
+                _lock_file(f)
+            except BaseException:
+                f.close()
+                raise
+            self._file = f
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        f, self._file = self._file, None
+        try:
+            _unlock_file(f)
+        finally:
+            f.close()
+            self._thread_lock.release()
+
+
+index_lock = IndexLock()
+
+# faiss, langchain_community and the text splitter are imported where they are
+# used: together they add about a second to every cold start of the API.
+# Loading and splitting live in utils/document_stream.py and utils/web_crawler.py.
+
+def _report(progress, stage, **counters):
+    """Forward stage progress to an ingestion job; the callback may raise to cancel."""
+    if progress is not None:
+        progress(stage, **counters)
+
+def chunk_id(source: str, content: str):
+    """Stable id for a chunk: the same text from the same source always hashes the same."""
+    return hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()[:32]
+
+def load_manifest(store=None):
+    """
+    Read {source: [chunk ids]} for the current index. Indexes built before
+    the manifest existed are mapped from the chunk metadata so their chunks
+    get replaced on the next sync instead of duplicated.
+    """
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    manifest = {}
+    if store is not None:
+        for doc in store.documents():
+            manifest.setdefault(doc.metadata.get("source", "unknown"), []).append(doc.id)
+    return manifest
+
+def save_manifest(manifest):
+    os.makedirs(FAISS_INDEX_PATH, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def index_stamp():
+    """Changes whenever a new index version is published (None if there is no index)."""
+    for path in (MANIFEST_PATH, os.path.join(FAISS_INDEX_PATH, "index.faiss")):
+        if os.path.exists(path):
+            return os.stat(path).st_mtime_ns
+    return None
+
+def migrate_legacy_index():
+    """
+    Convert an index saved by LangChain's FAISS.save_local (index.faiss +
+    a pickled docstore in index.pkl) to the chunks.db/vectors.npy layout.
+    The pickle is only ever one this app wrote itself, and it is read once.
+    Call with index_lock held.
+    """
+    legacy_pkl = os.path.join(FAISS_INDEX_PATH, "index.pkl")
+    if not os.path.exists(legacy_pkl) or ChunkStore.exists(FAISS_INDEX_PATH):
+        return False
+    from langchain_community.vectorstores import FAISS
+    legacy = FAISS.load_local(FAISS_INDEX_PATH, embedding_service, allow_dangerous_deserialization=True)
+    rows = []
+    for position, doc_id in sorted(legacy.index_to_docstore_id.items()):
+        doc = legacy.docstore.search(doc_id)
+        rows.append((doc_id, doc.page_content, doc.metadata, legacy.index.reconstruct(position)))
+    manifest = load_manifest()
+    if not manifest:
+        for doc_id, _, metadata, _ in rows:
+            manifest.setdefault(metadata.get("source", "unknown"), []).append(doc_id)
+    publish_index(FAISS_INDEX_PATH, rows, embedding_dim=legacy.index.d)
+    save_manifest(manifest)
+    os.remove(legacy_pkl)
+    print(f"Migrated legacy index: {len(rows)} chunks")
+    return True
+
+def open_store():
+    """The published index as a ChunkStore, or None if there isn't one."""
+    if not ChunkStore.exists(FAISS_INDEX_PATH):
+        return None
+    return ChunkStore(FAISS_INDEX_PATH, embedding_service, mmap=FAISS_MMAP)
+
+def load_index_readonly():
+    """Open the published index for serving; returns None if there isn't one."""
+    if os.path.exists(os.path.join(FAISS_INDEX_PATH, "index.pkl")):
+        with index_lock:
+            migrate_legacy_index()
+    return open_store()
+
+def _embed_new_chunks(source, chunks, skip_ids, progress=None):
+    """
+    Stream chunks, drop repeats and those already in the index (skip_ids),
+    and embed the rest in batches as they arrive. Returns the ordered chunk
+    ids of the source plus (id, text, metadata, float32 vector) rows for the
+    new ones; page text is never held beyond one batch.
+    """
+    import numpy as np
+    ids, seen, new_rows, batch = [], set(), [], []
+    started = time.perf_counter()
+
+    def flush():
+        with timed("ingest_embed"):
+            vectors = embedding_service.embed_documents([chunk.page_content for _, chunk in batch])
+        vectors = np.asarray(vectors, dtype="float32")
+        new_rows.extend((doc_id, chunk.page_content, chunk.metadata, vector) for (doc_id, chunk), vector in zip(batch, vectors))
+        batch.clear()
+        elapsed = time.perf_counter() - started
+        _report(progress, "embed", chunks_seen=len(ids), chunks_embedded=len(new_rows),
+                chunks_reused=len(ids) - len(new_rows),
+                chunks_per_sec=round(len(new_rows) / elapsed, 1) if elapsed else 0.0)
+
+    # Covers parsing/crawling and embedding, which overlap
+    with timed("ingest_stream"):
+        for chunk in chunks:
+            # Drop duplicate chunks within the document (repeated headers, footers...)
+            doc_id = chunk_id(source, chunk.page_content)
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            ids.append(doc_id)
+            if doc_id not in skip_ids:
+                batch.append((doc_id, chunk))
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    flush()
+        if batch:
+            flush()
+    return ids, new_rows
+
+def sync_chunks(source: str, chunks, clear_existing: bool = False, progress=None):
+    """
+    Bring the on-disk index in line with the latest chunks of one source.
+
+    `chunks` may be any iterable, including a generator that is still
+    parsing or crawling: chunks are hashed and embedded as they arrive.
+    Only chunks whose (source, content) hash is new get embedded; chunks
+    that disappeared from the source are deleted from the index and the
+    rest are left untouched. With clear_existing=True every other source is
+    removed as well, so the index ends up holding just this document.
+    Returns a dict with added/removed/reused/total counts.
+
+    The index lock is only held to merge the result, so a long crawl does
+    not block other jobs, and nothing is written until every new chunk has
+    been embedded, so a job cancelled from `progress` leaves the index on
+    disk unchanged.
+    """
+    with index_lock:
+        migrate_legacy_index()
+        known_ids = set()
+        if os.path.exists(MANIFEST_PATH):
+            known_ids = {doc_id for ids in load_manifest().values() for doc_id in ids}
+        else:
+            store = open_store()
+            if store is not None:
+                known_ids = set(store.ids())
+                store.close()
+
+    new_ids, new_rows = _embed_new_chunks(source, chunks, known_ids, progress)
+
+    _report(progress, "index")
+    with index_lock, timed("ingest_index"):
+        migrate_legacy_index()
+        store = open_store()
+        try:
+            manifest = load_manifest(store)
+            indexed_ids = set(store.ids()) if store is not None else set()
+            old_ids = set(manifest.get(source, []))
+            stale_ids = old_ids - set(new_ids)
+            if clear_existing:
+                for other_source, ids in manifest.items():
+                    if other_source != source:
+                        stale_ids.update(ids)
+                manifest = {}
+            stale_ids &= indexed_ids
+
+            # Another job may have changed the index while this one was embedding
+            rows = [row for row in new_rows if row[0] not in indexed_ids]
+            manifest[source] = new_ids
+            if rows or stale_ids:
+                publish_index(FAISS_INDEX_PATH, rows, previous=store, drop_ids=stale_ids)
+            # The manifest goes last and marks the new version as complete
+            save_manifest(manifest)
+        finally:
+            if store is not None:
+                store.close()
+
+    stats = {
+        "source": source,
+        "added": len(rows),
+        "removed": len(stale_ids),
+        "reused": len(new_ids) - len(rows),
+        "total": len(new_ids)
+    }
+    print(f"Synced {source}: +{stats['added']} -{stats['removed']} ={stats['reused']} ({stats['total']} chunks)")
+    return stats
+
+def process_file(file_path: str, clear_existing: bool = False, progress=None):
+    """Index a PDF, text or Word file, parsing and embedding it as a stream."""
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".pdf":
-        loader = PyPDFLoader(file_path)
+        chunks = iter_pdf_chunks(file_path, progress)
     elif ext == ".txt":
-        loader = TextLoader(file_path, encoding='utf-8')
+        chunks = iter_text_chunks(file_path, progress)
     elif ext == ".docx":
-        loader = Docx2txtLoader(file_path)
+        from langchain_community.document_loaders import Docx2txtLoader
+        chunks = iter_loader_chunks(Docx2txtLoader(file_path), progress)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
-    chunks = text_splitter.split_documents(documents)
-    
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    if not clear_existing and os.path.exists(FAISS_INDEX_PATH):
-        vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        vector_store.add_documents(chunks)
-    else:
-        vector_store = FAISS.from_documents(chunks, embeddings)
-    
-    vector_store.save_local(FAISS_INDEX_PATH)
-    return len(chunks)
-
-def process_url(url: str, clear_existing: bool = False):
-    loader = WebBaseLoader(url)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
-    chunks = text_splitter.split_documents(documents)
-    
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    if not clear_existing and os.path.exists(FAISS_INDEX_PATH):
-        vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        vector_store.add_documents(chunks)
-    else:
-        vector_store = FAISS.from_documents(chunks, embeddings)
-    
-    vector_store.save_local(FAISS_INDEX_PATH)
-    return len(chunks)
+    return sync_chunks(file_path, chunks, clear_existing=clear_existing, progress=progress)
+
+def process_url(url: str, clear_existing: bool = False, progress=None,
+                max_pages: int = CRAWL_MAX_PAGES, max_depth: int = CRAWL_MAX_DEPTH):
+    """Crawl a site from `url` and index every page under that URL as one source."""
+    crawler = SiteCrawler(url, max_pages=max_pages, max_depth=max_depth)
+
+    def pages():
+        for page in crawler.crawl():
+            _report(progress, "load", pages_parsed=crawler.pages_fetched, crawl_errors=crawler.errors)
+            yield page
+
+    try:
+        chunks = (chunk for page in pages() for chunk in split_documents([page]))
+        stats = sync_chunks(url, chunks, clear_existing=clear_existing, progress=progress)
+    finally:
+        crawler.session.close()
+    stats["crawl"] = crawler.stats()
+    return stats
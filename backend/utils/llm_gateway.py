@@ -0,0 +1,427 @@
+import os
+import time
+import random
+import asyncio
+import threading
+
+from utils.metrics import registry
+from utils.prompt_builder import count_tokens
+from utils.tracing import observe_stage, annotate
+
+LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-oss-120b")
+# Smaller model tried when the main one is failing or can't answer within the deadline; empty = none
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+# Point at any OpenAI-compatible server (e.g. the benchmark's fake); empty = Groq
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", 0.3))
+# Seconds for one HTTP attempt, and for a whole call including retries and the fallback
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 30))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 45))
+# Seconds of the deadline kept back for the fallback model
+LLM_FALLBACK_RESERVE = float(os.getenv("LLM_FALLBACK_RESERVE", 10))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+# Client-side pacing to stay under the provider's per-model limits; 0 = unlimited
+LLM_RPM = int(os.getenv("LLM_RPM", 0))
+LLM_TPM = int(os.getenv("LLM_TPM", 0))
+LLM_FALLBACK_RPM = int(os.getenv("LLM_FALLBACK_RPM", 0))
+LLM_FALLBACK_TPM = int(os.getenv("LLM_FALLBACK_TPM", 0))
+# The limits above are for the whole deployment; each uvicorn worker paces itself to its share
+LLM_WORKERS = max(1, int(os.getenv("UVICORN_WORKERS", 1)))
+# Completion tokens reserved per call before the real count is known
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", 512))
+# Consecutive failed attempts that open the circuit, and how long it stays open
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", 16))
+
+llm_requests_total = registry.counter(
+    "helpdesk_llm_requests_total", "LLM attempts by model and outcome", ["model", "outcome"])
+llm_retries_total = registry.counter(
+    "helpdesk_llm_retries_total", "LLM attempts retried, by model and reason", ["model", "reason"])
+llm_fallbacks_total = registry.counter(
+    "helpdesk_llm_fallbacks_total", "Calls handed to the fallback model, by reason", ["reason"])
+
+
+class LLMUnavailable(Exception):
+    """No model could answer within the deadline; the message is safe to show to students."""
+
+    def __init__(self, detail, cause=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.cause = cause
+
+
+class _SkipModel(Exception):
+    """Give up on the current model (and try the fallback, if any)."""
+
+    def __init__(self, reason, cause=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.cause = cause
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units a minute, holding at most one minute's worth.
+    reserve() takes the units straight away, possibly going into debt, and
+    says how long the caller must wait before using them, so callers are
+    served in the order they asked. Thread-safe; per_minute <= 0 disables it.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        """Give back units reserved but not used (or negative to charge more)."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `cooldown` seconds; then lets a single probe through (half open) and
+    closes again if it succeeds.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, cooldown=LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                return True
+            return False
+
+    def cancel(self):
+        """The probe was abandoned without an answer either way; let the next call probe instead."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class _Route:
+    """One model with its own pacing buckets and breaker (provider limits are per model)."""
+
+    def __init__(self, model, client, rpm, tpm):
+        self.model = model
+        self.client = client
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.pacing_wait_s = 0.0
+
+
+_http_clients = None
+
+
+def shared_http_clients():
+    """One keep-alive httpx pool (sync and async) shared by every model client."""
+    global _http_clients
+    if _http_clients is None:
+        import httpx
+        limits = httpx.Limits(max_connections=LLM_HTTP_POOL_SIZE, max_keepalive_connections=LLM_HTTP_POOL_SIZE)
+        timeout = httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10)
+        _http_clients = (httpx.Client(limits=limits, timeout=timeout),
+                         httpx.AsyncClient(limits=limits, timeout=timeout))
+    return _http_clients
+
+
+def make_groq_client(model, api_key):
+    # Imported here: langchain_groq alone adds ~0.5s to startup
+    from langchain_groq import ChatGroq
+    http_client, http_async_client = shared_http_clients()
+    options = {"base_url": LLM_BASE_URL} if LLM_BASE_URL else {}
+    return ChatGroq(
+        model_name=model,
+        temperature=LLM_TEMPERATURE,
+        api_key=api_key,
+        request_timeout=LLM_REQUEST_TIMEOUT,
+        # Retries are done here, with pacing and the deadline in mind
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        **options
+    )
+
+
+def _retry_reason(error):
+    """Why an error is worth retrying, or None if it isn't (bad request, auth, ...)."""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status is not None:
+        return "server_error" if status >= 500 or status in (408, 409) else None
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or type(error).__name__ == "APITimeoutError":
+        return "timeout"
+    if isinstance(error, ConnectionError) or type(error).__name__ == "APIConnectionError":
+        return "connection"
+    return None
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    The one way the app talks to the LLM. Looks like a LangChain chat model
+    (invoke, ainvoke, astream) and adds, per model:
+
+    - token-bucket pacing on requests/min and tokens/min, so bursts queue
+      here instead of coming back as 429s; with several workers each one
+      paces at 1/workers of the limits
+    - retries with full-jitter exponential backoff (honouring Retry-After)
+      for rate limits, 5xx, timeouts and dropped connections
+    - a circuit breaker that stops sending to a model that keeps failing
+    - a per-call deadline; when the main model can't make it (breaker open,
+      pacing wait or backoff too long, retries used up) the call moves to
+      the fallback model with the time that is left
+
+    All clients share one HTTP connection pool. When nothing can answer,
+    LLMUnavailable is raised. Streams are only retried before the first
+    token; once text has been sent it can't be taken back.
+    """
+
+    def __init__(self, api_key=None, model=LLM_MODEL, fallback_model=LLM_FALLBACK_MODEL,
+                 client_factory=None, deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES, workers=LLM_WORKERS):
+        client_factory = client_factory or (lambda name: make_groq_client(name, api_key))
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.workers = workers
+        self.routes = [_Route(model, client_factory(model), LLM_RPM / workers, LLM_TPM / workers)]
+        if fallback_model and fallback_model != model:
+            self.routes.append(_Route(fallback_model, client_factory(fallback_model),
+                                      LLM_FALLBACK_RPM / workers, LLM_FALLBACK_TPM / workers))
+        self.fallbacks = 0
+        self.unavailable = 0
+
+    @property
+    def model(self):
+        return self.routes[0].model
+
+    def _estimate_tokens(self, messages):
+        return sum(count_tokens(str(m.content)) for m in messages) + LLM_COMPLETION_TOKENS
+
+    def _plan(self, route, tokens, deadline_at, last):
+        """
+        Check the breaker and take pacing budget for one attempt. Returns
+        (seconds to wait first, attempt timeout) or raises _SkipModel.
+        """
+        remaining = deadline_at - time.monotonic()
+        # Leave time for the fallback unless this is the last model to try
+        budget = remaining if last else remaining - LLM_FALLBACK_RESERVE
+        if budget <= 0:
+            raise _SkipModel("deadline")
+        if not route.breaker.allow():
+            raise _SkipModel("breaker_open")
+        wait = max(route.requests.reserve(1), route.tokens.reserve(tokens))
+        if wait >= budget:
+            route.requests.refund(1)
+            route.tokens.refund(tokens)
+            route.breaker.cancel()
+            raise _SkipModel("pacing")
+        route.pacing_wait_s += wait
+        return wait, min(LLM_REQUEST_TIMEOUT, budget - wait)
+
+    def _failed(self, route, error, attempt, deadline_at, last):
+        """Record a failed attempt; returns the backoff before retrying or raises."""
+        reason = _retry_reason(error)
+        if reason is None:
+            # The provider is up; the request itself was rejected, so retrying won't help
+            route.breaker.success()
+            llm_requests_total.inc(model=route.model, outcome="rejected")
+            raise error
+        route.failures += 1
+        route.breaker.failure()
+        llm_requests_total.inc(model=route.model, outcome=reason)
+        if attempt >= self.max_retries:
+            raise _SkipModel("retries_exhausted", error)
+        backoff = _retry_after(error) or random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        remaining = deadline_at - time.monotonic() - (0 if last else LLM_FALLBACK_RESERVE)
+        if backoff >= remaining:
+            raise _SkipModel("deadline", error)
+        route.retries += 1
+        llm_retries_total.inc(model=route.model, reason=reason)
+        return backoff
+
+    def _succeeded(self, route, tokens, response=None):
+        route.calls += 1
+        route.breaker.success()
+        llm_requests_total.inc(model=route.model, outcome="ok")
+        usage = getattr(response, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            route.tokens.refund(tokens - usage["total_tokens"])
+        if route is not self.routes[0]:
+            annotate(llm_model=route.model)
+
+    def _skipped(self, route, skip):
+        print(f"LLM {route.model} skipped ({skip.reason}): {skip.cause or ''}")
+        if route is not self.routes[-1]:
+            self.fallbacks += 1
+            llm_fallbacks_total.inc(reason=skip.reason)
+
+    def _give_up(self, cause):
+        self.unavailable += 1
+        raise LLMUnavailable("I'm getting a lot of questions right now and couldn't reach my AI service in time. "
+                             "Please try again in a minute.", cause)
+
+    async def _acall(self, messages, attempt_fn, deadline):
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        tokens = self._estimate_tokens(messages)
+        cause = None
+        for route in self.routes:
+            last = route is self.routes[-1]
+            attempt = 0
+            try:
+                while True:
+                    wait, timeout = self._plan(route, tokens, deadline_at, last)
+                    try:
+                        if wait:
+                            observe_stage("llm_pacing", wait)
+                            await asyncio.sleep(wait)
+                        result = await asyncio.wait_for(attempt_fn(route.client), timeout)
+                    except Exception as e:
+                        backoff = self._failed(route, e, attempt, deadline_at, last)
+                    except BaseException:
+                        # Cancelled (client went away): a half-open probe must not stay claimed
+                        route.breaker.cancel()
+                        raise
+                    else:
+                        self._succeeded(route, tokens, result)
+                        return result
+                    await asyncio.sleep(backoff)
+                    attempt += 1
+            except _SkipModel as skip:
+                self._skipped(route, skip)
+                cause = skip.cause or cause
+        self._give_up(cause)
+
+    async def ainvoke(self, messages, deadline=None, **kwargs):
+        return await self._acall(messages, lambda client: client.ainvoke(messages, **kwargs), deadline)
+
+    async def astream(self, messages, deadline=None, **kwargs):
+        async def first_chunk(client):
+            stream = client.astream(messages, **kwargs).__aiter__()
+            try:
+                return stream, await stream.__anext__()
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        stream, chunk = await self._acall(messages, first_chunk, deadline)
+        try:
+            while True:
+                yield chunk
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), LLM_REQUEST_TIMEOUT)
+                except StopAsyncIteration:
+                    return
+        finally:
+            await stream.aclose()
+
+    def invoke(self, messages, deadline=None, **kwargs):
+        """Blocking variant for worker threads (admission catalog extraction)."""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        tokens = self._estimate_tokens(messages)
+        cause = None
+        for route in self.routes:
+            last = route is self.routes[-1]
+            attempt = 0
+            try:
+                while True:
+                    wait, _ = self._plan(route, tokens, deadline_at, last)
+                    if wait:
+                        observe_stage("llm_pacing", wait)
+                        time.sleep(wait)
+                    try:
+                        # Bounded by the client's own request timeout
+                        result = route.client.invoke(messages, **kwargs)
+                    except Exception as e:
+                        backoff = self._failed(route, e, attempt, deadline_at, last)
+                    except BaseException:
+                        route.breaker.cancel()
+                        raise
+                    else:
+                        self._succeeded(route, tokens, result)
+                        return result
+                    time.sleep(backoff)
+                    attempt += 1
+            except _SkipModel as skip:
+                self._skipped(route, skip)
+                cause = skip.cause or cause
+        self._give_up(cause)
+
+    def stats(self):
+        return {
+            "deadline_s": self.deadline,
+            "fallbacks": self.fallbacks,
+            "unavailable": self.unavailable,
+            "workers": self.workers,
+            "models": {
+                route.model: {
+                    "calls": route.calls,
+                    "retries": route.retries,
+                    "failures": route.failures,
+                    "circuit": route.breaker.state,
+                    "circuit_opened": route.breaker.times_opened,
+                    "pacing_wait_s": round(route.pacing_wait_s, 2),
+                    "rpm_limit": round(route.rpm, 1),
+                    "tpm_limit": round(route.tpm, 1)
+                } for route in self.routes
+            }
+        }
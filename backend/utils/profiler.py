@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+# Folded stacks kept; the rarest are dropped beyond this
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", 5000))
+# Leaf functions of threads parked waiting for work; skipped so busy stacks stand out
+IDLE_LEAVES = {"_worker", "select", "wait", "serve_forever", "_wait_for_tstate_lock", "get"}
+
+
+def _folded(frame, max_depth=64):
+    parts = []
+    while frame is not None and len(parts) < max_depth:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    """
+    Opt-in wall-clock sampler: a daemon thread snapshots every thread's stack
+    with sys._current_frames() at a fixed interval and counts folded stacks
+    (the flamegraph.pl / speedscope "collapsed" format), skipping threads
+    that are parked waiting for work. Off by default and switched on and off
+    at runtime, so it costs nothing unless in use.
+    """
+
+    def __init__(self):
+        self.samples = Counter()
+        self.interval = PROFILER_INTERVAL_MS / 1000
+        self.started_at = None
+        self.total_samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=None, reset=True):
+        with self._lock:
+            if self.running:
+                return False
+            if interval_ms:
+                self.interval = max(1.0, float(interval_ms)) / 1000
+            if reset:
+                self.samples.clear()
+                self.total_samples = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        print(f"Sampling profiler started ({self.interval * 1000:.0f}ms interval)")
+        return True
+
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return False
+            self._stop.set()
+            thread = self._thread
+        thread.join(timeout=2)
+        print(f"Sampling profiler stopped after {self.total_samples} samples")
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id or frame.f_code.co_name in IDLE_LEAVES:
+                        continue
+                    self.samples[_folded(frame)] += 1
+                self.total_samples += 1
+                if len(self.samples) > PROFILER_MAX_STACKS:
+                    for stack, _ in self.samples.most_common()[PROFILER_MAX_STACKS // 2:]:
+                        del self.samples[stack]
+
+    def folded(self):
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def top(self, limit=20):
+        """Hottest leaf frames with their share of samples."""
+        leaves = Counter()
+        with self._lock:
+            for stack, count in self.samples.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            total = sum(self.samples.values()) or 1
+        return [{"frame": frame, "samples": count, "share": round(count / total, 4)}
+                for frame, count in leaves.most_common(limit)]
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 1),
+            "started_at": self.started_at,
+            "samples": self.total_samples,
+            "distinct_stacks": len(self.samples)
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,148 @@
+import os
+import re
+import logging
+
+# Input-token budget for one /chat prompt (system rules + context + history + question)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 2500))
+# Share of the budget reserved for recent conversation turns kept verbatim
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 500))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", 120))
+# Chunks sharing more than this fraction of their words with a kept chunk are dropped
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", 0.8))
+# tiktoken encoding for exact counts, e.g. o200k_base. tiktoken downloads encodings on first
+# use, so leave empty on offline hosts (or pre-fetch into TIKTOKEN_CACHE_DIR at build time);
+# empty counts ~4 characters per token.
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "")
+
+logger = logging.getLogger(__name__)
+_encoding = None
+
+
+def count_tokens(text):
+    """Token count with tiktoken, falling back to ~4 chars/token if the encoding can't load."""
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if TOKEN_ENCODING:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                logger.debug("tiktoken encoding %s unavailable (%s); estimating tokens from length", TOKEN_ENCODING, e)
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def dedupe_chunks(texts, threshold=CHUNK_DEDUP_THRESHOLD):
+    """Drop repeated and near-duplicate chunks (e.g. the overlap between neighbours), keeping order."""
+    kept, kept_words = [], []
+    for text in texts:
+        words = _words(text)
+        if not words:
+            continue
+        duplicate = False
+        for other in kept_words:
+            overlap = len(words & other) / min(len(words), len(other))
+            if overlap >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(text)
+            kept_words.append(words)
+    return kept
+
+
+def summarize_turns(turns, max_tokens=SUMMARY_TOKEN_BUDGET):
+    """
+    Extractive summary of older turns: the questions the student asked,
+    newest first, cut to max_tokens. Cheap enough to rebuild every turn and
+    keeps the topic thread without the full bot answers.
+    """
+    questions = [text.strip() for role, text in reversed(turns) if role == "user" and text.strip()]
+    if not questions:
+        return ""
+    parts, used = [], 0
+    for question in questions:
+        snippet = truncate_to_tokens(question, 40)
+        cost = count_tokens(snippet) + 2
+        if used + cost > max_tokens:
+            break
+        parts.append(snippet)
+        used += cost
+    return "Earlier in this conversation the student asked about: " + "; ".join(reversed(parts)) if parts else ""
+
+
+def build_system_prompt(template, chunks, history, query, budget=PROMPT_TOKEN_BUDGET,
+                        history_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Fill `template` ({context} placeholder) within a token budget.
+
+    chunks: retrieved texts, most relevant first.
+    history: (role, text) pairs, oldest first.
+    Recent turns are kept verbatim up to history_budget; anything older is
+    folded into a short summary. Chunks are deduplicated and added in
+    relevance order until the remaining budget is spent.
+    Returns (system_prompt, stats).
+    """
+    base_tokens = count_tokens(template.replace("{context}", "")) + count_tokens(query)
+
+    # Recent history, newest first, until the history budget is used up
+    recent, used = [], 0
+    for role, text in reversed(history):
+        line = f"{'User' if role == 'user' else 'Bot'}: {text}"
+        cost = count_tokens(line)
+        if used + cost > history_budget:
+            break
+        recent.append(line)
+        used += cost
+    recent.reverse()
+    older = history[:len(history) - len(recent)]
+    summary = summarize_turns(older) if older else ""
+
+    history_parts = []
+    if summary:
+        history_parts.append(summary)
+    if recent:
+        history_parts.append("\n".join(recent))
+    history_block = "\n\n".join(history_parts)
+    history_tokens = count_tokens(history_block) if history_block else 0
+
+    # Whatever is left goes to retrieved context
+    context_budget = max(0, budget - base_tokens - history_tokens)
+    unique_chunks = dedupe_chunks(chunks)
+    context_parts, context_tokens = [], 0
+    for text in unique_chunks:
+        cost = count_tokens(text) + 2
+        if context_tokens + cost > context_budget:
+            break
+        context_parts.append(text)
+        context_tokens += cost
+
+    sections = [template.replace("{context}", "\n\n".join(context_parts))]
+    if history_block:
+        sections.append(f"Recent Conversation History:\n{history_block}")
+    prompt = "\n\n".join(sections)
+
+    stats = {
+        "prompt_tokens": base_tokens + history_tokens + context_tokens,
+        "context_tokens": context_tokens,
+        "history_tokens": history_tokens,
+        "chunks_retrieved": len(chunks),
+        "chunks_used": len(context_parts),
+        "chunks_deduped": len(chunks) - len(unique_chunks),
+        "turns_summarized": len(older)
+    }
+    return prompt, stats
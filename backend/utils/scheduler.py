@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.tracing import observe_stage
+
+# Limits for outbound LLM calls (override in .env)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 32))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 15))
+
+# Dedicated pool for CPU-bound embedding and FAISS search work, kept apart from
+# the default executor so blocking sqlite/smtp calls can't starve retrieval.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", min(4, os.cpu_count() or 1)))
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="rag-cpu")
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request can't get an LLM slot; mapped to 429/503 by the API."""
+
+    def __init__(self, status_code, detail, retry_after=5):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+async def run_cpu(func, *args):
+    """Run a CPU-bound callable (embedding, vector search) on the RAG pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, func, *args)
+
+
+async def run_io(func, *args):
+    """Run a blocking I/O callable (sqlite, smtp) on the default thread pool."""
+    return await asyncio.to_thread(func, *args)
+
+
+class LLMScheduler:
+    """
+    Bounds the number of concurrent LLM calls and the number of requests
+    allowed to wait for one. Requests beyond the queue depth are rejected
+    immediately (429); requests that wait longer than queue_timeout get a 503.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+
+    async def acquire(self):
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending, so this can't race the check
+            await self._semaphore.acquire()
+            self.active += 1
+            return
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerOverloaded(429, "Too many students are chatting right now. Please try again in a few seconds.")
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise SchedulerOverloaded(503, "The AI service is busy. Please try again shortly.", retry_after=10)
+        finally:
+            self.waiting -= 1
+            observe_stage("llm_queue", time.perf_counter() - started)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+# memory (single process), sqlite (several workers on one host) or redis (several hosts)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB = os.getenv("SESSION_DB", os.path.join("database", "sessions.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_TIMEOUT = int(os.getenv("SESSION_TIMEOUT", 120))  # seconds of inactivity
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", 40))
+# Cap on conversation text held by the in-memory store
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class _Session:
+    __slots__ = ("history", "last_activity", "nbytes")
+
+    def __init__(self, max_messages):
+        # Ring buffer of (role, text) pairs; the oldest message drops off when full
+        self.history = deque(maxlen=max_messages)
+        self.last_activity = time.time()
+        self.nbytes = 0
+
+
+class MemorySessionStore:
+    """
+    Per-process store; the default for a single uvicorn worker.
+
+    Every backend exposes the same small, Redis-shaped API: a session is a
+    capped list of (role, text) messages with an idle expiry that is
+    refreshed on touch.
+
+    Sessions live in an OrderedDict kept in last-activity order (a touch
+    moves the session to the end), so expiry only ever looks at the oldest
+    entries: cleanup is O(expired sessions), not O(all sessions). Total text
+    held is capped at max_bytes by evicting the least recently active
+    sessions.
+    """
+
+    def __init__(self, timeout=SESSION_TIMEOUT, max_messages=SESSION_MAX_MESSAGES, max_bytes=SESSION_MAX_BYTES):
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()
+        self.nbytes = 0
+        self.expired = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def touch(self, session_id):
+        """Create the session if needed and refresh its expiry."""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = _Session(self.max_messages)
+            else:
+                self.sessions.move_to_end(session_id)
+            session.last_activity = time.time()
+            return session
+
+    def get_history(self, session_id):
+        session = self.sessions.get(session_id)
+        return list(session.history) if session else []
+
+    def append_turn(self, session_id, query, answer):
+        session = self.touch(session_id)
+        with self._lock:
+            for message in (("user", query), ("assistant", answer)):
+                if len(session.history) == session.history.maxlen:
+                    dropped = _message_size(session.history[0])
+                    session.nbytes -= dropped
+                    self.nbytes -= dropped
+                size = _message_size(message)
+                session.history.append(message)
+                session.nbytes += size
+                self.nbytes += size
+
+            # Keep the store under its memory cap, oldest conversations first
+            while self.nbytes > self.max_bytes and len(self.sessions) > 1:
+                sid, oldest = next(iter(self.sessions.items()))
+                if sid == session_id:
+                    break
+                del self.sessions[sid]
+                self.nbytes -= oldest.nbytes
+                self.evicted += 1
+
+    def cleanup_expired(self):
+        """Remove sessions idle for longer than the timeout; returns how many."""
+        cutoff = time.time() - self.timeout
+        removed = 0
+        with self._lock:
+            while self.sessions:
+                sid, session = next(iter(self.sessions.items()))
+                if session.last_activity > cutoff:
+                    break
+                del self.sessions[sid]
+                self.nbytes -= session.nbytes
+                removed += 1
+        self.expired += removed
+        return removed
+
+    def count(self):
+        return len(self.sessions)
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "sessions": len(self.sessions),
+            "history_bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "expired": self.expired,
+            "evicted_for_memory": self.evicted
+        }
+
+
+def _message_size(message):
+    return len(message[0]) + len(message[1].encode("utf-8"))
+
+
+class SQLiteSessionStore:
+    """
+    Sessions in a WAL-mode SQLite file so several uvicorn workers on one
+    host see the same conversations.
+    """
+
+    def __init__(self, path=SESSION_DB, timeout=SESSION_TIMEOUT, max_messages=SESSION_MAX_MESSAGES):
+        self.path = path
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('''CREATE TABLE IF NOT EXISTS sessions
+                        (session_id TEXT PRIMARY KEY,
+                         history TEXT NOT NULL,
+                         last_activity REAL NOT NULL)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_activity ON sessions(last_activity)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def touch(self, session_id):
+        self._conn().execute(
+            '''INSERT INTO sessions (session_id, history, last_activity) VALUES (?, '[]', ?)
+               ON CONFLICT(session_id) DO UPDATE SET last_activity = excluded.last_activity''',
+            (session_id, time.time()))
+
+    def get_history(self, session_id):
+        row = self._conn().execute(
+            "SELECT history FROM sessions WHERE session_id = ? AND last_activity >= ?",
+            (session_id, time.time() - self.timeout)).fetchone()
+        return [tuple(message) for message in json.loads(row[0])] if row else []
+
+    def append_turn(self, session_id, query, answer):
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front so two workers can't interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT history FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            history = json.loads(row[0]) if row else []
+            history.extend([["user", query], ["assistant", answer]])
+            history = history[-self.max_messages:]
+            conn.execute(
+                '''INSERT INTO sessions (session_id, history, last_activity) VALUES (?, ?, ?)
+                   ON CONFLICT(session_id) DO UPDATE SET history = excluded.history,
+                                                         last_activity = excluded.last_activity''',
+                (session_id, json.dumps(history), time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def cleanup_expired(self):
+        cur = self._conn().execute("DELETE FROM sessions WHERE last_activity < ?", (time.time() - self.timeout,))
+        return cur.rowcount
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self):
+        sessions, nbytes = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(history)), 0) FROM sessions").fetchone()
+        return {"backend": "sqlite", "sessions": sessions, "history_bytes": nbytes}
+
+
+class RedisSessionStore:
+    """
+    Sessions as Redis lists of JSON (role, text) pairs with a native TTL;
+    needs the optional `redis` package. A sorted set of session ids scored
+    by expiry time is kept alongside, so counting sessions is a ZCARD
+    instead of a SCAN over the keyspace.
+    """
+
+    ACTIVE_KEY = "sessions:active"
+
+    def __init__(self, url=REDIS_URL, timeout=SESSION_TIMEOUT, max_messages=SESSION_MAX_MESSAGES):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.timeout = timeout
+        self.max_messages = max_messages
+
+    def _key(self, session_id):
+        return f"session:{session_id}"
+
+    def touch(self, session_id):
+        # An empty list can't exist in Redis, so a new session only appears after its first turn
+        pipe = self.client.pipeline()
+        pipe.expire(self._key(session_id), self.timeout)
+        pipe.zadd(self.ACTIVE_KEY, {session_id: time.time() + self.timeout}, xx=True)
+        pipe.execute()
+
+    def get_history(self, session_id):
+        return [tuple(json.loads(message)) for message in self.client.lrange(self._key(session_id), 0, -1)]
+
+    def append_turn(self, session_id, query, answer):
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps(["user", query]), json.dumps(["assistant", answer]))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.timeout)
+        pipe.zadd(self.ACTIVE_KEY, {session_id: time.time() + self.timeout})
+        pipe.execute()
+
+    def cleanup_expired(self):
+        # Redis expires the session keys itself; only the index of active ids needs pruning
+        return self.client.zremrangebyscore(self.ACTIVE_KEY, "-inf", time.time())
+
+    def count(self):
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(self.ACTIVE_KEY, "-inf", time.time())
+        pipe.zcard(self.ACTIVE_KEY)
+        return pipe.execute()[1]
+
+    def stats(self):
+        return {"backend": "redis", "sessions": self.count()}
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    return MemorySessionStore()
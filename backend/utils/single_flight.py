@@ -0,0 +1,81 @@
+import os
+import asyncio
+
+from utils.metrics import registry
+
+# How long a coalesced request waits for the shared answer before computing its own
+CHAT_COALESCE_TIMEOUT = float(os.getenv("CHAT_COALESCE_TIMEOUT", 60))
+
+coalesced_total = registry.counter(
+    "helpdesk_coalesced_requests_total", "Requests served by another request's in-flight computation", ["kind"])
+
+
+class Flight:
+    """One caller's handle on a keyed computation; see SingleFlight.join()."""
+
+    __slots__ = ("group", "key", "future", "leader")
+
+    def __init__(self, group, key, future, leader):
+        self.group = group
+        self.key = key
+        self.future = future
+        self.leader = leader
+
+    async def wait(self):
+        """The leader's result, or None if it failed, gave up or took longer than the timeout."""
+        try:
+            # Shielded: a follower that disconnects must not cancel the shared result
+            result = await asyncio.wait_for(asyncio.shield(self.future), self.group.timeout)
+        except asyncio.TimeoutError:
+            result = None
+        if result is None:
+            self.group.fallbacks += 1
+        return result
+
+    def finish(self, result=None):
+        """Hand the result (None = failed) to every follower. Idempotent."""
+        self.group._finish(self, result)
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers asking for the same key share one computation,
+    like Go's singleflight: the first caller becomes the leader and does
+    the work; callers that arrive while it is in flight wait for its result
+    instead of repeating it. Nothing is kept once the flight lands, so this
+    only merges requests that overlap in time; caching is a separate layer.
+    Event-loop only (not thread-safe).
+    """
+
+    def __init__(self, name, timeout=CHAT_COALESCE_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def join(self, key):
+        future = self._flights.get(key)
+        if future is not None and not future.done():
+            self.coalesced += 1
+            coalesced_total.inc(kind=self.name)
+            return Flight(self, key, future, leader=False)
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.leaders += 1
+        return Flight(self, key, future, leader=True)
+
+    def _finish(self, flight, result):
+        if not flight.future.done():
+            flight.future.set_result(result)
+        if self._flights.get(flight.key) is flight.future:
+            del self._flights[flight.key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "fallbacks": self.fallbacks
+        }
@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+
+# Backoff between retries of failed required stages: doubled per round, capped
+STARTUP_RETRY_BASE = float(os.getenv("STARTUP_RETRY_BASE", 2))
+STARTUP_RETRY_MAX = float(os.getenv("STARTUP_RETRY_MAX", 60))
+
+
+class StartupState:
+    """
+    Tracks the warm-up stages run from the app lifespan so /ready can tell
+    the load balancer when this worker is worth routing traffic to, and so
+    import time and time-to-ready can be reported. Required stages that
+    fail are retried with backoff (retry_failed), and a stage can also be
+    marked recovered from outside, e.g. when another worker publishes an
+    index that loads fine.
+    """
+
+    def __init__(self, process_started):
+        self.process_started = process_started
+        self.import_seconds = None
+        self.time_to_ready = None
+        self.ready = False
+        self.stages = {}   # stage -> {"status": ..., "ms": ...}
+        self.errors = {}
+        self._funcs = {}
+        self._finished = asyncio.Event()
+        self._wakeup = None
+        self._loop = None
+
+    def imported(self):
+        self.import_seconds = time.perf_counter() - self.process_started
+
+    async def run(self, stage, func, required=True):
+        """Await `func()` as a named stage; a failed required stage keeps the worker unready."""
+        attempts = self.stages.get(stage, {}).get("attempts", 0) + 1
+        self.stages[stage] = {"status": "running", "required": required, "attempts": attempts}
+        self._funcs[stage] = func
+        started = time.perf_counter()
+        try:
+            result = await func()
+            self.stages[stage].update(status="done")
+            self.errors.pop(stage, None)
+            return result
+        except Exception as e:
+            self.stages[stage].update(status="failed")
+            self.errors[stage] = str(e)
+            print(f"Startup stage {stage} failed: {e}")
+        finally:
+            self.stages[stage]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def failed_stages(self):
+        return [stage for stage, info in self.stages.items() if info["status"] == "failed" and info["required"]]
+
+    def recover(self, stage):
+        """Mark a failed stage done because its work succeeded elsewhere; safe to call from any thread."""
+        info = self.stages.get(stage)
+        if info is None or info["status"] != "failed":
+            return
+        info.update(status="done", recovered=True)
+        self.errors.pop(stage, None)
+        print(f"Startup stage {stage} recovered")
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def retry_failed(self):
+        """Re-run failed required stages with capped exponential backoff until the worker is ready."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        rounds = 0
+        while not self.ready:
+            delay = min(STARTUP_RETRY_BASE * 2 ** rounds, STARTUP_RETRY_MAX)
+            rounds += 1
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            for stage in self.failed_stages():
+                await self.run(stage, self._funcs[stage])
+            self.mark_ready()
+
+    def mark_ready(self):
+        if self.ready:
+            return True
+        failed = self.failed_stages()
+        self._finished.set()
+        if failed:
+            print(f"Not ready: startup stages failed: {', '.join(failed)}")
+            return False
+        self.ready = True
+        self.time_to_ready = time.perf_counter() - self.process_started
+        stages = ", ".join(f"{stage} {info['ms']:.0f}ms" for stage, info in self.stages.items())
+        print(f"Ready in {self.time_to_ready:.2f}s (import {self.import_seconds:.2f}s; {stages})")
+        return True
+
+    async def wait_ready(self):
+        """Wait for the first startup pass to finish; returns whether the worker became ready."""
+        await self._finished.wait()
+        return self.ready
+
+    def to_dict(self):
+        return {
+            "ready": self.ready,
+            "import_s": round(self.import_seconds, 3) if self.import_seconds is not None else None,
+            "time_to_ready_s": round(self.time_to_ready, 3) if self.time_to_ready is not None else None,
+            "stages": self.stages,
+            "errors": self.errors
+        }
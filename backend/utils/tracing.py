@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+
+from utils.metrics import stage_seconds, request_seconds, llm_tokens
+
+# One JSON line per request with its id, status, total time and per-stage breakdown (off by default)
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")  # empty = stdout
+# Polled endpoints that would drown out the interesting traces
+TRACE_SKIP_PATHS = {p for p in os.getenv("TRACE_SKIP_PATHS", "/metrics,/status").split(",") if p}
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class RequestTrace:
+    __slots__ = ("request_id", "method", "path", "started", "stages", "attrs")
+
+    def __init__(self, request_id, method, path):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.attrs = {}
+
+    def add_stage(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def to_dict(self, status):
+        return {
+            "ts": round(time.time(), 3),
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages_ms": {stage: round(ms, 2) for stage, ms in self.stages.items()},
+            **self.attrs
+        }
+
+
+def observe_stage(stage, seconds):
+    """Record a stage duration in the histogram and in the current request's trace."""
+    stage_seconds.observe(seconds, stage=stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def annotate(**attrs):
+    """Attach extra fields (session id, cache outcome, ...) to the current request's trace line."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def record_llm_usage(response, prompt_tokens_estimate=None, completion_tokens_estimate=0):
+    """
+    Count tokens from a LangChain message's usage_metadata. Providers that
+    don't report usage fall back to the estimates; the prompt estimate
+    defaults to the prompt builder's count annotated on the current trace.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    if prompt_tokens_estimate is None:
+        trace = current_trace.get()
+        prompt_tokens_estimate = trace.attrs.get("prompt_tokens_estimate", 0) if trace is not None else 0
+    prompt_tokens = usage.get("input_tokens", prompt_tokens_estimate)
+    completion_tokens = usage.get("output_tokens", completion_tokens_estimate)
+    llm_tokens.inc(prompt_tokens, kind="prompt")
+    llm_tokens.inc(completion_tokens, kind="completion")
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+class _TraceWriter:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8", buffering=1) if path else sys.stdout
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware that gives every HTTP request a request id (reusing an
+    incoming X-Request-ID), echoes it back, records request latency by route,
+    and writes one structured trace line when the response has been fully
+    sent, which for streaming responses is after the last token.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.writer = _TraceWriter(TRACE_LOG_PATH) if TRACE_LOG else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        trace = RequestTrace(request_id, scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_seconds.observe(time.perf_counter() - trace.started,
+                                    method=scope["method"], route=route, status=str(status))
+            if self.writer is not None and scope["path"] not in TRACE_SKIP_PATHS:
+                try:
+                    self.writer.write(trace.to_dict(status))
+                except Exception as e:
+                    print(f"Trace log error: {e}")
@@ -0,0 +1,157 @@
+import os
+import gzip
+import json
+import time
+import queue
+import shutil
+import logging
+import logging.handlers
+
+from utils.tracing import current_trace
+
+# Opt-in capture of /chat traffic for offline replay (python -m benchmarks.replay)
+TRAFFIC_RECORD = os.getenv("TRAFFIC_RECORD", "0") == "1"
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH", os.path.join("traffic", "chat.ndjson"))
+# Rotate at this size; rotated files are gzipped as chat.ndjson.1.gz, .2.gz, ...
+TRAFFIC_RECORD_MAX_MB = float(os.getenv("TRAFFIC_RECORD_MAX_MB", 50))
+TRAFFIC_RECORD_BACKUPS = int(os.getenv("TRAFFIC_RECORD_BACKUPS", 5))
+# Records waiting for the writer thread; beyond this they are dropped, never waited for
+TRAFFIC_RECORD_QUEUE = int(os.getenv("TRAFFIC_RECORD_QUEUE", 10000))
+
+RECORD_VERSION = 1
+
+
+def _gzip_rotate(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def open_records(path):
+    """Text reader for a recording, gzipped (rotated) or not."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def read_records(paths):
+    """All records from the given recordings, oldest first; unreadable lines are skipped."""
+    records = []
+    for path in paths:
+        with open_records(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "query" in record:
+                    records.append(record)
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+def served_by(attrs):
+    """How a turn was answered, from its trace: intent, exact/semantic/coalesced cache, llm or canned."""
+    if attrs.get("intent"):
+        return "intent"
+    if attrs.get("answer_cache") in ("exact", "semantic", "coalesced"):
+        return attrs["answer_cache"]
+    if "completion_tokens" in attrs:
+        return "llm"
+    # Not-ready / no-documents messages and LLM errors
+    return "canned"
+
+
+class TrafficRecorder:
+    """
+    Append-only log of chat turns: when the request arrived, the session,
+    query and answer, the per-stage timings and token counts from the
+    request's trace, the retrieved chunk ids and how the turn was answered
+    (intent template, answer cache or LLM). One compact JSON line per turn.
+
+    record() only serializes and hands the line to a queue; a writer thread
+    appends it to the file and does the size-based rotation, so the event
+    loop never waits on disk. If the writer falls behind, records are
+    dropped and counted rather than slowing chat down.
+    """
+
+    def __init__(self, path=TRAFFIC_RECORD_PATH, enabled=TRAFFIC_RECORD,
+                 max_mb=TRAFFIC_RECORD_MAX_MB, backups=TRAFFIC_RECORD_BACKUPS):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups
+        self._queue = queue.Queue(maxsize=TRAFFIC_RECORD_QUEUE)
+        self._handler = None
+        self._listener = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the writer thread; started from the app lifespan."""
+        if not self.enabled or self._listener is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True)
+        handler.namer = lambda name: name + ".gz"
+        handler.rotator = _gzip_rotate
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._handler = handler
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+        print(f"Traffic recorder: writing chat turns to {self.path}")
+
+    def stop(self):
+        """Flush queued records and close the file."""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._handler.close()
+        self._listener = self._handler = None
+
+    def record(self, endpoint, session_id, query, answer, error=None, **extra):
+        """Queue one finished chat turn; call from the request so its trace is current."""
+        if self._listener is None:
+            return
+        trace = current_trace.get()
+        attrs = trace.attrs if trace is not None else {}
+        elapsed = time.perf_counter() - trace.started if trace is not None else 0.0
+        entry = {
+            "v": RECORD_VERSION,
+            "ts": round(time.time() - elapsed, 3),
+            "request_id": trace.request_id if trace is not None else None,
+            "endpoint": endpoint,
+            "session_id": session_id,
+            "query": query,
+            "answer": answer,
+            "error": error,
+            "duration_ms": round(elapsed * 1000, 2),
+            "stages_ms": {stage: round(ms, 2) for stage, ms in trace.stages.items()} if trace is not None else {},
+            "served_by": served_by(attrs),
+            "intent": attrs.get("intent"),
+            "chunk_ids": attrs.get("chunk_ids", []),
+            "prompt_tokens": attrs.get("prompt_tokens"),
+            "completion_tokens": attrs.get("completion_tokens"),
+            "index_version": attrs.get("index_version"),
+            **extra
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "path": self.path if self.enabled else None,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "file_bytes": os.path.getsize(self.path) if self.enabled and os.path.exists(self.path) else 0,
+        }
+
+
+traffic_recorder = TrafficRecorder()
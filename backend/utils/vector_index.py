@@ -0,0 +1,359 @@
+import os
+import json
+import math
+import time
+import shutil
+import sqlite3
+import threading
+import uuid
+
+from utils.keyword_index import KeywordIndexWriter, POSTINGS_TABLE
+
+# Index layout under database/faiss_index:
+#   index.faiss  the search index (flat, HNSW or IVF, optionally int8/PQ compressed)
+#   vectors.npy  raw float32 vectors in index order, memory-mapped; used to
+#                rebuild the index and as ground truth for recall checks
+#   chunks.db    SQLite table of chunk id, text and JSON metadata by position,
+#                plus the BM25 keyword postings (utils/keyword_index.py)
+#   Every publish gets a random id, stored in chunks.db's meta table and as
+#   a trailer after the FAISS and numpy data, so a reader can tell when the
+#   three files it opened come from different publishes.
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.db"
+PUBLISH_ID_TAG = b"\0publish_id:"
+PUBLISH_ID_BYTES = 32
+
+# auto | flat | hnsw | ivf
+INDEX_BACKEND = os.getenv("INDEX_BACKEND", "auto")
+# auto | none | int8 | pq
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "auto")
+# auto picks exact search up to INDEX_FLAT_MAX chunks, HNSW + int8 up to
+# INDEX_HNSW_MAX and IVF + PQ beyond that
+INDEX_FLAT_MAX = int(os.getenv("INDEX_FLAT_MAX", 20000))
+INDEX_HNSW_MAX = int(os.getenv("INDEX_HNSW_MAX", 200000))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", 32))
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", 64))
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", 16))
+# Bytes per vector for PQ; must divide the embedding dimension (384 for MiniLM)
+INDEX_PQ_BYTES = int(os.getenv("INDEX_PQ_BYTES", 48))
+INDEX_TRAIN_SIZE = int(os.getenv("INDEX_TRAIN_SIZE", 50000))
+# Compressed indexes fetch k * INDEX_REFINE candidates and re-rank them by
+# exact distance against the mmapped raw vectors (1 = off)
+INDEX_REFINE = int(os.getenv("INDEX_REFINE", 4))
+# PQ codebooks have 256 centroids per sub-quantizer and need this many training vectors
+PQ_MIN_TRAIN = 256 * 39
+BUILD_BLOCK = 65536
+
+
+def ivf_nlist(count):
+    """~4*sqrt(n) inverted lists, with at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39, 65536))
+
+
+def choose_spec(count, dim, backend=INDEX_BACKEND, quantization=INDEX_QUANTIZATION):
+    """FAISS index_factory string for `count` vectors of `dim` dimensions."""
+    if backend == "auto":
+        backend = "flat" if count <= INDEX_FLAT_MAX else "hnsw" if count <= INDEX_HNSW_MAX else "ivf"
+    if quantization == "auto":
+        quantization = {"flat": "none", "hnsw": "int8", "ivf": "pq"}[backend]
+    if quantization == "pq" and (count < PQ_MIN_TRAIN or dim % INDEX_PQ_BYTES):
+        # Too few vectors to train the codebooks (or a dimension PQ can't split); int8 needs far less
+        quantization = "int8"
+
+    codec = {"none": "Flat", "int8": "SQ8", "pq": f"PQ{INDEX_PQ_BYTES}"}[quantization]
+    if backend == "flat":
+        return "Flat" if codec == "Flat" else codec
+    if backend == "hnsw":
+        return f"HNSW{INDEX_HNSW_M}" if codec == "Flat" else f"HNSW{INDEX_HNSW_M},{codec}"
+    if backend == "ivf":
+        return f"IVF{ivf_nlist(count)},{codec}"
+    raise ValueError(f"Unknown INDEX_BACKEND: {backend}")
+
+
+def apply_search_params(index, nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH):
+    import faiss
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    return index
+
+
+def is_compressed(spec):
+    return "SQ" in spec or "PQ" in spec
+
+
+def search(index, vectors, query, k, refine=1):
+    """
+    (distances, positions) of the k nearest neighbours of one query. With
+    refine > 1 (used for compressed specs) k * refine candidates are re-scored with exact squared L2
+    distances from the raw vectors, which recovers most of the recall lost
+    to quantization for a few page-cache reads.
+    """
+    import numpy as np
+    query = np.asarray(query, dtype="float32").reshape(1, -1)
+    if refine <= 1 or vectors is None:
+        distances, positions = index.search(query, k)
+        return distances[0], positions[0]
+    _, candidates = index.search(query, k * refine)
+    candidates = candidates[0][candidates[0] >= 0]
+    order = np.argsort(candidates)  # sorted reads are kinder to the mmap
+    exact = ((np.asarray(vectors[candidates[order]]) - query) ** 2).sum(axis=1)
+    best = np.argsort(exact)[:k]
+    return exact[best], candidates[order][best]
+
+
+def build_index(vectors, spec):
+    """Train (if the spec needs it) on a sample of `vectors` and add them all, a block at a time."""
+    import faiss
+    import numpy as np
+    count, dim = vectors.shape
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = np.sort(np.random.default_rng(0).choice(count, min(count, INDEX_TRAIN_SIZE), replace=False))
+        index.train(np.ascontiguousarray(vectors[sample], dtype="float32"))
+    for start in range(0, count, BUILD_BLOCK):
+        index.add(np.ascontiguousarray(vectors[start:start + BUILD_BLOCK], dtype="float32"))
+    return apply_search_params(index)
+
+
+def _write_publish_id(path, publish_id):
+    # FAISS and numpy read only as far as their own headers say, so trailing bytes are ignored
+    with open(path, "ab") as f:
+        f.write(PUBLISH_ID_TAG + publish_id.encode("ascii"))
+
+
+def read_publish_id(path):
+    """The publish id at the end of an index or vectors file; None for files written before ids existed."""
+    size = len(PUBLISH_ID_TAG) + PUBLISH_ID_BYTES
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < size:
+            return None
+        f.seek(-size, os.SEEK_END)
+        tail = f.read(size)
+    return tail[len(PUBLISH_ID_TAG):].decode("ascii") if tail.startswith(PUBLISH_ID_TAG) else None
+
+
+def _create_chunks_db(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("""
+        CREATE TABLE chunks (
+            pos INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            content TEXT NOT NULL,
+            metadata TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("BEGIN")
+    return conn
+
+
+def publish_index(path, rows, previous=None, drop_ids=(), embedding_dim=None):
+    """
+    Write a new index version into `path`: the chunks of `previous` (a
+    ChunkStore, or None) minus `drop_ids`, followed by `rows` of (id, text,
+    metadata, vector). Existing chunks and vectors are copied a block at a
+    time and the index is rebuilt with the spec chosen for the new size.
+    Files are moved into place with os.replace, so readers that have the
+    old ones open keep their inode; all three carry the publish id, and
+    ChunkStore refuses files from different publishes.
+    Returns the new index's meta dict.
+    """
+    import faiss
+    import numpy as np
+    from numpy.lib.format import open_memmap
+
+    drop_ids = set(drop_ids)
+    publish_id = uuid.uuid4().hex
+    dim = previous.dim if previous is not None else (len(rows[0][3]) if rows else embedding_dim)
+    keep = [] if previous is None else [pos for pos, doc_id in enumerate(previous.ids()) if doc_id not in drop_ids]
+    count = len(keep) + len(rows)
+
+    tmp_dir = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    conn = _create_chunks_db(os.path.join(tmp_dir, CHUNKS_FILE))
+    keywords = KeywordIndexWriter()
+    vectors = open_memmap(os.path.join(tmp_dir, VECTORS_FILE), mode="w+", dtype="float32", shape=(count, dim or 0))
+    position = 0
+    if previous is not None:
+        keep_set = set(keep)
+        for block in previous.iter_rows():
+            kept = [row for row in block if row[0] in keep_set]
+            if not kept:
+                continue
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                             [(position + i, doc_id, content, metadata) for i, (_, doc_id, content, metadata) in enumerate(kept)])
+            for i, row in enumerate(kept):
+                keywords.add(position + i, row[2])
+            vectors[position:position + len(kept)] = previous.vectors[np.array([row[0] for row in kept])]
+            position += len(kept)
+    conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                     [(position + i, doc_id, text, json.dumps(metadata, ensure_ascii=False, default=str))
+                      for i, (doc_id, text, metadata, _) in enumerate(rows)])
+    for i, row in enumerate(rows):
+        keywords.add(position + i, row[1])
+    keywords.write(conn)
+    if rows:
+        vectors[position:] = np.asarray([vector for _, _, _, vector in rows], dtype="float32")
+    vectors.flush()
+
+    spec = choose_spec(count, dim)
+    started = time.perf_counter()
+    index = build_index(vectors, spec) if count else faiss.IndexFlatL2(dim)
+    faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+    meta = {
+        "spec": spec,
+        "count": count,
+        "dim": dim,
+        "build_s": round(time.perf_counter() - started, 3),
+        "built_at": time.time(),
+        "index_bytes": os.path.getsize(os.path.join(tmp_dir, INDEX_FILE)),
+        "keyword_avg_length": keywords.avg_length,
+        "publish_id": publish_id
+    }
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [(key, json.dumps(value)) for key, value in meta.items()])
+    conn.execute("COMMIT")
+    conn.close()
+    del vectors
+    _write_publish_id(os.path.join(tmp_dir, VECTORS_FILE), publish_id)
+    _write_publish_id(os.path.join(tmp_dir, INDEX_FILE), publish_id)
+
+    os.makedirs(path, exist_ok=True)
+    for name in (VECTORS_FILE, CHUNKS_FILE, INDEX_FILE):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(path, name))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"Index published: {count} chunks, {spec}, {meta['index_bytes'] / max(count, 1):.0f} bytes/vector "
+          f"(built in {meta['build_s']:.2f}s)")
+    return meta
+
+
+class ChunkStore:
+    """
+    Read-only view of one published index version: FAISS for search, the
+    chunk texts and metadata in SQLite (opened read-only and mmapped) and
+    the raw vectors as a memory-mapped array. Offers the parts of the
+    LangChain vector store API that retrieval and the catalog use.
+    """
+
+    def __init__(self, path, embeddings, mmap=True):
+        import faiss
+        import numpy as np
+        self.path = path
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(f"file:{os.path.join(path, CHUNKS_FILE)}?mode=ro", uri=True, check_same_thread=False)
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.meta = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta")}
+
+        index_file = os.path.join(path, INDEX_FILE)
+        vectors_file = os.path.join(path, VECTORS_FILE)
+        self.publish_id = self.meta.get("publish_id")
+        # Ids read before and after loading, so a file swapped in between is caught too
+        before = (read_publish_id(index_file), read_publish_id(vectors_file)) if self.publish_id else None
+        index = None
+        if mmap:
+            try:
+                flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+                index = faiss.read_index(index_file, flags)
+            except RuntimeError:
+                # Not every index type can be mapped; read it into memory instead
+                index = None
+        self.index = apply_search_params(index if index is not None else faiss.read_index(index_file))
+        self.vectors = np.load(vectors_file, mmap_mode="r")
+        if self.publish_id:
+            after = (read_publish_id(index_file), read_publish_id(vectors_file))
+            consistent = before == after == (self.publish_id, self.publish_id)
+        else:
+            # Published before ids were written: only the counts can be compared
+            consistent = self.index.ntotal == self.meta["count"] == len(self.vectors)
+        if not consistent:
+            self.conn.close()
+            raise RuntimeError("Index files are mid-update; retry the load")
+        self.dim = self.meta["dim"]
+        self.spec = self.meta["spec"]
+        self.refine = INDEX_REFINE if is_compressed(self.spec) else 1
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, CHUNKS_FILE)) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+    def _document(self, pos, doc_id, content, metadata):
+        from langchain_core.documents import Document
+        return Document(page_content=content, metadata=json.loads(metadata), id=doc_id)
+
+    def fetch(self, positions):
+        """{position: Document} for the given index positions."""
+        if not positions:
+            return {}
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT pos, id, content, metadata FROM chunks WHERE pos IN ({','.join('?' * len(positions))})",
+                positions).fetchall()
+        return {row[0]: self._document(*row) for row in rows}
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        distances, positions = search(self.index, self.vectors, embedding, k, self.refine)
+        hits = [(int(pos), float(distance)) for pos, distance in zip(positions, distances) if pos >= 0]
+        docs = self.fetch([pos for pos, _ in hits])
+        return [(docs[pos], distance) for pos, distance in hits if pos in docs]
+
+    def similarity_search(self, query, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k)]
+
+    def has_keyword_index(self):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                     (POSTINGS_TABLE,)).fetchone() is not None
+
+    def keyword_postings(self, terms):
+        """{term: int32 array of (position, tf, chunk length) rows} for the terms that occur."""
+        import numpy as np
+        terms = list(terms)
+        if not terms:
+            return {}
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT term, postings FROM {POSTINGS_TABLE} WHERE term IN ({','.join('?' * len(terms))})",
+                terms).fetchall()
+        return {term: np.frombuffer(blob, dtype=np.int32).reshape(-1, 3) for term, blob in rows}
+
+    def ids(self):
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT id FROM chunks ORDER BY pos")]
+
+    def iter_rows(self, batch_size=1000):
+        """Blocks of raw (pos, id, content, metadata JSON) rows in index order."""
+        after = -1
+        while True:
+            with self._lock:
+                block = self.conn.execute(
+                    "SELECT pos, id, content, metadata FROM chunks WHERE pos > ? ORDER BY pos LIMIT ?",
+                    (after, batch_size)).fetchall()
+            if not block:
+                return
+            yield block
+            after = block[-1][0]
+
+    def documents(self):
+        for block in self.iter_rows():
+            for row in block:
+                yield self._document(*row)
+
+    def stats(self):
+        return {
+            "spec": self.spec,
+            "count": self.index.ntotal,
+            "dim": self.dim,
+            "publish_id": self.publish_id,
+            "bytes_per_vector": round(self.meta["index_bytes"] / max(self.index.ntotal, 1), 1)
+        }
+
+    def close(self):
+        self.conn.close()
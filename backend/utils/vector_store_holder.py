@@ -0,0 +1,86 @@
+import time
+import threading
+
+
+class IndexSnapshot:
+    """One loaded version of the vector store. Never mutated after creation."""
+
+    def __init__(self, store, version, load_seconds, stamp=None, retriever=None):
+        self.store = store
+        self.version = version
+        self.stamp = stamp
+        # Retrieval helpers built over this exact version (e.g. the keyword index)
+        self.retriever = retriever
+        self.chunk_count = store.index.ntotal if store is not None else 0
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+
+
+class VectorStoreHolder:
+    """
+    Holds the active vector store behind a single reference.
+
+    A rebuilt index is loaded off to the side by reload() and published with
+    one attribute assignment, so requests that already grabbed a snapshot
+    finish on the version they started with and no request ever loads the
+    index from disk itself.
+
+    `stamp` returns a marker that changes whenever a new index is published
+    on disk; reload_if_changed() uses it to pick up indexes built by another
+    worker process.
+    """
+
+    def __init__(self, loader, stamp=None, build_retriever=None):
+        self._loader = loader
+        self._stamp = stamp or (lambda: None)
+        self._build_retriever = build_retriever
+        self._snapshot = IndexSnapshot(None, 0, 0.0)
+        self._reload_lock = threading.Lock()
+        self.loading = False
+
+    @property
+    def current(self):
+        return self._snapshot
+
+    @property
+    def store(self):
+        return self._snapshot.store
+
+    def reload(self):
+        """Load the index from disk and swap it in. Safe to call from any thread."""
+        with self._reload_lock:
+            self.loading = True
+            try:
+                started = time.perf_counter()
+                stamp = self._stamp()
+                store = self._loader()
+                retriever = self._build_retriever(store) if store is not None and self._build_retriever else None
+                snapshot = IndexSnapshot(store, self._snapshot.version + 1, time.perf_counter() - started, stamp, retriever)
+                self._snapshot = snapshot
+            finally:
+                self.loading = False
+        print(f"Vector store v{snapshot.version} active: {snapshot.chunk_count} chunks (loaded in {snapshot.load_seconds:.2f}s)")
+        return snapshot
+
+    def reload_if_changed(self):
+        """Reload when the index on disk differs from the active one; returns True if swapped."""
+        if self.loading or self._stamp() == self._snapshot.stamp:
+            return False
+        self.reload()
+        return True
+
+    def clear(self):
+        with self._reload_lock:
+            self._snapshot = IndexSnapshot(None, self._snapshot.version + 1, 0.0, self._stamp())
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "loaded": snapshot.store is not None,
+            "loading": self.loading,
+            "chunk_count": snapshot.chunk_count,
+            "index": snapshot.store.stats() if snapshot.store is not None else None,
+            "load_seconds": round(snapshot.load_seconds, 3),
+            "loaded_at": snapshot.loaded_at
+        }
@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from collections import deque
+from urllib.parse import urljoin, urldefrag, urlparse
+from urllib.robotparser import RobotFileParser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", 50))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", 2))
+# Upper bounds for the per-request overrides on /trainurl
+CRAWL_PAGE_LIMIT = int(os.getenv("CRAWL_PAGE_LIMIT", 500))
+CRAWL_DEPTH_LIMIT = int(os.getenv("CRAWL_DEPTH_LIMIT", 5))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", 4))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", 15))
+# Larger responses are cut off rather than held in memory
+CRAWL_MAX_BYTES = int(os.getenv("CRAWL_MAX_BYTES", 5 * 1024 * 1024))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "MIET-Helpdesk-Crawler/1.0")
+
+# Links to these are never pages worth indexing, so don't even request them
+SKIP_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".zip",
+                   ".mp4", ".mp3", ".woff", ".woff2", ".pdf", ".doc", ".docx", ".xls", ".xlsx"}
+
+
+def make_session(pool_size=CRAWL_CONCURRENCY):
+    """One keep-alive connection per crawl worker, reused for every page on the site."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = CRAWL_USER_AGENT
+    return session
+
+
+def normalize_url(url):
+    url, _ = urldefrag(url)
+    parsed = urlparse(url)
+    return parsed._replace(netloc=parsed.netloc.lower(), path=parsed.path or "/").geturl()
+
+
+class SiteCrawler:
+    """
+    Breadth-first crawl of one site: follows links on the start URL's host
+    up to max_depth hops and max_pages pages, fetching up to `concurrency`
+    pages at a time over a shared requests.Session. robots.txt rules and its
+    Crawl-delay are obeyed. crawl() yields one Document per HTML page as
+    soon as it is fetched, so pages can be split and embedded while the
+    crawl goes on.
+    """
+
+    def __init__(self, start_url, max_pages=CRAWL_MAX_PAGES, max_depth=CRAWL_MAX_DEPTH,
+                 concurrency=CRAWL_CONCURRENCY, session=None):
+        self.start_url = normalize_url(start_url)
+        self.host = urlparse(self.start_url).netloc
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.session = session or make_session(self.concurrency)
+        self.robots = None
+        self.crawl_delay = 0.0
+        self._next_request_at = 0.0
+        self._delay_lock = threading.Lock()
+
+        self.pages_fetched = 0
+        self.pages_skipped = 0
+        self.errors = 0
+        self.bytes_fetched = 0
+
+    def _load_robots(self):
+        parsed = urlparse(self.start_url)
+        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+        self.robots = RobotFileParser(robots_url)
+        try:
+            response = self.session.get(robots_url, timeout=CRAWL_TIMEOUT)
+            if response.status_code >= 400:
+                # No robots.txt (or an unreadable one) means everything is allowed
+                self.robots.allow_all = response.status_code < 500
+                self.robots.disallow_all = response.status_code >= 500
+            else:
+                self.robots.parse(response.text.splitlines())
+        except Exception as e:
+            print(f"Crawler: could not read {robots_url}: {e}")
+            self.robots.allow_all = True
+        self.crawl_delay = float(self.robots.crawl_delay(CRAWL_USER_AGENT) or 0)
+        if self.crawl_delay:
+            # A polite crawl delay only makes sense one request at a time
+            self.concurrency = 1
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or parsed.netloc != self.host:
+            return False
+        if os.path.splitext(parsed.path)[1].lower() in SKIP_EXTENSIONS:
+            return False
+        return self.robots is None or self.robots.can_fetch(CRAWL_USER_AGENT, url)
+
+    def _wait_for_turn(self):
+        if not self.crawl_delay:
+            return
+        with self._delay_lock:
+            now = time.monotonic()
+            wait_for = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + self.crawl_delay
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+    def fetch(self, url):
+        """
+        GET one page; returns (final url, html), or None for non-HTML
+        responses and for redirects that leave the site or land on a URL
+        the crawl may not fetch.
+        """
+        self._wait_for_turn()
+        with self.session.get(url, timeout=CRAWL_TIMEOUT, stream=True) as response:
+            if response.url != url and not self.allowed(normalize_url(response.url)):
+                return None
+            response.raise_for_status()
+            if "html" not in response.headers.get("Content-Type", "text/html"):
+                return None
+            body = bytearray()
+            for block in response.iter_content(64 * 1024):
+                body.extend(block)
+                if len(body) >= CRAWL_MAX_BYTES:
+                    break
+            self.bytes_fetched += len(body)
+            encoding = response.encoding or response.apparent_encoding or "utf-8"
+            return response.url, bytes(body).decode(encoding, errors="replace")
+
+    def parse(self, url, html):
+        """Page text, title and the absolute links found in it."""
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, "html.parser")
+        links = [normalize_url(urljoin(url, a["href"])) for a in soup.find_all("a", href=True)]
+        for tag in soup(["script", "style", "noscript", "template"]):
+            tag.decompose()
+        title = soup.title.get_text(strip=True) if soup.title else ""
+        return soup.get_text(" ", strip=True), title, links
+
+    def _visit(self, url, depth):
+        fetched = self.fetch(url)
+        if fetched is None:
+            return None
+        final_url, html = fetched
+        text, title, links = self.parse(final_url, html)
+        return final_url, text, title, links if depth < self.max_depth else []
+
+    def crawl(self):
+        from langchain_core.documents import Document
+        self._load_robots()
+        if not self.allowed(self.start_url):
+            raise ValueError(f"robots.txt does not allow crawling {self.start_url}")
+
+        seen = {self.start_url}
+        frontier = deque([(self.start_url, 0)])
+        in_flight = {}
+        scheduled = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="crawler") as executor:
+            try:
+                while frontier or in_flight:
+                    while frontier and len(in_flight) < self.concurrency and scheduled < self.max_pages:
+                        url, depth = frontier.popleft()
+                        in_flight[executor.submit(self._visit, url, depth)] = (url, depth)
+                        scheduled += 1
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url, depth = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            self.errors += 1
+                            print(f"Crawler: failed to fetch {url}: {e}")
+                            continue
+                        if result is None:
+                            self.pages_skipped += 1
+                            continue
+                        final_url, text, title, links = result
+                        seen.add(normalize_url(final_url))
+                        for link in links:
+                            if link not in seen and self.allowed(link):
+                                seen.add(link)
+                                frontier.append((link, depth + 1))
+                        self.pages_fetched += 1
+                        if text:
+                            yield Document(page_content=text,
+                                           metadata={"source": final_url, "title": title, "depth": depth})
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def stats(self):
+        return {
+            "pages_fetched": self.pages_fetched,
+            "pages_skipped": self.pages_skipped,
+            "errors": self.errors,
+            "bytes_fetched": self.bytes_fetched
+        }
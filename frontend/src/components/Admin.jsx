@@ -9,6 +9,8 @@ const Admin = () => {
     const [loading, setLoading] = useState(false);
     const [activeTab, setActiveTab] = useState('file'); // 'file', 'url', or 'submissions'
     const [admissions, setAdmissions] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [analytics, setAnalytics] = useState(null);
     const [systemStats, setSystemStats] = useState({ active_sessions: 0, status: 'checking' });
 
     const fetchStats = async () => {
@@ -26,11 +28,13 @@ const Admin = () => {
         return () => clearInterval(interval);
     }, []);
 
-    const fetchAdmissions = async () => {
+    // /admissions is paginated: pass the returned cursor to append the next page
+    const fetchAdmissions = async (cursor = null) => {
         setLoading(true);
         try {
-            const response = await axios.get('http://localhost:8000/admissions');
-            setAdmissions(response.data);
+            const response = await axios.get('http://localhost:8000/admissions', { params: cursor ? { cursor } : {} });
+            setAdmissions(prev => cursor ? [...prev, ...response.data.items] : response.data.items);
+            setNextCursor(response.data.next_cursor);
         } catch (error) {
             console.error("Error fetching admissions:", error);
             setStatus({ type: 'error', message: 'Failed to fetch admissions.' });
@@ -39,6 +43,37 @@ const Admin = () => {
         }
     };
 
+    // Totals come from the server's summary tables, so the list itself can stay paginated
+    const fetchAnalytics = async () => {
+        try {
+            const response = await axios.get('http://localhost:8000/admissions/analytics', { params: { days: 7 } });
+            setAnalytics(response.data);
+        } catch (error) {
+            console.error("Error fetching admission analytics:", error);
+        }
+    };
+
+    // Ingestion runs as a background job; poll it until it finishes and show live progress
+    const waitForJob = async (jobId) => {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1500));
+            const { data: job } = await axios.get(`http://localhost:8000/ingestion/jobs/${jobId}`);
+            if (job.status === 'completed') {
+                const r = job.result;
+                return `Knowledge Base updated from ${job.source}: ${r.total} data points (${r.added} new, ${r.removed} removed, ${r.reused} unchanged).`;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                throw new Error(job.error || `Job ${job.status}.`);
+            }
+            const p = job.progress;
+            // Pages are parsed and embedded as a stream, so both counters move together
+            const detail = job.stage === 'load' || job.stage === 'embed'
+                ? `${p.pages_parsed || 0}${p.pages_total ? `/${p.pages_total}` : ''} pages parsed, ${p.chunks_embedded || 0} chunks embedded${p.chunks_per_sec ? ` (${p.chunks_per_sec}/s)` : ''}`
+                : job.stage || 'queued';
+            setStatus({ type: 'info', message: `Processing ${job.source}: ${detail}` });
+        }
+    };
+
     const handleFileChange = (e) => {
         setFile(e.target.files[0]);
     };
@@ -59,10 +94,12 @@ const Admin = () => {
             const response = await axios.post('http://localhost:8000/uploadknowledgebase', formData, {
                 headers: { 'Content-Type': 'multipart/form-data' }
             });
-            setStatus({ type: 'success', message: response.data.message });
+            setStatus({ type: 'info', message: response.data.message });
+            const message = await waitForJob(response.data.job_id);
+            setStatus({ type: 'success', message });
             setFile(null);
         } catch (error) {
-            setStatus({ type: 'error', message: error.response?.data?.detail || 'Upload failed.' });
+            setStatus({ type: 'error', message: error.response?.data?.detail || error.message || 'Upload failed.' });
         } finally {
             setLoading(false);
         }
@@ -79,10 +116,12 @@ const Admin = () => {
 
         try {
             const response = await axios.post('http://localhost:8000/trainurl', { url });
-            setStatus({ type: 'success', message: response.data.message });
+            setStatus({ type: 'info', message: response.data.message });
+            const message = await waitForJob(response.data.job_id);
+            setStatus({ type: 'success', message });
             setUrl('');
         } catch (error) {
-            setStatus({ type: 'error', message: error.response?.data?.detail || 'URL training failed.' });
+            setStatus({ type: 'error', message: error.response?.data?.detail || error.message || 'URL training failed.' });
         } finally {
             setLoading(false);
         }
@@ -163,6 +202,7 @@ const Admin = () => {
                     <div style={tabStyle('submissions')} onClick={() => {
                         setActiveTab('submissions');
                         fetchAdmissions();
+                        fetchAnalytics();
                     }}>
                         <Users size={18} /> Submissions
                     </div>
@@ -271,7 +311,7 @@ const Admin = () => {
                         <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '20px' }}>
                             <h3 style={{ margin: 0, fontSize: '1.2rem', color: 'var(--primary)' }}>Recent Applications</h3>
                             <button
-                                onClick={fetchAdmissions}
+                                onClick={() => { fetchAdmissions(); fetchAnalytics(); }}
                                 style={{
                                     padding: '6px 12px',
                                     fontSize: '13px',
@@ -284,6 +324,20 @@ const Admin = () => {
                                 Refresh List
                             </button>
                         </div>
+                        {analytics && (
+                            <div style={{ marginBottom: '20px', padding: '15px', background: '#f9f9f9', borderRadius: '12px', fontSize: '13px', color: '#4a5568' }}>
+                                <div style={{ display: 'flex', justifyContent: 'space-around', textAlign: 'center', marginBottom: '10px' }}>
+                                    <div><strong style={{ fontSize: '1.3rem', color: 'var(--primary)' }}>{analytics.total}</strong><br />Total</div>
+                                    <div><strong style={{ fontSize: '1.3rem', color: 'var(--primary)' }}>{analytics.recent.last_24h}</strong><br />Last 24 hours</div>
+                                    <div><strong style={{ fontSize: '1.3rem', color: 'var(--primary)' }}>{analytics.recent.last_7d}</strong><br />Last 7 days</div>
+                                </div>
+                                {analytics.by_course.length > 0 && (
+                                    <p style={{ margin: 0 }}>
+                                        <strong>Top courses:</strong> {analytics.by_course.slice(0, 5).map(c => `${c.course || 'Unspecified'} (${c.count})`).join(', ')}
+                                    </p>
+                                )}
+                            </div>
+                        )}
                         {loading ? (
                             <p style={{ textAlign: 'center', padding: '40px' }}>Loading submissions...</p>
                         ) : admissions.length === 0 ? (
@@ -331,6 +385,22 @@ const Admin = () => {
                                         </div>
                                     </div>
                                 ))}
+                                {nextCursor && (
+                                    <button
+                                        onClick={() => fetchAdmissions(nextCursor)}
+                                        style={{
+                                            width: '100%',
+                                            padding: '10px',
+                                            fontSize: '13px',
+                                            background: '#f0f0f0',
+                                            border: '1px solid #ddd',
+                                            borderRadius: '8px',
+                                            cursor: 'pointer'
+                                        }}
+                                    >
+                                        Load More
+                                    </button>
+                                )}
                             </div>
                         )}
                     </div>
@@ -46,7 +46,7 @@ const AdmissionForm = () => {
   useEffect(() => {
     const fetchOptions = async () => {
       try {
-        const response = await axios.post('http://localhost:8000/admission-options');
+        const response = await axios.get('http://localhost:8000/admission-options');
         if (response.data && response.data.categories && response.data.courses) {
           setOptions(response.data);
         }
@@ -106,7 +106,7 @@ const AdmissionForm = () => {
     try {
       const response = await axios.post('http://localhost:8000/submit-admission', formData);
       if (response.data.status === 'success') {
-        setEmailStatus(response.data.email_sent);
+        setEmailStatus(response.data.email_queued);
         setSubmitted(true);
         triggerConfetti();
       } else {
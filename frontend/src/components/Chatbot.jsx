@@ -129,28 +129,61 @@ const Chatbot = () => {
     setLoading(true);
 
     try {
-      const response = await axios.post('http://localhost:8000/chat', {
-        query: input,
-        session_id: sessionId
+      // Stream tokens from the backend so the answer appears as it is generated
+      const response = await fetch('http://localhost:8000/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ query: input, session_id: sessionId })
       });
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
 
-      // Simulate a small "thinking" delay for a more human feel
-      setTimeout(() => {
-        const botMessage = { text: response.data.answer, sender: 'bot' };
-        setMessages(prev => [...prev, botMessage]);
-        setLoading(false);
-        // Update activity after bot response to keep session alive during bot thinking
-        localStorage.setItem('chatbot_last_activity', Date.now().toString());
-        startInactivityTimer();
-      }, 500);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      let started = false;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE frames are separated by a blank line
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        for (const frame of frames) {
+          const eventLine = frame.split('\n').find(line => line.startsWith('event: '));
+          const dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const event = eventLine ? eventLine.slice(7) : 'message';
+          const data = JSON.parse(dataLine.slice(6));
+
+          if (event === 'error') throw new Error(data.error);
+          if (event === 'done') {
+            answer = data.answer;
+          } else {
+            answer += data.token;
+          }
+
+          if (!started) {
+            started = true;
+            setLoading(false);
+            setMessages(prev => [...prev, { text: answer, sender: 'bot' }]);
+          } else {
+            setMessages(prev => [...prev.slice(0, -1), { text: answer, sender: 'bot' }]);
+          }
+        }
+      }
+
+      // Update activity after bot response to keep session alive during bot thinking
+      localStorage.setItem('chatbot_last_activity', Date.now().toString());
+      startInactivityTimer();
 
     } catch (error) {
       console.error("Error sending message:", error);
-      setTimeout(() => {
-        const errorMessage = { text: "I'm having a little trouble connecting to my brain! Please check your internet or try again in a moment.", sender: 'bot' };
-        setMessages(prev => [...prev, errorMessage]);
-        setLoading(false);
-      }, 500);
+      const errorMessage = { text: "I'm having a little trouble connecting to my brain! Please check your internet or try again in a moment.", sender: 'bot' };
+      setMessages(prev => [...prev, errorMessage]);
+      setLoading(false);
     }
   };
 